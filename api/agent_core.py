@@ -18,6 +18,7 @@ AgentCore НЕ знает про FastAPI / HTTP. Его задача — раб
 """
 
 from dataclasses import dataclass, field
+from datetime import datetime
 from typing import List, Dict, Any, Optional
 
 import aiosqlite
@@ -35,6 +36,9 @@ class AgentState:
     active_goals: List[str] = field(default_factory=list)
     recent_actions: List[str] = field(default_factory=list)
     memory_summary: str = ""
+    # Свежесть памяти: когда memory_summary обновлялась и сколько ходов с тех пор не учтено
+    memory_updated_at: Optional[str] = None
+    pending_turns: int = 0
 
 
 DEFAULT_PERSONA = (
@@ -68,7 +72,8 @@ class AgentCore:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute(
                 """
-                SELECT persona, active_goals, recent_actions, memory_summary
+                SELECT persona, active_goals, recent_actions, memory_summary,
+                       memory_updated_at, pending_turns
                 FROM agent_state
                 WHERE user_id = ?
                 """,
@@ -94,27 +99,51 @@ class AgentCore:
                 active_goals=_loads(row["active_goals"]),
                 recent_actions=_loads(row["recent_actions"]),
                 memory_summary=row["memory_summary"] or "",
+                memory_updated_at=row["memory_updated_at"],
+                pending_turns=int(row["pending_turns"] or 0),
             )
 
-    async def save_state(self, state: AgentState) -> None:
-        """Сохранить AgentState в БД (upsert по user_id)."""
+    async def save_state(self, state: AgentState, *, defer: bool = False) -> None:
+        """
+        Сохранить AgentState в БД (upsert по user_id).
+
+        defer=True — ход после update_memory_after_turn(defer=True): память
+        принадлежит пакетной задаче, которая могла успеть записать её
+        (save_memory) после load_state этого хода. Поэтому memory_summary и
+        memory_updated_at существующей строки не трогаем, а pending_turns
+        увеличиваем на один ход относительно значения в БД.
+        """
+        if defer:
+            memory_update = """
+                    pending_turns = agent_state.pending_turns + 1
+            """
+        else:
+            memory_update = """
+                    memory_summary = excluded.memory_summary,
+                    memory_updated_at = excluded.memory_updated_at,
+                    pending_turns = excluded.pending_turns
+            """
         async with aiosqlite.connect(self._db_path) as db:
             await db.execute(
                 """
-                INSERT INTO agent_state (user_id, persona, active_goals, recent_actions, memory_summary)
-                VALUES (?, ?, ?, ?, ?)
+                INSERT INTO agent_state (
+                    user_id, persona, active_goals, recent_actions, memory_summary,
+                    memory_updated_at, pending_turns
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?)
                 ON CONFLICT(user_id) DO UPDATE SET
                     persona = excluded.persona,
                     active_goals = excluded.active_goals,
                     recent_actions = excluded.recent_actions,
-                    memory_summary = excluded.memory_summary
-                """,
+                """ + memory_update,
                 (
                     state.user_id,
                     state.persona,
                     json.dumps(state.active_goals, ensure_ascii=False),
                     json.dumps(state.recent_actions[-10:], ensure_ascii=False),
                     state.memory_summary,
+                    state.memory_updated_at,
+                    state.pending_turns,
                 ),
             )
             await db.commit()
@@ -187,17 +216,24 @@ class AgentCore:
         user_message: str,
         assistant_reply: str,
         decision: str,
+        *,
+        defer: bool = False,
     ) -> AgentState:
         """
         Обновляет memory_summary и recent_actions после хода диалога.
 
         LLM вызывается в режиме резюме (1 короткое предложение),
-        на безопасном маленьком промпте.
+        на безопасном маленьком промпте. defer=True — память не трогаем,
+        только отмечаем ход как неучтённый (pending_turns): её обновит
+        пакетная задача (api/services/memory_jobs.py).
         """
         # Обновляем recent_actions (ограничиваем 10 последних)
         summary_action = f"{decision}: '{user_message[:80]}' -> '{assistant_reply[:80]}'"
         state.recent_actions.append(summary_action)
         state.recent_actions = state.recent_actions[-10:]
+        if defer:
+            state.pending_turns += 1
+            return state
 
         # Если AI не настроен — просто сохраняем recent_actions как есть
         try:
@@ -224,11 +260,14 @@ class AgentCore:
             new_memory = await ai_chat(
                 messages,
                 model_hint="summary",
+                purpose="memory",
                 max_tokens=80,
                 temperature=0.2,
             )
             if new_memory:
                 state.memory_summary = new_memory.strip()
+                state.memory_updated_at = datetime.now().isoformat(timespec="seconds")
+                state.pending_turns = 0
         except AiNotConfiguredError:
             # Оставляем прошлую память как есть
             pass
@@ -238,3 +277,52 @@ class AgentCore:
 
         return state
 
+    async def consolidate_memory(self, state: AgentState, transcript: str) -> Optional[str]:
+        """
+        Пакетное обновление памяти: прошлая память + диалог с момента её
+        обновления → новая краткая память (1–2 предложения).
+        Возвращает новый текст или None, если ИИ ничего не вернул.
+        """
+        prompt = """Ты — внутренний модуль памяти ассистента YouHub.
+На входе:
+- предыдущая краткая память агента (1–2 предложения)
+- фрагмент диалога пользователя с ассистентом после её обновления
+
+Задача:
+- верни 1–2 предложения на русском: что стоит помнить про пользователя в долгую;
+- сохрани из прошлой памяти то, что не опровергнуто диалогом;
+- не повторяй детали чата, даты и суммы, только устойчивые предпочтения и паттерны.
+"""
+        new_memory = await ai_chat(
+            [
+                {"role": "system", "content": prompt},
+                {
+                    "role": "user",
+                    "content": f"Предыдущая память: {state.memory_summary or 'нет'}\n"
+                    f"Диалог:\n{transcript}",
+                },
+            ],
+            model_hint="summary",
+            purpose="memory",
+            max_tokens=120,
+            temperature=0.2,
+        )
+        return new_memory.strip() if new_memory else None
+
+    async def save_memory(self, user_id: str, memory_summary: str, consumed_turns: int) -> None:
+        """
+        Записать только память (пакетная задача): ходы, пришедшие во время
+        обработки, остаются в pending_turns, recent_actions не затираются.
+        """
+        async with aiosqlite.connect(self._db_path) as db:
+            await db.execute(
+                """
+                UPDATE agent_state
+                SET memory_summary = ?,
+                    memory_updated_at = ?,
+                    pending_turns = MAX(pending_turns - ?, 0)
+                WHERE user_id = ?
+                """,
+                (memory_summary, datetime.now().isoformat(timespec="seconds"), consumed_turns, user_id),
+            )
+            await db.commit()
@@ -2,10 +2,14 @@
 API для TG Hub — хранение данных на сервере.
 """
 
+import asyncio
 import os
+import time
 from fastapi import Depends, FastAPI, HTTPException, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from dataclasses import dataclass
 from typing import Optional, List
 import aiosqlite
 import json
@@ -15,10 +19,19 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Память чата
-CHAT_HISTORY_LIMIT = 80          # сколько последних сообщений держим "сырыми"
-CHAT_CONTEXT_MESSAGES = 24       # сколько последних сообщений отправляем в ИИ (меньше = быстрее, без старых фактов)
-CHAT_SUMMARY_CHUNK = 40          # сколько старых сообщений сжимаем за один раз
-CHAT_SUMMARY_THRESHOLD = 200     # с какого общего количества начинаем сжатие
+CHAT_HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", "400"))       # сколько сообщений храним "сырыми" (старые доступны через поиск)
+CHAT_CONTEXT_MESSAGES = int(os.getenv("CHAT_CONTEXT_MESSAGES", "12"))  # окно последних сообщений в ИИ; старше — только релевантные (history_search)
+CHAT_REPLY_MAX_TOKENS = 600     # лимит ответа чата (входит в бюджет контекста AI_CONTEXT_TOKENS_CHAT)
+CHAT_SUMMARY_CHUNK = int(os.getenv("CHAT_SUMMARY_CHUNK", "40"))  # сколько несжатых сообщений за окном запускают резюме
+
+# Контекст данных в системном промпте: бюджет токенов на контакты/проекты/операции
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "1500"))
+CHAT_CONTEXT_MAX_CONTACTS = int(os.getenv("CHAT_CONTEXT_MAX_CONTACTS", "15"))
+CHAT_CONTEXT_MAX_PROJECTS = int(os.getenv("CHAT_CONTEXT_MAX_PROJECTS", "8"))
+CHAT_CONTEXT_MAX_OPERATIONS = int(os.getenv("CHAT_CONTEXT_MAX_OPERATIONS", "10"))
+CHAT_CONTEXT_OPERATIONS_POOL = 50  # из скольких последних операций выбираем
+# Колонки проектов в промпте (id модели не нужен)
+PROJECT_PROMPT_COLUMNS = ("title", "status", "deadline", "budget", "revenue_goal", "tasks_total", "tasks_done")
 
 """
 Импортируем AI‑клиент и репозиторий истории чата.
@@ -28,25 +41,69 @@ CHAT_SUMMARY_THRESHOLD = 200     # с какого общего количест
 try:
     from api.services.ai_client import (
         chat as ai_chat,
+        chat_stream as ai_chat_stream,
         is_ai_configured,
+        start_ai_clients,
+        close_ai_clients,
+        admission_stats,
+        context_tokens,
+        provider_health,
+        resolve_model,
         AiNotConfiguredError,
+        AiRateLimitedError,
     )
+    from api.services import (
+        ai_usage,
+        chat_summary,
+        context_selector,
+        history_search,
+        intent_classifier,
+        llm_cache,
+        memory_jobs,
+        prompt_format,
+        tokens,
+    )
+    from api.services.command_parser import parse_user_command, parse_relative_date
     from api.repositories import chat_history as chat_repo
-    from api.agent_core import AgentCore
+    from api.agent_core import AgentCore, AgentState
 except ImportError:  # fallback для запуска из каталога api
     from services.ai_client import (  # type: ignore[no-redef]
         chat as ai_chat,
+        chat_stream as ai_chat_stream,
         is_ai_configured,
+        start_ai_clients,
+        close_ai_clients,
+        admission_stats,
+        context_tokens,
+        provider_health,
+        resolve_model,
         AiNotConfiguredError,
+        AiRateLimitedError,
+    )
+    from services import (  # type: ignore[no-redef]
+        ai_usage,
+        chat_summary,
+        context_selector,
+        history_search,
+        intent_classifier,
+        llm_cache,
+        memory_jobs,
+        prompt_format,
+        tokens,
     )
+    from services.command_parser import parse_user_command, parse_relative_date  # type: ignore[no-redef]
     from repositories import chat_history as chat_repo  # type: ignore[no-redef]
-    from agent_core import AgentCore  # type: ignore[no-redef]
+    from agent_core import AgentCore, AgentState  # type: ignore[no-redef]
 
 try:
     from api.telegram_auth import get_user_id_from_init_data
 except ImportError:
     from telegram_auth import get_user_id_from_init_data  # type: ignore[no-redef]
 
+from telemetry import correlation, llm as llm_metrics, loop_monitor, profiling, slow_queries, sql as sql_metrics, tracing
+from telemetry.asgi import MetricsMiddleware, metrics_response
+from telemetry.metrics import METRICS_ENABLED, REGISTRY, Histogram
+
 app = FastAPI(title="TG Hub API")
 
 app.add_middleware(
@@ -55,13 +112,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Разбивка этапов чата, id профиля и сквозной id запроса читаются из JS (режим отладки Hub)
+    expose_headers=["Server-Timing", "X-Profile-Id", correlation.HEADER],
 )
+# Метрики Prometheus на /metrics (METRICS=0 — выключить): HTTP, SQL, LLM, кэши, этапы чата
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    sql_metrics.install()
+    ai_usage.recorder.listeners.append(llm_metrics.observe_call)
+# Трассировка SQL по запросам (SQL_TRACE=1 — сводка в лог, API_DEBUG=1 — Server-Timing)
+if tracing.SQL_TRACE_ENABLED or tracing.API_DEBUG:
+    sql_metrics.install()
+    sql_metrics.add_listener(tracing.record_query)
+    app.add_middleware(tracing.RequestTraceMiddleware)
 
 DATABASE = "data/hub.db"
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
+# Токен для служебных эндпоинтов /api/admin/*; пустой — эндпоинты выключены
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Если задан — /metrics только с заголовком Authorization: Bearer <METRICS_TOKEN>
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Профиль отдельного запроса: X-Profile: 1 при API_DEBUG=1 или X-Profile: <ADMIN_TOKEN>
+PROFILING_ENABLED = tracing.API_DEBUG or bool(ADMIN_TOKEN)
+if PROFILING_ENABLED:
+    app.add_middleware(profiling.ProfileMiddleware, token=ADMIN_TOKEN, debug=tracing.API_DEBUG)
+# Сквозной id (X-Request-Id от бота или новый) — добавляется последним, то есть снаружи всех
+app.add_middleware(correlation.RequestIdMiddleware)
 
 # Agent Core — единый экземпляр для работы с состоянием агента
 agent_core = AgentCore(DATABASE)
+# Кэш ответов ИИ на запросы извлечения (команда / контакт из фразы)
+extraction_cache = llm_cache.LlmCache(DATABASE)
 
 
 def resolve_user_id(
@@ -76,6 +157,51 @@ def resolve_user_id(
     return str(x_user_id).strip() if x_user_id else "anonymous"
 
 
+def require_admin(x_admin_token: str = Header("", alias="X-Admin-Token")) -> None:
+    """Доступ к служебным эндпоинтам только по ADMIN_TOKEN."""
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+
+
+async def _extract_json_with_ai(
+    kind: str,
+    prompt: str,
+    message: str,
+    *,
+    date_hint: str = "",
+    model_hint: str,
+    purpose: str,
+    max_tokens: int,
+) -> dict:
+    """
+    Запрос извлечения к ИИ с ответом в JSON; повторяющиеся фразы берутся из кэша.
+
+    В кэш попадает только ответ, который разобрался как JSON.
+    """
+    key = llm_cache.make_key(kind, resolve_model(model_hint), prompt, message, date_hint)
+    raw = await extraction_cache.get(key)
+    cached = raw is not None
+    if not cached:
+        response = await ai_chat(
+            [{"role": "user", "content": prompt + date_hint + message}],
+            model_hint=model_hint,
+            purpose=purpose,
+            max_tokens=max_tokens,
+            temperature=0.1,
+        )
+        # Убрать возможную обёртку в ```json
+        raw = response.strip()
+        if raw.startswith("```"):
+            raw = re.sub(r"^```\w*\n?", "", raw)
+            raw = re.sub(r"\n?```\s*$", "", raw)
+    data = json.loads(raw)
+    if not isinstance(data, dict):
+        raise ValueError(f"{kind}: JSON is not an object")
+    if not cached:
+        await extraction_cache.put(key, kind, raw)
+    return data
+
+
 async def extract_person_with_ai(text: str):
     """
     Извлекает данные контакта из произвольной фразы через ИИ.
@@ -96,18 +222,14 @@ async def extract_person_with_ai(text: str):
 Строка пользователя:
 """
     try:
-        response = await ai_chat(
-            [{"role": "user", "content": prompt + text.strip()}],
+        data = await _extract_json_with_ai(
+            "person",
+            prompt,
+            text.strip(),
             model_hint="chat",
+            purpose="person",
             max_tokens=300,
-            temperature=0.1,
         )
-        # Убрать возможную обёртку в ```json
-        raw = response.strip()
-        if raw.startswith("```"):
-            raw = re.sub(r"^```\w*\n?", "", raw)
-            raw = re.sub(r"\n?```\s*$", "", raw)
-        data = json.loads(raw)
         if not isinstance(data.get("fio"), str) or not data["fio"].strip():
             return None
         # Нормализуем ключи и пустые значения
@@ -127,8 +249,13 @@ async def extract_command_with_ai(message: str):
     """
     Понимает намерение по сырому тексту и возвращает команду для execute_ai_action,
     либо None (вопрос, болтовня, неясно). Используется когда parse_user_command не сработал.
+
+    Если локальный классификатор уверен, что команды нет, — ИИ не вызываем.
     """
     import re as _re
+    if intent_classifier.should_skip_extraction(message):
+        logger.debug("extract_command_with_ai skipped by intent classifier")
+        return None
     prompt = """Определи намерение пользователя по сообщению. Варианты:
 - task — добавить задачу (нужны: title; опционально deadline в YYYY-MM-DD)
 - done_task — отметить задачу выполненной (нужны: title — часть названия задачи). Фразы: "выполнил X", "сделал X", "готово X", "закрыл X"
@@ -152,19 +279,18 @@ async def extract_command_with_ai(message: str):
 """
     try:
         today_iso = datetime.now().date().isoformat()
-        date_hint = f"Сегодня {today_iso}. «завтра»=след. день, «понедельник»=ближайший Пн.\n\n"
-        response = await ai_chat(
-            [{"role": "user", "content": prompt + date_hint + "Сообщение пользователя:\n" + message.strip()[:500]}],
+        date_hint = f"Сегодня {today_iso}. «завтра»=след. день, «понедельник»=ближайший Пн.\n\nСообщение пользователя:\n"
+        data = await _extract_json_with_ai(
+            "command",
+            prompt,
+            message.strip()[:500],
+            date_hint=date_hint,
             model_hint="extract",
+            purpose="extract",
             max_tokens=250,
-            temperature=0.1,
         )
-        raw = response.strip()
-        if raw.startswith("```"):
-            raw = _re.sub(r"^```\w*\n?", "", raw)
-            raw = _re.sub(r"\n?```\s*$", "", raw)
-        data = json.loads(raw)
         intent = (data.get("intent") or "none").strip().lower()
+        await intent_classifier.log_extraction(message.strip()[:500], intent)
         if intent == "none":
             return None
 
@@ -515,10 +641,13 @@ async def init_db():
                 user_id TEXT NOT NULL,
                 role TEXT NOT NULL,
                 content TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                tokens INTEGER
             )
         """)
         await db.execute("CREATE INDEX IF NOT EXISTS idx_chat_user ON chat_history(user_id, created_at DESC)")
+        # Инкрементальная дочитка истории в индекс поиска (id > последнего)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_chat_user_id ON chat_history(user_id, id)")
 
         # Состояние агента (AgentState v1)
         await db.execute("""
@@ -531,6 +660,61 @@ async def init_db():
             )
         """)
 
+        # Кэш ответов ИИ на запросы извлечения (api/services/llm_cache.py)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                hits INTEGER DEFAULT 0
+            )
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_created ON llm_cache(created_at)")
+
+        # Учёт вызовов LLM: токены, задержка, исход (api/services/ai_usage.py)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS ai_calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                user_id TEXT,
+                model_hint TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                usage_estimated INTEGER DEFAULT 0,
+                latency_ms REAL NOT NULL,
+                queue_ms REAL NOT NULL,
+                outcome TEXT NOT NULL,
+                stream INTEGER DEFAULT 0
+            )
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_ai_calls_ts ON ai_calls(ts)")
+
+        # Миграция: вид вызова LLM отдельно от назначения модели (api/services/ai_usage.py)
+        try:
+            await db.execute("ALTER TABLE ai_calls ADD COLUMN purpose TEXT")
+        except Exception as e:
+            msg = str(e).lower()
+            if "duplicate column name" not in msg:
+                print(f"[DB MIGRATION] ai_calls.purpose failed: {e}")
+        await db.execute("UPDATE ai_calls SET purpose = model_hint WHERE purpose IS NULL")
+
+        # Резюме истории чата: по строке на уровень ('recent', 'long'), см. api/services/chat_summary.py
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS chat_summary (
+                user_id TEXT NOT NULL,
+                level TEXT NOT NULL,
+                content TEXT NOT NULL DEFAULT '',
+                watermark_id INTEGER NOT NULL DEFAULT 0,
+                pending INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, level)
+            )
+        """)
+
         # Оплата Stars — доступ к YouHub
         await db.execute("""
             CREATE TABLE IF NOT EXISTS paid_users (
@@ -555,13 +739,72 @@ async def init_db():
             msg = str(e).lower()
             if "duplicate column name" not in msg:
                 print(f"[DB MIGRATION] tasks.project_id failed: {e}")
+
+        # Миграция: свежесть памяти агента (пакетная обработка, api/services/memory_jobs.py)
+        for column, ddl in (
+            ("memory_updated_at", "ALTER TABLE agent_state ADD COLUMN memory_updated_at TEXT"),
+            ("pending_turns", "ALTER TABLE agent_state ADD COLUMN pending_turns INTEGER DEFAULT 0"),
+        ):
+            try:
+                await db.execute(ddl)
+            except Exception as e:
+                msg = str(e).lower()
+                if "duplicate column name" not in msg:
+                    print(f"[DB MIGRATION] agent_state.{column} failed: {e}")
+
+        # Миграция: оценка токенов сообщения (считается при записи, см. api/services/tokens.py)
+        try:
+            await db.execute("ALTER TABLE chat_history ADD COLUMN tokens INTEGER")
+        except Exception as e:
+            msg = str(e).lower()
+            if "duplicate column name" not in msg:
+                print(f"[DB MIGRATION] chat_history.tokens failed: {e}")
+        await db.execute(
+            "UPDATE chat_history SET tokens = (LENGTH(content) + ? - 1) / ? WHERE tokens IS NULL",
+            (tokens.CHARS_PER_TOKEN, tokens.CHARS_PER_TOKEN),
+        )
+
+        # Миграция: сквозной id запроса у вызовов LLM (telemetry/correlation.py)
+        try:
+            await db.execute("ALTER TABLE ai_calls ADD COLUMN request_id TEXT")
+        except Exception as e:
+            msg = str(e).lower()
+            if "duplicate column name" not in msg:
+                print(f"[DB MIGRATION] ai_calls.request_id failed: {e}")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_ai_calls_request ON ai_calls(request_id)")
         
         await db.commit()
 
 
 @app.on_event("startup")
 async def startup():
+    # Журнал медленных запросов (SLOW_QUERY_MS, 0 — выключен) с планами EXPLAIN
+    slow_queries.install("api")
+    if PROFILING_ENABLED:
+        profiling.install_task_factory()
+    # Задержка event loop и стеки блокирующих вызовов (LOOP_MONITOR=0 — выключить)
+    app.state.loop_monitor = loop_monitor.start()
     await init_db()
+    # Пулы соединений к LLM-провайдерам живут всё время работы API
+    await start_ai_clients()
+    app.state.ai_usage_flush = asyncio.create_task(ai_usage.recorder.run_periodic_flush(DATABASE))
+    # Пакетная обработка памяти в непиковые часы (MEMORY_BATCH=1)
+    app.state.memory_scheduler = (
+        memory_jobs.start_scheduler(memory_job) if memory_jobs.MEMORY_BATCH_ENABLED else None
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if app.state.loop_monitor is not None:
+        app.state.loop_monitor.stop()
+    if app.state.memory_scheduler is not None:
+        app.state.memory_scheduler.shutdown(wait=False)
+    await chat_summarizer.drain()
+    await sql_metrics.drain_slow_hooks()
+    app.state.ai_usage_flush.cancel()
+    await ai_usage.recorder.flush(DATABASE)
+    await close_ai_clients()
 
 
 @app.get("/api/health")
@@ -624,6 +867,23 @@ def _strip_folder_prefix(title: str) -> str:
     return m.group(1).strip() if m else title.strip()
 
 
+def _dedupe_tasks(lst):
+    """Дедупликация по (title, deadline) — убираем дубли из БД/повторов (контекст чата)."""
+    seen = set()
+    out = []
+    for x in lst:
+        key = (x.get("title") or "", x.get("deadline") or "")
+        if key not in seen:
+            seen.add(key)
+            out.append(x)
+    return out
+
+
+def _strip_tasks(lst):
+    """Для промпта убираем служебный флаг и префикс [Папка], оставляем только нужные поля."""
+    return [{"title": _strip_folder_prefix(x.get("title") or ""), "deadline": x.get("deadline"), "priority": x.get("priority")} for x in lst]
+
+
 @app.post("/api/tasks")
 async def create_task(task: Task, x_user_id: str = Depends(resolve_user_id)):
     try:
@@ -1458,557 +1718,9 @@ import logging
 from datetime import datetime, timedelta
 
 logging.basicConfig(level=logging.INFO)
+correlation.install_logging()
 logger = logging.getLogger(__name__)
 
-def _extract_birth_date_from_text(text: str):
-    """Извлекает дату рождения (DD.MM.YYYY или «дата рождения DD.MM.YYYY») из текста. Возвращает (дата в YYYY-MM-DD или None, текст без даты)."""
-    text = text.strip()
-    # «дата рождения 04.06.1996» или просто «04.06.1996»
-    match = re.search(r'(?:дата\s+рождения\s+)?(\d{1,2}\.\d{1,2}\.\d{4})', text, re.IGNORECASE)
-    if not match:
-        return None, text
-    try:
-        d, m, y = match.group(1).split('.')
-        date_iso = f"{y}-{m.zfill(2)}-{d.zfill(2)}"
-    except Exception:
-        return None, text
-    rest = (text[:match.start()] + text[match.end():]).strip()
-    rest = re.sub(r'\s+', ' ', rest).strip()
-    return date_iso, rest
-
-
-def _parse_person_roles_strengths_weaknesses(rest: str):
-    """Парсит строку после ФИО: роли, сильные и слабые стороны. Возвращает dict с relation, strengths, weaknesses."""
-    roles = [
-        'мама', 'папа', 'отец', 'мать', 'брат', 'сестра', 'муж', 'жена', 'супруг', 'супруга', 'сын', 'дочь',
-        'дядя', 'тётя', 'тетя', 'дед', 'бабушка', 'друг', 'подруга', 'коллега',
-        'партнер', 'партнёр', 'партнер по бизнесу', 'партнёр по бизнесу',
-        'бизнес партнер', 'бизнес-партнер', 'компаньон', 'сооснователь', 'совладелец',
-        'начальник', 'директор', 'менеджер', 'клиент',
-        'заказчик', 'поставщик', 'инвестор', 'сосед', 'знакомый'
-    ]
-    weaknesses_words = [
-        'забывчивый', 'забывчива', 'вспыльчивый', 'вспыльчива',
-        'ленивый', 'ленива', 'жадный', 'жадная', 'нервный', 'нервная',
-        'непунктуальный', 'непунктуальна', 'необязательный', 'необязательна'
-    ]
-    data = {}
-    if not rest:
-        return data
-    if ',' in rest or ';' in rest:
-        parts = [p.strip() for p in re.split(r'[,;]', rest) if p.strip()]
-    else:
-        parts = rest.split()
-    found_roles = []
-    strengths = []
-    weaknesses = []
-    for part in parts:
-        wl = part.lower()
-        if wl in roles or any(w in wl for w in ['партнер', 'бизнес', 'работ']):
-            found_roles.append(part)
-        elif wl in weaknesses_words:
-            weaknesses.append(part)
-        else:
-            strengths.append(part)
-    if found_roles:
-        data['relation'] = ', '.join(found_roles)
-    if strengths:
-        data['strengths'] = ', '.join(strengths)
-    if weaknesses:
-        data['weaknesses'] = ', '.join(weaknesses)
-    return data
-
-
-def parse_user_command(message: str, user_id: str):
-    """Парсит команды пользователя напрямую, без ИИ."""
-    # Очищаем от лишнего шума: эмодзи, повторяющихся пробелов
-    # Оригинал используем для логирования при необходимости
-    msg_lower = message.lower().strip()
-    # Убираем простые эмодзи и лишние символы, чтобы не попадали в заголовки задач
-    msg_lower = re.sub(r'[^\w\s\.\,\-\:\;\!\?ёа-я0-9]', ' ', msg_lower)
-    msg_lower = re.sub(r'\s+', ' ', msg_lower).strip()
-    logger.info(f"Parsing message: {msg_lower}")
-
-    # Если это явно вопрос (есть "?") и нет сильных командных слов — ничего не делаем
-    if "?" in msg_lower:
-        strong_prefixes = (
-            "создай задачу", "добавь задачу",
-            "создай контакт", "добавь контакт",
-            "создай карточку", "добавь карточку", "добавь человека",
-        )
-        if not msg_lower.startswith(strong_prefixes):
-            return None
-    
-    # Создать задачу
-    create_patterns = [
-        r'создай задачу[:\s]+(.+)',
-        r'добавь задачу[:\s]+(.+)',
-        r'напомни[:\s]*[,:]?\s*(.+)',
-        r'задача[:\s]+(.+)',
-        r'нужно\s+(.+)',
-        r'надо\s+(.+)',
-        r'не забыть\s+(.+)',
-        r'купить\s+(.+)',
-        # Глаголы-инфинитивы в начале (позвонить, сделать, разобраться...)
-        r'^((?:по)?звонить\s+.+)',
-        r'^(сделать\s+.+)',
-        r'^(разобраться\s+.+)',
-        r'^(написать\s+.+)',
-        r'^(отправить\s+.+)',
-        r'^(проверить\s+.+)',
-        r'^(подготовить\s+.+)',
-        r'^(встретиться\s+.+)',
-        r'^(забрать\s+.+)',
-        r'^(оплатить\s+.+)',
-        r'^(заказать\s+.+)',
-        r'^(записаться\s+.+)',
-    ]
-    
-    soft_patterns = {
-        r'нужно\s+(.+)',
-        r'надо\s+(.+)',
-        r'не забыть\s+(.+)',
-    }
-    ambiguous_verbs = [
-        'подумать', 'поразмышлять', 'обсудить', 'обговорить',
-        'поговорить', 'узнать', 'поискать', 'почитать'
-    ]
-
-    for pattern in create_patterns:
-        match = re.search(pattern, msg_lower)
-        if match:
-            logger.info(f"Pattern matched: {pattern} -> {match.group(1)}")
-            title = match.group(1).strip()
-            
-            # Защита от нескольких задач в одном сообщении:
-            # считаем количество глаголов-действий. Если больше 1 — просим разбить.
-            multi_verbs = [
-                'купить', 'позвонить', 'написать', 'сделать', 'проверить',
-                'отправить', 'подготовить', 'встретиться', 'забрать',
-                'оплатить', 'заказать', 'разобраться', 'записаться'
-            ]
-            verb_count = 0
-            for v in multi_verbs:
-                if re.search(rf'\b{v}\b', msg_lower):
-                    verb_count += 1
-            if verb_count > 1:
-                logger.info(f"Detected multiple actions in one message (verbs={verb_count}), asking user to split")
-                return {
-                    "action": "ask_split_tasks"
-                }
-            
-            # Ищем дату в формате DD.MM или DD.MM.YYYY
-            date_match = re.search(r'(\d{1,2})\.(\d{1,2})(?:\.(\d{4}))?', title)
-            deadline = None
-            
-            if date_match:
-                day = int(date_match.group(1))
-                month = int(date_match.group(2))
-                year = int(date_match.group(3)) if date_match.group(3) else datetime.now().year
-                try:
-                    deadline = datetime(year, month, day).date().isoformat()
-                    # Убираем дату из названия
-                    title = re.sub(r'\s*\d{1,2}\.\d{1,2}(?:\.\d{4})?\s*', ' ', title).strip()
-                except ValueError:
-                    pass
-            
-            # Если дата не найдена - проверяем слова
-            if not deadline:
-                if 'завтра' in msg_lower or 'на завтра' in msg_lower:
-                    deadline = (datetime.now().date() + timedelta(days=1)).isoformat()
-                elif 'послезавтра' in msg_lower:
-                    deadline = (datetime.now().date() + timedelta(days=2)).isoformat()
-                else:
-                    # Проверяем дни недели
-                    weekdays = {
-                        'понедельник': 0, 'пн': 0,
-                        'вторник': 1, 'вт': 1,
-                        'среда': 2, 'среду': 2, 'ср': 2,
-                        'четверг': 3, 'чт': 3,
-                        'пятница': 4, 'пятницу': 4, 'пт': 4,
-                        'суббота': 5, 'субботу': 5, 'сб': 5,
-                        'воскресенье': 6, 'воскресение': 6, 'вс': 6,
-                    }
-                    
-                    found_weekday = None
-                    found_day_name = None
-                    for day_name, day_num in weekdays.items():
-                        if day_name in msg_lower:
-                            found_weekday = day_num
-                            found_day_name = day_name
-                            break
-                    
-                    if found_weekday is not None:
-                        today = datetime.now().date()
-                        current_weekday = today.weekday()
-                        days_ahead = found_weekday - current_weekday
-                        if days_ahead <= 0:  # Если день уже прошёл или сегодня - следующая неделя
-                            days_ahead += 7
-                        deadline = (today + timedelta(days=days_ahead)).isoformat()
-                        # Убираем день недели из названия
-                        title = re.sub(rf'\s*(на\s+|в\s+)?{found_day_name}\s*', ' ', title, flags=re.IGNORECASE).strip()
-                    else:
-                        # По умолчанию - сегодня
-                        deadline = datetime.now().date().isoformat()
-            
-            # Убираем слова про дату и служебные слова из названия
-            title_clean = re.sub(
-                r'\b(на завтра|на сегодня|на послезавтра|завтра|сегодня|срочно|важно|пожалуйста|плиз|плииз)\b',
-                ' ',
-                title,
-                flags=re.IGNORECASE,
-            ).strip()
-            # Если после чистки заголовок слишком длинный — обрежем
-            if len(title_clean) > 120:
-                title_clean = title_clean[:117].rstrip() + '...'
-
-            # Если фраза мягкая (нужно/надо/не забыть) и содержит "размытые" глаголы — сначала уточняем
-            if pattern in soft_patterns:
-                tl = title_clean.lower() or title.lower()
-                if any(v in tl for v in ambiguous_verbs):
-                    logger.info(f"Ambiguous soft task phrase, asking for confirmation: {tl}")
-                    return {
-                        "action": "ask_task_confirmation",
-                        "title": title_clean.capitalize() if title_clean else title.capitalize(),
-                    }
-            
-            priority = "medium"
-            if 'срочно' in msg_lower or 'важно' in msg_lower:
-                priority = "high"
-            
-            return {
-                "action": "create_task",
-                "title": title_clean.capitalize() if title_clean else title.capitalize(),
-                "deadline": deadline,
-                "priority": priority
-            }
-    
-    # Отметить выполненной
-    done_patterns = [
-        r'выполн(?:ено|ил|ена)[:\s]+(.+)',
-        r'сделан[оа]?[:\s]+(.+)',
-        r'готово[:\s]+(.+)',
-        r'закрой задачу[:\s]+(.+)',
-    ]
-    
-    for pattern in done_patterns:
-        match = re.search(pattern, msg_lower)
-        if match:
-            return {
-                "action": "complete_task",
-                "title": match.group(1).strip()
-            }
-    
-    # --- Сначала финансы и цели, чтобы "добавь цель ..." не матчилось как контакт ---
-    # Расход
-    expense_patterns = [
-        r'(?:добавь\s+)?расход\s+([\d\s]+(?:[.,]\d+)?)\s+(?:на\s+)?(.+)',
-        r'потратил[а]?\s+([\d\s]+(?:[.,]\d+)?)\s+(?:на\s+)?(.+)',
-        r'трата\s+([\d\s]+(?:[.,]\d+)?)\s+(?:на\s+)?(.+)',
-    ]
-    for pattern in expense_patterns:
-        m = re.search(pattern, msg_lower)
-        if m:
-            amount_str = m.group(1).replace(',', '.').replace(' ', '').strip()
-            rest = m.group(2).strip()
-            try:
-                amount = float(amount_str)
-            except ValueError:
-                continue
-            if amount <= 0:
-                continue
-            category = rest
-            for suffix in [' сегодня', ' завтра', ' послезавтра']:
-                if category.endswith(suffix):
-                    category = category[:-len(suffix)].strip()
-            date_match = re.search(r'\s+(\d{1,2})\.(\d{1,2})(?:\.(\d{4}))?$', category)
-            if date_match:
-                category = re.sub(r'\s+\d{1,2}\.\d{1,2}(?:\.\d{4})?\s*$', '', category).strip()
-            if not category or len(category) > 100:
-                category = "Прочее"
-            tx_date = datetime.now().date().isoformat()
-            if 'завтра' in rest:
-                tx_date = (datetime.now().date() + timedelta(days=1)).isoformat()
-            elif 'послезавтра' in rest:
-                tx_date = (datetime.now().date() + timedelta(days=2)).isoformat()
-            elif date_match:
-                try:
-                    day, month = int(date_match.group(1)), int(date_match.group(2))
-                    year = int(date_match.group(3)) if date_match.group(3) else datetime.now().year
-                    tx_date = datetime(year, month, day).date().isoformat()
-                except (ValueError, IndexError):
-                    pass
-            return {"action": "add_finance_transaction", "type": "expense", "amount": amount, "category": category, "date": tx_date}
-    
-    # Доход
-    income_patterns = [
-        r'(?:добавь\s+)?доход\s+([\d\s]+(?:[.,]\d+)?)\s*(.*)',
-        r'получил[а]?\s+([\d\s]+(?:[.,]\d+)?)\s*(.*)',
-    ]
-    for pattern in income_patterns:
-        m = re.search(pattern, msg_lower)
-        if m:
-            amount_str = m.group(1).replace(',', '.').replace(' ', '').strip()
-            rest = (m.group(2) if m.lastindex >= 2 else "").strip()
-            try:
-                amount = float(amount_str)
-            except ValueError:
-                continue
-            if amount <= 0:
-                continue
-            category = rest if rest and len(rest) <= 100 else "Доход"
-            tx_date = datetime.now().date().isoformat()
-            return {"action": "add_finance_transaction", "type": "income", "amount": amount, "category": category, "date": tx_date}
-    
-    # Цель (финансовая)
-    goal_patterns = [
-        r'создай\s+(?:финансовую\s+)?цель\s+(.+?)\s+([\d\s]+(?:[.,]\d+)?)\s*$',
-        r'добавь\s+цель\s+(.+?)\s+([\d\s]+(?:[.,]\d+)?)\s*$',
-    ]
-    for pattern in goal_patterns:
-        m = re.search(pattern, msg_lower)
-        if m:
-            title = m.group(1).strip()
-            amount_str = m.group(2).replace(',', '.').replace(' ', '').strip()
-            if not title or len(title) > 200:
-                continue
-            try:
-                target = float(amount_str)
-            except ValueError:
-                continue
-            if target <= 0:
-                continue
-            return {"action": "add_finance_goal", "title": title[:200], "target_amount": target}
-    
-    # Создать проект
-    project_create_patterns = [
-        r'создай\s+проект\s+(.+)',
-        r'новый\s+проект\s+(.+)',
-        r'добавь\s+проект\s+(.+)',
-    ]
-    for pattern in project_create_patterns:
-        m = re.search(pattern, msg_lower)
-        if m:
-            title = m.group(1).strip()
-            if title and len(title) <= 200:
-                return {"action": "create_project", "title": title}
-    
-    # Записать в проект (заметка)
-    project_note_patterns = [
-        r'запиши\s+в\s+проект\s+(.+?):\s*(.+)',
-        r'добавь\s+в\s+проект\s+(.+?):\s*(.+)',
-        r'заметка\s+в\s+проект\s+(.+?):\s*(.+)',
-    ]
-    for pattern in project_note_patterns:
-        m = re.search(pattern, msg_lower)
-        if m:
-            project_name = m.group(1).strip()
-            text = m.group(2).strip()
-            if project_name and text:
-                return {"action": "add_project_note", "project": project_name, "text": text}
-    
-    # Создать контакт/карточку (явные фразы)
-    person_patterns = [
-        r'создай карточку[:\s]+(.+)',
-        r'создай контакт[:\s]+(.+)',
-        r'добавь контакт[:\s]+(.+)',
-        r'добавь человека[:\s]+(.+)',
-        r'добавь карточку[:\s]+(.+)',
-        r'новый контакт[:\s]+(.+)',
-        r'запиши контакт[:\s]+(.+)',
-        r'карточка[:\s]+(.+)',
-    ]
-    
-    # Проверяем, похоже ли на ФИО с датой рождения (2–4 слова: Фамилия Имя Отчество)
-    # "добавь иванов иван иванович 01.01.1990 ..."
-    fio_pattern = r'добавь\s+([а-яё]+\s+[а-яё]+(?:\s+[а-яё]+){0,2})\s+(\d{1,2}\.\d{1,2}\.\d{4})\s*(.*)'
-    fio_match = re.search(fio_pattern, msg_lower)
-    if fio_match:
-        fio = fio_match.group(1).strip()
-        birth_str = fio_match.group(2)
-        rest = fio_match.group(3).strip()
-        
-        # Конвертируем дату
-        try:
-            d, m, y = birth_str.split('.')
-            birth_date = f"{y}-{m.zfill(2)}-{d.zfill(2)}"
-        except Exception:
-            birth_date = None
-        
-        data = {}
-        if birth_date:
-            data['birth_date'] = birth_date
-        if rest:
-            data.update(_parse_person_roles_strengths_weaknesses(rest))
-        logger.info(f"FIO pattern with date: {fio}, birth: {birth_date}, data: {data}")
-        
-        return {
-            "action": "create_person",
-            "fio": fio.title(),
-            **data
-        }
-    
-    # ФИО без даты (2–4 слова + роль/характеристики)
-    # Только если в rest есть запятая (ФИО, роль, черты) или известное слово-роль — иначе "добавь цель отпуск 200000" попадёт сюда
-    fio_no_date = r'добавь\s+([а-яё]+\s+[а-яё]+(?:\s+[а-яё]+){0,2})\s+(.+)'
-    fio_match2 = re.search(fio_no_date, msg_lower)
-    if fio_match2:
-        fio = fio_match2.group(1).strip()
-        rest = fio_match2.group(2).strip()
-        task_words = ['купить', 'позвонить', 'сделать', 'проверить', 'написать', 'отправить', 'забрать', 'оплатить']
-        # Не считать контактом: "добавь цель отпуск 200000", "добавь расход 500" и т.д.
-        first_word = fio.split()[0].lower() if fio.split() else ''
-        if first_word in ('цель', 'расход', 'доход', 'задачу', 'контакт', 'карточку', 'заметку', 'человека'):
-            pass
-        else:
-            role_hint_words = [
-                'мама', 'папа', 'сын', 'дочь', 'муж', 'жена', 'супруг', 'супруга', 'коллега', 'друг', 'подруга',
-                'начальник', 'клиент', 'партнер', 'компаньон', 'директор', 'брат', 'сестра', 'дед', 'бабушка'
-            ]
-            rest_lower = rest.lower()
-            has_role_hint = ',' in rest or any(r in rest_lower for r in role_hint_words)
-            if any(word in fio.lower() for word in task_words):
-                pass
-            elif not has_role_hint and re.match(r'^[\d\s.,]+$', rest.replace(' ', '')):
-                pass
-            else:
-                birth_date, rest = _extract_birth_date_from_text(rest)
-                data = {}
-                if birth_date:
-                    data['birth_date'] = birth_date
-                parsed = _parse_person_roles_strengths_weaknesses(rest)
-                data.update(parsed)
-                logger.info(f"FIO pattern without date: {fio}, data: {data}")
-                return {
-                    "action": "create_person",
-                    "fio": fio.title(),
-                    **data
-                }
-    
-    roles_list = [
-        'мама', 'папа', 'отец', 'мать', 'брат', 'сестра', 'муж', 'жена', 'супруг', 'супруга', 'сын', 'дочь',
-        'дядя', 'тётя', 'тетя', 'дед', 'бабушка', 'друг', 'подруга', 'коллега',
-        'партнер', 'партнёр', 'компаньон', 'сооснователь', 'совладелец',
-        'начальник', 'директор', 'менеджер', 'клиент', 'заказчик', 'поставщик', 'инвестор', 'сосед', 'знакомый'
-    ]
-    for pattern in person_patterns:
-        match = re.search(pattern, msg_lower)
-        if match:
-            text = match.group(1).strip()
-            # Сначала извлекаем дату рождения из всего текста
-            birth_date, text = _extract_birth_date_from_text(text)
-            data = {}
-            if birth_date:
-                data['birth_date'] = birth_date
-
-            parts = [p.strip() for p in re.split(r'[,;]', text) if p.strip()]
-            if not parts:
-                continue
-            fio_part = parts[0]
-            # Последнее слово в первой части может быть ролью (супруга, коллега и т.д.)
-            words_fio = fio_part.split()
-            if len(words_fio) >= 2 and words_fio[-1].lower() in roles_list:
-                fio = ' '.join(words_fio[:-1]).strip()
-                data['relation'] = words_fio[-1].title()
-            else:
-                fio = fio_part
-            # Остальные части — характеристики (роли/сильные/слабые)
-            rest_parts = parts[1:]
-            if rest_parts:
-                rest_str = ', '.join(rest_parts)
-                parsed = _parse_person_roles_strengths_weaknesses(rest_str)
-                if parsed.get('relation') and not data.get('relation'):
-                    data['relation'] = parsed['relation']
-                elif parsed.get('relation') and data.get('relation'):
-                    data['relation'] = data['relation'] + ', ' + parsed['relation']
-                if parsed.get('strengths'):
-                    data['strengths'] = parsed['strengths']
-                if parsed.get('weaknesses'):
-                    data['weaknesses'] = parsed['weaknesses']
-
-            logger.info(f"Creating person: {fio}, data: {data}")
-            return {
-                "action": "create_person",
-                "fio": fio.title(),
-                **data
-            }
-    
-    # Обновление контакта: "обнови контакт Иванов..., сделай его партнёром по бизнесу"
-    update_pattern = r'обнови контакт\s+(.+?)\s*(?:,|–|-)\s*(.+)'
-    m_update = re.search(update_pattern, msg_lower)
-    if m_update:
-        fio_query = m_update.group(1).strip()
-        rest = m_update.group(2).strip()
-        data = {}
-        # Пытаемся распознать роль и характеристики аналогично созданию
-        roles = [
-            'мама', 'папа', 'отец', 'мать', 'брат', 'сестра', 'муж', 'жена', 'сын', 'дочь',
-            'дядя', 'тётя', 'тетя', 'дед', 'бабушка', 'друг', 'подруга', 'коллега',
-            'партнер', 'партнёр', 'партнер по бизнесу', 'партнёр по бизнесу',
-            'бизнес партнер', 'бизнес-партнер', 'компаньон', 'сооснователь', 'совладелец',
-            'начальник', 'директор', 'менеджер', 'клиент',
-            'заказчик', 'поставщик', 'инвестор', 'сосед', 'знакомый'
-        ]
-        weaknesses_words = ['забывчивый', 'забывчива', 'вспыльчивый', 'вспыльчива', 
-                           'ленивый', 'ленива', 'жадный', 'жадная', 'нервный', 'нервная',
-                           'непунктуальный', 'непунктуальна', 'необязательный', 'необязательна']
-        parts = [w.strip() for w in re.split(r'[,;]', rest) if w.strip()]
-        found_roles = []
-        strengths = []
-        weaknesses = []
-        for part in parts:
-            wl = part.lower()
-            if wl in roles or any(w in wl for w in ['партнер', 'бизнес', 'работ']):
-                found_roles.append(part)
-            elif wl in weaknesses_words:
-                weaknesses.append(part)
-            else:
-                strengths.append(part)
-        if found_roles:
-            data['relation'] = ', '.join(found_roles)
-        if strengths:
-            data['strengths'] = ', '.join(strengths)
-        if weaknesses:
-            data['weaknesses'] = ', '.join(weaknesses)
-        
-        return {
-            "action": "update_person",
-            "fio_query": fio_query,
-            **data
-        }
-    
-    return None
-
-
-def parse_relative_date(text: str) -> str:
-    """Преобразует относительные даты в формат YYYY-MM-DD."""
-    today = datetime.now().date()
-    text_lower = text.lower()
-    
-    if 'сегодня' in text_lower:
-        return today.isoformat()
-    elif 'завтра' in text_lower:
-        return (today + timedelta(days=1)).isoformat()
-    elif 'послезавтра' in text_lower:
-        return (today + timedelta(days=2)).isoformat()
-    elif 'через неделю' in text_lower:
-        return (today + timedelta(weeks=1)).isoformat()
-    elif 'через месяц' in text_lower:
-        return (today + timedelta(days=30)).isoformat()
-    
-    # Пытаемся найти дату в формате DD.MM или DD.MM.YYYY
-    date_match = re.search(r'(\d{1,2})\.(\d{1,2})(?:\.(\d{4}))?', text)
-    if date_match:
-        day = int(date_match.group(1))
-        month = int(date_match.group(2))
-        year = int(date_match.group(3)) if date_match.group(3) else today.year
-        try:
-            return datetime(year, month, day).date().isoformat()
-        except Exception:
-            pass
-    
-    return None
-
 
 async def execute_ai_action(action: dict, user_id: str) -> str:
     """Выполняет действие от ИИ и возвращает результат."""
@@ -2252,87 +1964,164 @@ async def execute_ai_action(action: dict, user_id: str) -> str:
         return f"❌ Ошибка: {str(e)}"
 
 
-async def maybe_summarize_chat(user_id: str):
+chat_summarizer = chat_summary.ChatSummarizer(
+    DATABASE,
+    chunk=CHAT_SUMMARY_CHUNK,
+    window=CHAT_CONTEXT_MESSAGES,
+    # MEMORY_BATCH=1 без MEMORY_BATCH_CRON: сжимает scripts/run_memory_batch.py в другом процессе
+    shared=memory_jobs.MEMORY_BATCH_ENABLED and not memory_jobs.MEMORY_BATCH_CRON.strip(),
+)
+
+
+memory_job = memory_jobs.MemoryBatchJob(
+    DATABASE,
+    summarizer=chat_summarizer,
+    agent=agent_core,
+)
+
+
+def _maybe_summarize_chat(uid: str, pending: int) -> None:
     """
-    Если история чата разрослась, сжимает старые сообщения в одно резюме.
-    Логика:
-    - если записей меньше CHAT_SUMMARY_THRESHOLD — ничего не делаем;
-    - берём самые старые CHAT_SUMMARY_CHUNK сообщений и просим ИИ сделать короткое резюме;
-    - сохраняем резюме как отдельное сообщение с ролью 'system';
-    - исходные старые сообщения удаляем.
+    После записи в историю: если за окном контекста накопилось CHAT_SUMMARY_CHUNK
+    несжатых сообщений — в фоне дописать их в резюме (api/services/chat_summary.py).
+    pending приходит из репозитория истории, COUNT(*) не нужен.
+    В пакетном режиме (MEMORY_BATCH=1) резюме обновляет ночная задача.
     """
-    if not is_ai_configured():
-        return
+    if is_ai_configured() and not memory_jobs.MEMORY_BATCH_ENABLED:
+        chat_summarizer.maybe_schedule(uid, pending)
 
-    try:
-        total = await chat_repo.get_total_count(user_id, db_path=DATABASE)
-        if total < CHAT_SUMMARY_THRESHOLD:
-            return
 
-        # Берём самые старые сообщения
-        rows = await chat_repo.get_oldest_messages(
-            user_id,
-            CHAT_SUMMARY_CHUNK,
-            db_path=DATABASE,
-        )
-        if not rows:
-            return
+async def _save_chat_turn(uid: str, message: str, response: str) -> None:
+    """Сохранить поворот диалога, обрезать историю и при необходимости запустить резюме."""
+    pending = await chat_repo.append_turn_and_trim(
+        uid,
+        message,
+        response,
+        CHAT_HISTORY_LIMIT,
+        db_path=DATABASE,
+    )
+    _maybe_summarize_chat(uid, pending)
 
-        # Готовим запрос к ИИ для резюме
-        history_messages = [
-            {"role": r["role"], "content": r["content"]} for r in rows
-        ]
-        system_msg = {
-            "role": "system",
-            "content": (
-                "Ты помогаешь сжать историю диалога пользователя с ассистентом.\n"
-                "Сделай короткое резюме важных фактов о пользователе, его целях, задачах, людях и контексте.\n"
-                "Не пересказывай каждое сообщение, оставь только то, что может пригодиться в будущем.\n"
-                "Ответь одним абзацем на русском языке."
-            ),
-        }
 
-        summary_text = await ai_chat(
-            [system_msg] + history_messages,
-            model_hint="summary",
-            max_tokens=220,
-            temperature=0.2,
-        )
-        if not summary_text:
-            return
+history_index = history_search.HistorySearch()
 
-        # Сохраняем резюме и удаляем старые сообщения
-        ids_to_delete = [int(r["id"]) for r in rows]
-        await chat_repo.insert_system_message(
-            user_id,
-            summary_text,
-            db_path=DATABASE,
-        )
-        await chat_repo.delete_messages_by_ids(
-            user_id,
-            ids_to_delete,
-            db_path=DATABASE,
-        )
-        logger.info(f"Chat history summarized for user {user_id}")
-    except Exception as e:
-        logger.error(f"Error summarizing chat for user {user_id}: {e}")
 
+async def _load_chat_history(uid: str) -> history_search.HistoryIndex:
+    """Индекс истории пользователя, дочитанный из БД инкрементально."""
+    index = history_index.index_for(uid, chat_repo.history_epoch(uid))
+    min_id, rows = await chat_repo.get_messages_after(uid, index.max_id, db_path=DATABASE)
+    index.drop_before(min_id)
+    index.add(rows)
+    return index
 
-@app.post("/api/chat")
-async def chat(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
-    """Чат с ИИ-ассистентом, который знает все данные пользователя."""
+
+def _pack_chat_history(index: history_search.HistoryIndex, message: str, system_prompt: str):
+    """
+    История под бюджет контекста модели чата (context_tokens("chat")): из него
+    вычитаются ответ, системный промпт с резюме и текущее сообщение; остаток
+    отдаётся окну последних CHAT_CONTEXT_MESSAGES сообщений (по сохранённым
+    оценкам токенов), затем найденным (BM25) репликам старше окна.
+    """
+    budget = (
+        context_tokens("chat")
+        - CHAT_REPLY_MAX_TOKENS
+        - tokens.estimate_tokens(system_prompt)
+        - tokens.estimate_tokens(message)
+        - 2 * tokens.MESSAGE_OVERHEAD_TOKENS
+    )
+    recent, used = index.recent_within(CHAT_CONTEXT_MESSAGES, budget)
+    older = history_search.retrieve(
+        index,
+        message,
+        recent=len(recent),
+        budget_tokens=min(history_search.CHAT_RETRIEVAL_TOKENS, budget - used),
+    )
+    return recent, older
+
+
+CHAT_STAGE_SECONDS = Histogram(
+    "chat_stage_duration_seconds",
+    "Этапы обработки сообщения чата (parse, extract, context, llm, memory, ...; summarize — фоновое резюме)",
+    ["stage"],
+)
+
+
+class ChatTimings:
+    """
+    Длительности этапов одного сообщения чата.
+
+    lap(stage) относит к этапу время с предыдущей отметки, поэтому отметки
+    ставятся после каждого шага конвейера; каждая отметка уходит и в трассу
+    запроса (tracing.add_timing → Server-Timing при API_DEBUG=1). В конце
+    finish(): гистограмма chat_stage_duration_seconds и строка chat_timing
+    в лог (JSON).
+    """
+
+    def __init__(self) -> None:
+        self.started = self._last = time.perf_counter()
+        self.stages: dict = {}
+
+    def lap(self, stage: str) -> None:
+        now = time.perf_counter()
+        seconds = now - self._last
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        self._last = now
+        tracing.add_timing(stage, seconds)
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> dict:
+        return {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()}
+
+    def finish(self, uid: str, outcome: str) -> None:
+        for stage, seconds in self.stages.items():
+            CHAT_STAGE_SECONDS.labels(stage).observe(seconds)
+        logger.info("chat_timing %s", json.dumps({
+            "user_id": uid,
+            "outcome": outcome,
+            "total_ms": round(self.total() * 1000, 1),
+            "stages_ms": self.as_dict(),
+        }, ensure_ascii=False))
+
+
+# Фоновое сжатие истории — не на пути ответа, но тоже этап конвейера
+chat_summarizer.fold_listeners.append(lambda seconds: CHAT_STAGE_SECONDS.labels("summarize").observe(seconds))
+
+
+@dataclass
+class ChatTurn:
+    """Подготовленный поворот диалога: всё, что нужно для вызова LLM и сохранения ответа."""
+
+    uid: str
+    message: str
+    messages: List[dict]
+    state: AgentState
+    intent: str
+
+
+async def _prepare_chat(message: str, x_user_id: str, timings: ChatTimings):
+    """
+    Общая часть /api/chat и /api/chat/stream: команды, прямые действия, ответы из БД
+    и сборка контекста для LLM. Этапы отмечаются в timings.
+
+    Возвращает либо готовый ответ (dict) — LLM не нужен, либо ChatTurn.
+    """
     # Единый формат user_id для БД (избегаем расхождений Telegram id как число/строка)
     uid = str(x_user_id).strip() if x_user_id else ""
     if not uid:
         return {"response": "Не указан пользователь (X-User-Id).", "action_executed": False}
+    # Все вызовы ИИ этого запроса (извлечение, ответ, память) учитываются на пользователя
+    ai_usage.set_current_user(uid)
 
-    text_raw = msg.message.strip()
+    text_raw = message.strip()
     text_lower = text_raw.lower()
 
     # --- Управление памятью диалога через команды ---
     # Новый диалог / очистка истории
     if text_lower in ("новый диалог", "очистить диалог", "очисти диалог", "reset", "start over"):
         await chat_repo.clear_history(uid, db_path=DATABASE)
+        timings.lap("history_write")
         return {
             "response": "Я очистил нашу историю. Можем начать заново с чистого листа.",
             "action_executed": False,
@@ -2347,16 +2136,15 @@ async def chat(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
             phrase,
             db_path=DATABASE,
         )
+        timings.lap("history_write")
         return {
             "response": f"Ок, постараюсь больше не учитывать информацию про «{phrase}».",
             "action_executed": False,
         }
 
-    # Перед обычной обработкой — при необходимости сжимаем очень старую историю в резюме
-    await maybe_summarize_chat(uid)
-
     # Сначала проверяем прямые команды: regex, затем (если пусто) — понимание по сырому тексту через ИИ
     direct_command = parse_user_command(text_raw, uid)
+    timings.lap("parse")
     if not direct_command and is_ai_configured():
         try:
             direct_command = await extract_command_with_ai(text_raw)
@@ -2364,6 +2152,7 @@ async def chat(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
                 logger.info("extract_command_with_ai resolved: %s", direct_command.get("action"))
         except Exception as e:
             logger.warning("extract_command_with_ai error: %s", e)
+        timings.lap("extract")
     if direct_command:
         # Для «добавь контакт» от regex пробуем обогатить поля через ИИ; если команда уже от extract_command_with_ai — не дублируем
         if direct_command.get("action") == "create_person" and is_ai_configured() and not direct_command.get("relation") and not direct_command.get("birth_date"):
@@ -2377,7 +2166,9 @@ async def chat(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
                     logger.info("create_person: using AI extraction %s", direct_command)
             except Exception as e:
                 logger.warning("AI person extraction failed, using regex: %s", e)
+            timings.lap("person")
         result = await execute_ai_action(direct_command, uid)
+        timings.lap("action")
         logger.info(f"Direct command executed: {direct_command['action']} -> {result}")
         
         # Решаем, считать ли это реальным действием (меняющим данные)
@@ -2385,15 +2176,17 @@ async def chat(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
         is_real_action = action_type not in ("ask_split_tasks", "ask_task_confirmation")
         
         # Сохраняем в историю
-        await chat_repo.append_messages(
+        pending = await chat_repo.append_messages(
             uid,
             [
-                ("user", msg.message),
+                ("user", message),
                 ("assistant", result),
             ],
             db_path=DATABASE,
         )
-        
+        _maybe_summarize_chat(uid, pending)
+        timings.lap("history_write")
+
         return {"response": result, "action_executed": is_real_action}
     
     today = datetime.now().date()
@@ -2434,23 +2227,10 @@ async def chat(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
         active_tasks = [dict(r) for r in await cursor.fetchall()]
         tasks_today = [t for t in active_tasks if t.get("deadline") == today_iso]
         tasks_overdue = [dict(t, **{"_overdue": True}) for t in active_tasks if t.get("deadline") and t["deadline"] < today_iso]
-        # Дедупликация по (title, deadline) — убираем дубли из БД/повторов
-        def _dedupe(lst):
-            seen = set()
-            out = []
-            for x in lst:
-                key = (x.get("title") or "", x.get("deadline") or "")
-                if key not in seen:
-                    seen.add(key)
-                    out.append(x)
-            return out
-        tasks_today = _dedupe(tasks_today)
-        tasks_overdue = _dedupe(tasks_overdue)
-        # Для промпта убираем служебный флаг и префикс [Папка], оставляем только нужные поля
-        def _strip(lst):
-            return [{"title": _strip_folder_prefix(x.get("title") or ""), "deadline": x.get("deadline"), "priority": x.get("priority")} for x in lst]
-        tasks_today_short = _strip(tasks_today)
-        tasks_overdue_short = _strip(tasks_overdue)
+        tasks_today = _dedupe_tasks(tasks_today)
+        tasks_overdue = _dedupe_tasks(tasks_overdue)
+        tasks_today_short = _strip_tasks(tasks_today)
+        tasks_overdue_short = _strip_tasks(tasks_overdue)
         logger.info("Chat context user_id=%s tasks_today=%d tasks_overdue=%d", uid, len(tasks_today), len(tasks_overdue))
         
         if is_today_tasks_query:
@@ -2480,7 +2260,9 @@ async def chat(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
             else:
                 lines.append("💡 Управлять задачами: Hub или команда <i>создай задачу …</i>")
             response_today = "\n".join(lines)
-            await chat_repo.append_turn_and_trim(uid, msg.message, response_today, CHAT_HISTORY_LIMIT, db_path=DATABASE)
+            timings.lap("context")
+            await _save_chat_turn(uid, message, response_today)
+            timings.lap("history_write")
             return {"response": response_today, "action_executed": False}
         
         # Полный контекст: задачи (на сегодня + просроченные), контакты, знания, финансы
@@ -2488,7 +2270,7 @@ async def chat(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
         
         # Люди
         cursor = await db.execute(
-            "SELECT fio, data FROM people WHERE user_id = ?",
+            "SELECT fio, data FROM people WHERE user_id = ? ORDER BY created_at DESC, id DESC",
             (uid,)
         )
         people = []
@@ -2499,7 +2281,7 @@ async def chat(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
         
         # Проекты (активные)
         cursor = await db.execute(
-            "SELECT id, title, status, deadline, budget, revenue_goal FROM projects WHERE user_id = ? AND status != 'done'",
+            "SELECT id, title, status, deadline, budget, revenue_goal FROM projects WHERE user_id = ? AND status != 'done' ORDER BY created_at DESC, id DESC",
             (uid,)
         )
         projects_ctx = []
@@ -2537,16 +2319,16 @@ async def chat(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
         fin_expense = (fin_row["expense"] or 0) if fin_row else 0
         fin_balance = fin_income - fin_expense
 
-        # Последние операции (ограничим 20)
+        # Последние операции: в промпт из них попадут самые релевантные
         cursor = await db.execute(
             """
             SELECT date, amount, type, category, comment
             FROM finance_transactions
             WHERE user_id = ?
             ORDER BY date DESC, id DESC
-            LIMIT 20
+            LIMIT ?
             """,
-            (uid,),
+            (uid, CHAT_CONTEXT_OPERATIONS_POOL),
         )
         fin_last_ops = [dict(row) for row in await cursor.fetchall()]
 
@@ -2600,7 +2382,9 @@ async def chat(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
                 lines.append("")
                 lines.append("💡 Если вносили операции в Hub — откройте его по кнопке «Открыть Hub» в этом чате.")
             response_money = "\n".join(lines)
-            await chat_repo.append_turn_and_trim(uid, msg.message, response_money, CHAT_HISTORY_LIMIT, db_path=DATABASE)
+            timings.lap("context")
+            await _save_chat_turn(uid, message, response_money)
+            timings.lap("history_write")
             return {"response": response_money, "action_executed": False}
         
         # Запрос «Мои цели» — ответ только из БД, без ИИ (никаких Нива/Багги из истории)
@@ -2622,7 +2406,9 @@ async def chat(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
                 lines.append("")
                 lines.append("💡 Откройте Hub из приложения Telegram, чтобы видеть свои цели.")
             response_goals = "\n".join(lines).strip()
-            await chat_repo.append_turn_and_trim(uid, msg.message, response_goals, CHAT_HISTORY_LIMIT, db_path=DATABASE)
+            timings.lap("context")
+            await _save_chat_turn(uid, message, response_goals)
+            timings.lap("history_write")
             return {"response": response_goals, "action_executed": False}
         
         # Запрос «Сводка по проектам» — только из БД
@@ -2645,15 +2431,15 @@ async def chat(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
                 lines.append("")
                 lines.append("💡 Откройте Hub из приложения Telegram, чтобы видеть проекты.")
             response_projects = "\n".join(lines).strip()
-            await chat_repo.append_turn_and_trim(uid, msg.message, response_projects, CHAT_HISTORY_LIMIT, db_path=DATABASE)
+            timings.lap("context")
+            await _save_chat_turn(uid, message, response_projects)
+            timings.lap("history_write")
             return {"response": response_projects, "action_executed": False}
         
-        # Загружаем последние N сообщений для контекста (меньше = быстрее ответ и без устаревших фактов из истории)
-        chat_history = await chat_repo.get_recent_history(
-            uid,
-            CHAT_CONTEXT_MESSAGES,
-            db_path=DATABASE,
-        )
+        timings.lap("context")
+        # История диалога (окно и поиск по старым репликам упаковываются под бюджет ниже)
+        history = await _load_chat_history(uid)
+        timings.lap("history")
     
     # Текущая дата и время
     now = datetime.now()
@@ -2674,66 +2460,185 @@ async def chat(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
             "over": over,
         })
     
+    # Контакты, проекты и операции — только релевантные, в пределах бюджета токенов
+    recent_text = context_selector.history_text(history.recent(CHAT_CONTEXT_MESSAGES))
+    people_sel = context_selector.select_contacts(
+        people,
+        message=message,
+        history_text=recent_text,
+        today=today,
+        budget_tokens=CHAT_CONTEXT_TOKEN_BUDGET // 2,
+        max_items=CHAT_CONTEXT_MAX_CONTACTS,
+    )
+    projects_sel = context_selector.select_projects(
+        projects_ctx,
+        message=message,
+        history_text=recent_text,
+        today=today,
+        budget_tokens=CHAT_CONTEXT_TOKEN_BUDGET // 5,
+        max_items=CHAT_CONTEXT_MAX_PROJECTS,
+    )
+    ops_sel = context_selector.select_operations(
+        fin_last_ops,
+        message=message,
+        budget_tokens=CHAT_CONTEXT_TOKEN_BUDGET * 3 // 10,
+        max_items=CHAT_CONTEXT_MAX_OPERATIONS,
+    )
+
     # Базовый промпт с данными (без persona — её добавит AgentCore)
     base_prompt = f"""⏰ Сейчас: {today_str} ({weekday}), {now.strftime("%H:%M")}
 
 📊 Данные пользователя (используй ТОЛЬКО их, не выдумывай):
-• Задачи: сегодня — {json.dumps(tasks_today_short, ensure_ascii=False) if tasks_today_short else "нет"}; просрочено — {json.dumps(tasks_overdue_short, ensure_ascii=False) if tasks_overdue_short else "нет"}; всего активных: {total_tasks}
-• Контакты ({len(people)}): {json.dumps(people, ensure_ascii=False) if people else "нет"}
-• Проекты: {json.dumps(projects_ctx, ensure_ascii=False) if projects_ctx else "нет"}
-• Финансы: доход {fin_income} ₽, расход {fin_expense} ₽, баланс {fin_balance} ₽
-• Последние операции: {json.dumps(fin_last_ops, ensure_ascii=False) if fin_last_ops else "нет"}
-• Цели: {json.dumps(fin_goals, ensure_ascii=False) if fin_goals else "нет"}
-• Лимиты (потрачено/лимит): {json.dumps(limits_summary, ensure_ascii=False) if limits_summary else "нет"}
+• Задачи на сегодня: {prompt_format.section(tasks_today_short, today=today)}
+• Просроченные задачи: {prompt_format.section(tasks_overdue_short, today=today)}
+• Всего активных задач: {total_tasks}
+• Контакты ({len(people)}): {people_sel.render(today=today)}
+• Проекты ({len(projects_ctx)}): {projects_sel.render(PROJECT_PROMPT_COLUMNS, today=today)}
+• Финансы: доход {fin_income:.0f} ₽, расход {fin_expense:.0f} ₽, баланс {fin_balance:.0f} ₽
+• Последние операции: {ops_sel.render(today=today)}
+• Цели: {prompt_format.section(fin_goals, today=today)}
+• Лимиты (потрачено/лимит): {prompt_format.section(limits_summary, today=today)}
+
+Формат: 1–2 предложения по сути + 1–3 шага. Если лимит превышен (over = да) — предупреди. Про людей — тактика общения. Про задачи — приоритеты. Встреча/звонок сегодня — в конце: «Кстати, встреча в X — подготовиться?» Не говори «я создал» — действия выполняет система."""
 
-Формат: 1–2 предложения по сути + 1–3 шага. Если лимит превышен (over: true) — предупреди. Про людей — тактика общения. Про задачи — приоритеты. Встреча/звонок сегодня — в конце: «Кстати, встреча в X — подготовиться?» Не говори «я создал» — действия выполняет система."""
+    timings.lap("prompt")
 
     # AgentCore: персона, память, intent
     state = await agent_core.load_state(uid)
-    intent = agent_core.analyze_intent(msg.message, None)
+    intent = agent_core.analyze_intent(message, None)
     system_prompt = agent_core.build_system_prompt(base_prompt, state, intent)
+    timings.lap("agent_state")
+    summaries = (await chat_summarizer.get(uid, chat_repo.history_epoch(uid))).render()
+    if summaries:
+        system_prompt = f"{system_prompt}\n\n{summaries}"
+    chat_history, older_context = _pack_chat_history(history, message, system_prompt)
+    if older_context:
+        system_prompt = f"{system_prompt}\n\n{older_context}"
+    timings.lap("summaries")
 
     if not is_ai_configured():
         return {"response": "ИИ не настроен. Установите OPENROUTER_API_KEY в .env"}
-    
+
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend(chat_history)
+    messages.append({"role": "user", "content": message})
+    return ChatTurn(uid=uid, message=message, messages=messages, state=state, intent=intent)
+
+
+async def _finish_chat_turn(turn: ChatTurn, ai_response: str, timings: ChatTimings) -> dict:
+    """Обновить память агента и историю после ответа LLM."""
+    # AgentCore: обновляем память и сохраняем
+    state = await agent_core.update_memory_after_turn(
+        turn.state,
+        turn.message,
+        ai_response,
+        f"chat:{turn.intent}",
+        defer=memory_jobs.MEMORY_BATCH_ENABLED,
+    )
+    timings.lap("memory")
+    await agent_core.save_state(state, defer=memory_jobs.MEMORY_BATCH_ENABLED)
+
+    # Сохраняем в историю
+    await _save_chat_turn(turn.uid, turn.message, ai_response)
+    timings.lap("history_write")
+    return {"response": ai_response, "action_executed": False}
+
+
+def _chat_error_response(e: Exception) -> dict:
+    """Ответ пользователю при ошибке вызова LLM."""
+    if isinstance(e, AiNotConfiguredError):
+        return {"response": "ИИ не настроен. Установите OPENROUTER_API_KEY в .env"}
+    if isinstance(e, AiRateLimitedError):
+        return {"response": "Лимит запросов исчерпан. Попробуйте позже."}
+    error_msg = str(e)
+    if "403" in error_msg or "Forbidden" in error_msg:
+        return {"response": "Ошибка доступа к ИИ. Проверьте API ключ."}
+    elif "429" in error_msg or "quota" in error_msg.lower():
+        return {"response": "Лимит запросов исчерпан. Попробуйте позже."}
+    return {"response": f"Ошибка ИИ: {error_msg}"}
+
+
+@app.post("/api/chat")
+async def chat(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
+    """Чат с ИИ-ассистентом, который знает все данные пользователя."""
+    timings = ChatTimings()
+    turn = await _prepare_chat(msg.message, x_user_id, timings)
+    if isinstance(turn, dict):
+        timings.finish(x_user_id, "direct")
+        return turn
+
+    outcome = "llm"
     try:
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(chat_history)
-        messages.append({"role": "user", "content": msg.message})
-        
         ai_response = await ai_chat(
-            messages,
+            turn.messages,
             model_hint="chat",
-            max_tokens=600,
+            max_tokens=CHAT_REPLY_MAX_TOKENS,
             temperature=0.4,
         )
+        timings.lap("llm")
+        return await _finish_chat_turn(turn, ai_response, timings)
+    except Exception as e:
+        outcome = "error"
+        return _chat_error_response(e)
+    finally:
+        timings.finish(turn.uid, outcome)
 
-        # AgentCore: обновляем память и сохраняем
-        state = await agent_core.update_memory_after_turn(
-            state, msg.message, ai_response, f"chat:{intent}"
-        )
-        await agent_core.save_state(state)
 
-        # Сохраняем в историю
-        await chat_repo.append_turn_and_trim(
-            uid,
-            msg.message,
-            ai_response,
-            CHAT_HISTORY_LIMIT,
-            db_path=DATABASE,
-        )
+@app.post("/api/chat/stream")
+async def chat_stream(msg: ChatMessage, x_user_id: str = Depends(resolve_user_id)):
+    """
+    Потоковый вариант /api/chat (NDJSON).
 
-        return {"response": ai_response, "action_executed": False}
-    
-    except AiNotConfiguredError:
-        return {"response": "ИИ не настроен. Установите OPENROUTER_API_KEY в .env"}
-    except Exception as e:
-        error_msg = str(e)
-        if "403" in error_msg or "Forbidden" in error_msg:
-            return {"response": "Ошибка доступа к ИИ. Проверьте API ключ."}
-        elif "429" in error_msg or "quota" in error_msg.lower():
-            return {"response": "Лимит запросов исчерпан. Попробуйте позже."}
-        return {"response": f"Ошибка ИИ: {error_msg}"}
+    Строки: {"type": "delta", "text": "..."} по мере генерации и финальная
+    {"type": "done", "response": "...", "action_executed": ...}. Ответы без LLM
+    (команды, сводки из БД) приходят сразу одной строкой done.
+    При API_DEBUG=1 заголовок Server-Timing уходит до генерации и содержит только
+    этапы подготовки, поэтому полная разбивка (мс по этапам) — в timings строки done.
+    """
+    timings = ChatTimings()
+    turn = await _prepare_chat(msg.message, x_user_id, timings)
+
+    def _line(payload: dict) -> str:
+        return json.dumps(payload, ensure_ascii=False) + "\n"
+
+    def _done(result: dict) -> str:
+        if tracing.API_DEBUG:
+            result = {**result, "timings": timings.as_dict()}
+        return _line({"type": "done", **result})
+
+    async def _events():
+        if isinstance(turn, dict):
+            timings.finish(x_user_id, "direct")
+            yield _done(turn)
+            return
+        parts: List[str] = []
+        outcome = "llm"
+        try:
+            async for delta in ai_chat_stream(
+                turn.messages,
+                model_hint="chat",
+                max_tokens=CHAT_REPLY_MAX_TOKENS,
+                temperature=0.4,
+            ):
+                parts.append(delta)
+                yield _line({"type": "delta", "text": delta})
+            timings.lap("llm")
+            reply = "".join(parts).strip()
+            if reply:
+                result = await _finish_chat_turn(turn, reply, timings)
+            else:
+                # Пустой поток — ошибка провайдера: в историю и память не пишем
+                logger.warning("chat stream returned no text for user %s", turn.uid)
+                outcome = "error"
+                result = {"response": "ИИ не прислал ответа. Попробуйте ещё раз."}
+        except Exception as e:
+            logger.warning("chat stream failed for user %s: %s", turn.uid, e)
+            outcome = "error"
+            result = _chat_error_response(e)
+        timings.finish(turn.uid, outcome)
+        yield _done(result)
+
+    return StreamingResponse(_events(), media_type="application/x-ndjson")
 
 
 @app.delete("/api/chat/history")
@@ -2775,6 +2680,83 @@ async def get_agent_state(x_user_id: str = Depends(resolve_user_id)):
     }
 
 
+@app.get("/api/admin/ai-status", dependencies=[Depends(require_admin)])
+async def get_ai_status():
+    """
+    Диагностика LLM-трафика: здоровье провайдеров (circuit breaker, задержки),
+    допуск (очередь, ожидание слота, in-flight, число 429) и попадания в кэш извлечения.
+    """
+    return {
+        "health": provider_health(),
+        "admission": admission_stats(),
+        "extraction_cache": extraction_cache.stats(),
+    }
+
+
+def _cache_metrics():
+    """Попадания в кэши процесса для /metrics (счётчики ведут сами кэши)."""
+    extraction = extraction_cache.stats()
+    caches = {
+        "extraction": (extraction["hits_memory"] + extraction["hits_db"], extraction["misses"]),
+        "chat_summary": (chat_summarizer.hits, chat_summarizer.misses),
+        "history_index": (history_index.hits, history_index.misses),
+    }
+    lookups, ratios = [], []
+    for name, (hits, misses) in caches.items():
+        lookups.append(("cache_lookups_total", {"cache": name, "result": "hit"}, hits))
+        lookups.append(("cache_lookups_total", {"cache": name, "result": "miss"}, misses))
+        if hits + misses:
+            ratios.append(("cache_hit_ratio", {"cache": name}, hits / (hits + misses)))
+    return [
+        ("cache_lookups_total", "counter", "Обращения к кэшам API", lookups),
+        ("cache_hit_ratio", "gauge", "Доля попаданий в кэш с момента запуска", ratios),
+    ]
+
+
+REGISTRY.register_collector(_cache_metrics)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: str = Header("", alias="Authorization")):
+    """Метрики Prometheus. Вне /api/ — nginx наружу не проксирует; токен — METRICS_TOKEN."""
+    if not METRICS_ENABLED or (METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=404, detail="Not found")
+    return metrics_response()
+
+
+@app.post("/api/admin/memory-batch", dependencies=[Depends(require_admin)])
+async def run_memory_batch():
+    """Запустить пакетную обработку памяти сейчас (то же, что ночная задача)."""
+    report = await memory_job.run()
+    return report.as_dict()
+
+
+@app.get("/api/admin/ai-stats", dependencies=[Depends(require_admin)])
+async def get_ai_stats(hours: float = Query(24, gt=0, le=24 * 90)):
+    """
+    Стоимость LLM-трафика за последние hours часов: вызовы, ошибки, p50/p95 задержки
+    и токены по пользователям, видам вызова (by_purpose: chat / extract / person /
+    summary / memory), назначениям модели (by_hint) и провайдерам.
+    Задержка и токены — только по успешным вызовам; since_start — по видам вызова.
+    """
+    await ai_usage.recorder.flush(DATABASE)
+    calls = await ai_usage.load_calls(DATABASE, time.time() - hours * 3600)
+    outcomes: dict = {}
+    for call in calls:
+        outcomes[call["outcome"]] = outcomes.get(call["outcome"], 0) + 1
+    return {
+        "hours": hours,
+        "calls": len(calls),
+        "outcomes": outcomes,
+        "usage_estimated": sum(c["usage_estimated"] for c in calls),
+        "by_purpose": ai_usage.summarize(calls, "purpose"),
+        "by_hint": ai_usage.summarize(calls, "model_hint"),
+        "by_provider": ai_usage.summarize(calls, "provider"),
+        "by_user": ai_usage.summarize(calls, "user_id"),
+        "since_start": dict(ai_usage.recorder.totals),
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
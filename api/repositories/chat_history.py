@@ -1,20 +1,66 @@
 from __future__ import annotations
 
-from typing import Iterable, List, Dict, Sequence
+from typing import Iterable, List, Dict, Optional, Tuple
 
 import aiosqlite
 
+try:
+    from api.services.tokens import estimate_tokens
+except ImportError:  # запуск из каталога api
+    from services.tokens import estimate_tokens  # type: ignore[no-redef]
+
 # Используем такой же путь к БД, как и в основном API.
 # Дублирование строки ок, чтобы не плодить циклические импорты.
 DATABASE = "data/hub.db"
 
+# Эпоха истории пользователя: растёт при удалении произвольных сообщений.
+# По ней индекс поиска (api/services/history_search.py) понимает, что его
+# нельзя достраивать инкрементально и надо пересобрать.
+_epochs: Dict[str, int] = {}
+
+
+def history_epoch(user_id: str) -> int:
+    return _epochs.get(user_id, 0)
+
+
+def _bump_epoch(user_id: str) -> None:
+    _epochs[user_id] = _epochs.get(user_id, 0) + 1
+
+
+# Если резюмирование не успевает (ИИ недоступен), история всё равно
+# обрезается — до `limit * HARD_LIMIT_FACTOR` сообщений.
+HARD_LIMIT_FACTOR = 2
+
+
+async def _note_appended(db: aiosqlite.Connection, user_id: str, count: int) -> int:
+    """
+    Увеличить счётчик сообщений после водяного знака резюме (chat_summary,
+    уровень 'recent') и вернуть его — вместо COUNT(*) по истории.
+    """
+    await db.execute(
+        """
+        INSERT INTO chat_summary (user_id, level, content, watermark_id, pending)
+        VALUES (?, 'recent', '', 0, ?)
+        ON CONFLICT(user_id, level) DO UPDATE SET pending = pending + excluded.pending
+        """,
+        (user_id, count),
+    )
+    cursor = await db.execute(
+        "SELECT pending FROM chat_summary WHERE user_id = ? AND level = 'recent'",
+        (user_id,),
+    )
+    row = await cursor.fetchone()
+    return int(row[0]) if row else count
+
 
 async def clear_history(user_id: str, db_path: str = DATABASE) -> None:
-    """Удалить всю историю чата пользователя."""
+    """Удалить всю историю чата пользователя (вместе с резюме)."""
 
     async with aiosqlite.connect(db_path) as db:
         await db.execute("DELETE FROM chat_history WHERE user_id = ?", (user_id,))
+        await db.execute("DELETE FROM chat_summary WHERE user_id = ?", (user_id,))
         await db.commit()
+    _bump_epoch(user_id)
 
 
 async def delete_assistant_messages_with_phrase(
@@ -59,7 +105,8 @@ async def delete_assistant_messages_with_phrase(
             params,
         )
         await db.commit()
-        return len(ids_to_delete)
+    _bump_epoch(user_id)
+    return len(ids_to_delete)
 
 
 async def get_recent_history(
@@ -90,130 +137,104 @@ async def get_recent_history(
     return [{"role": r["role"], "content": r["content"]} for r in reversed(rows)]
 
 
-async def append_messages(
+async def get_messages_after(
     user_id: str,
-    messages: Iterable[tuple[str, str]],
+    after_id: int,
     db_path: str = DATABASE,
-) -> None:
-    """Добавить несколько сообщений в историю (role, content)."""
-
-    async with aiosqlite.connect(db_path) as db:
-        for role, content in messages:
-            await db.execute(
-                "INSERT INTO chat_history (user_id, role, content) VALUES (?, ?, ?)",
-                (user_id, role, content),
-            )
-        await db.commit()
-
-
-async def append_turn_and_trim(
-    user_id: str,
-    user_text: str,
-    assistant_text: str,
-    limit: int,
-    db_path: str = DATABASE,
-) -> None:
+) -> Tuple[Optional[int], List[Dict[str, object]]]:
     """
-    Добавить одну реплику пользователя и ответ ассистента, после чего
-    обрезать историю до последних `limit` сообщений.
+    Для инкрементального индекса: минимальный id истории пользователя
+    (None — истории нет) и сообщения с id больше `after_id` по возрастанию id.
     """
 
-    async with aiosqlite.connect(db_path) as db:
-        await db.execute(
-            "INSERT INTO chat_history (user_id, role, content) VALUES (?, ?, ?)",
-            (user_id, "user", user_text),
-        )
-        await db.execute(
-            "INSERT INTO chat_history (user_id, role, content) VALUES (?, ?, ?)",
-            (user_id, "assistant", assistant_text),
-        )
-        await db.execute(
-            """
-            DELETE FROM chat_history
-            WHERE user_id = ?
-              AND id NOT IN (
-                SELECT id FROM chat_history
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-                LIMIT ?
-              )
-            """,
-            (user_id, user_id, limit),
-        )
-        await db.commit()
-
-
-async def get_total_count(user_id: str, db_path: str = DATABASE) -> int:
-    """Подсчитать количество сообщений в истории пользователя."""
-
     async with aiosqlite.connect(db_path) as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
-            "SELECT COUNT(*) AS cnt FROM chat_history WHERE user_id = ?",
+            "SELECT MIN(id) AS min_id FROM chat_history WHERE user_id = ?",
             (user_id,),
         )
         row = await cursor.fetchone()
-        return int(row["cnt"]) if row else 0
-
-
-async def get_oldest_messages(
-    user_id: str,
-    limit: int,
-    db_path: str = DATABASE,
-) -> List[Dict[str, object]]:
-    """
-    Получить самые старые `limit` сообщений истории.
-    Возвращает список словарей с полями id, role, content.
-    """
-
-    async with aiosqlite.connect(db_path) as db:
-        db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             """
-            SELECT id, role, content
+            SELECT id, role, content, created_at, tokens
             FROM chat_history
-            WHERE user_id = ?
-            ORDER BY created_at ASC
-            LIMIT ?
+            WHERE user_id = ? AND id > ?
+            ORDER BY id ASC
             """,
-            (user_id, limit),
+            (user_id, after_id),
         )
         rows = await cursor.fetchall()
 
-    return [dict(row) for row in rows]
+    return (row["min_id"] if row else None), [dict(r) for r in rows]
 
 
-async def insert_system_message(
+async def append_messages(
     user_id: str,
-    content: str,
+    messages: Iterable[tuple[str, str]],
     db_path: str = DATABASE,
-) -> None:
-    """Добавить системное сообщение (резюме) в историю чата."""
+) -> int:
+    """
+    Добавить несколько сообщений в историю (role, content).
+    Возвращает число сообщений после водяного знака резюме.
+    """
 
     async with aiosqlite.connect(db_path) as db:
-        await db.execute(
-            "INSERT INTO chat_history (user_id, role, content) VALUES (?, ?, ?)",
-            (user_id, "system", content),
-        )
+        count = 0
+        for role, content in messages:
+            await db.execute(
+                "INSERT INTO chat_history (user_id, role, content, tokens) VALUES (?, ?, ?, ?)",
+                (user_id, role, content, estimate_tokens(content)),
+            )
+            count += 1
+        pending = await _note_appended(db, user_id, count)
         await db.commit()
+    return pending
 
 
-async def delete_messages_by_ids(
+async def append_turn_and_trim(
     user_id: str,
-    ids: Sequence[int],
+    user_text: str,
+    assistant_text: str,
+    limit: int,
     db_path: str = DATABASE,
-) -> None:
-    """Удалить сообщения по списку id для пользователя."""
+) -> int:
+    """
+    Добавить одну реплику пользователя и ответ ассистента, после чего
+    обрезать историю до последних `limit` сообщений — но только уже вошедшие
+    в резюме (id не больше водяного знака). Несжатые сообщения удаляются
+    лишь сверх `limit * HARD_LIMIT_FACTOR`.
 
-    if not ids:
-        return
+    Возвращает число сообщений после водяного знака резюме.
+    """
 
     async with aiosqlite.connect(db_path) as db:
-        placeholders = ",".join("?" for _ in ids)
-        params: List[object] = [user_id, *ids]
+        await db.executemany(
+            "INSERT INTO chat_history (user_id, role, content, tokens) VALUES (?, ?, ?, ?)",
+            [
+                (user_id, "user", user_text, estimate_tokens(user_text)),
+                (user_id, "assistant", assistant_text, estimate_tokens(assistant_text)),
+            ],
+        )
+        pending = await _note_appended(db, user_id, 2)
         await db.execute(
-            f"DELETE FROM chat_history WHERE user_id = ? AND id IN ({placeholders})",
-            params,
+            """
+            DELETE FROM chat_history
+            WHERE id IN (
+                SELECT id FROM chat_history
+                WHERE user_id = ?
+                ORDER BY id DESC
+                LIMIT -1 OFFSET ?
+              )
+              AND (
+                id <= COALESCE(
+                    (SELECT watermark_id FROM chat_summary WHERE user_id = ? AND level = 'recent'), 0
+                )
+                OR id <= COALESCE(
+                    (SELECT id FROM chat_history WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?), 0
+                )
+              )
+            """,
+            (user_id, limit, user_id, user_id, limit * HARD_LIMIT_FACTOR),
         )
         await db.commit()
-
+    return pending
@@ -1,9 +1,25 @@
 import asyncio
+import heapq
+import importlib.util
+import itertools
+import json
+import logging
 import os
-from typing import List, Dict, Optional, Any
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable, Deque, List, Dict, Optional, Any
 
 import httpx
-from openai import AsyncOpenAI, APIConnectionError, APITimeoutError
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError
+
+from . import ai_usage
+from .tokens import estimate_tokens
+
+
+logger = logging.getLogger(__name__)
 
 
 class AiClientError(Exception):
@@ -14,87 +30,564 @@ class AiNotConfiguredError(AiClientError):
     """Raised when AI client is not configured (no API key / base URL)."""
 
 
-# --- Low-level client configuration -------------------------------------------------
-
-# Yandex: Api-Key (секретный ключ) + folder id. Идентификатор ключа в запросах не используется.
-_use_yandex = bool(
-    os.getenv("YANDEX_API_KEY") and os.getenv("YANDEX_FOLDER_ID")
-)
-
-_api_key = (
-    os.getenv("OPENROUTER_API_KEY")
-    or os.getenv("VSELM_API_KEY")
-    or os.getenv("GOOGLE_API_KEY")
-    or (os.getenv("YANDEX_API_KEY") if not _use_yandex else None)
-)
-
-if os.getenv("OPENROUTER_API_KEY"):
-    _base_url = "https://openrouter.ai/api/v1"
-elif os.getenv("VSELM_API_KEY"):
-    _base_url = os.getenv("VSELM_BASE_URL", "https://api.vsellm.ru/v1")
-elif os.getenv("GOOGLE_API_KEY"):
-    _base_url = "https://generativelanguage.googleapis.com/v1beta/openai/"
-elif _use_yandex:
-    _base_url = "yandex"  # маркер: вызов через нативный API
-else:
-    _base_url = None
-
-# Для OpenRouter нужны дополнительные заголовки
-_default_headers: Dict[str, str] = {}
-if os.getenv("OPENROUTER_API_KEY"):
-    _default_headers = {
-        "HTTP-Referer": "https://tghub.duckdns.org",
-        "X-Title": "YouHub",
-    }
+class AiRateLimitedError(AiClientError):
+    """Raised when providers answer 429 or the admission queue wait times out."""
 
-_client: Optional[AsyncOpenAI]
-if _api_key and _base_url and _base_url != "yandex":
-    _client = AsyncOpenAI(
-        api_key=_api_key,
-        base_url=_base_url,
-        timeout=120.0,  # Увеличен таймаут для бесплатных моделей
-        default_headers=_default_headers or None,
-    )
-elif _use_yandex:
-    _client = "yandex"  # type: ignore[assignment]
-else:
-    _client = None
 
+class AiProviderUnavailableError(AiClientError):
+    """Raised when the provider circuit is open or its half-open probe is taken — try the next one."""
 
-def is_ai_configured() -> bool:
-    """Return True if AI client is configured and ready."""
 
-    return _client is not None
+# --- Providers ----------------------------------------------------------------------
+
+MODEL_HINTS = ("chat", "extract", "summary")
+
+# Бюджет контекста (промпт + ответ) по назначению, в токенах;
+# переопределяется AI_CONTEXT_TOKENS_<HINT>, напр. AI_CONTEXT_TOKENS_CHAT=16000
+_DEFAULT_CONTEXT_TOKENS = {"chat": 8000, "extract": 4000, "summary": 8000}
+CONTEXT_TOKENS = {
+    hint: int(os.getenv(f"AI_CONTEXT_TOKENS_{hint.upper()}", str(default)))
+    for hint, default in _DEFAULT_CONTEXT_TOKENS.items()
+}
+
+# HTTP/2 включаем, только если установлен пакет h2 (httpx[http2])
+_HTTP2 = importlib.util.find_spec("h2") is not None
+
+
+# Circuit breaker: после N ошибок подряд провайдер выключается на cooldown секунд
+CIRCUIT_FAILURES = int(os.getenv("AI_CIRCUIT_FAILURES", "3"))
+CIRCUIT_COOLDOWN_SECONDS = float(os.getenv("AI_CIRCUIT_COOLDOWN", "30"))
+
+# Hedged-режим: если основной провайдер не ответил за свой p-й перцентиль латентности,
+# параллельно запускаем следующий и берём первый успешный ответ
+HEDGE_ENABLED = os.getenv("AI_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", "90"))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("AI_HEDGE_DELAY", "8"))
+
+# Результат ProviderHealth.claim_probe
+PROBE_CLOSED = "closed"    # circuit закрыт — запрос идёт как обычно
+PROBE_GRANTED = "granted"  # half-open: этот запрос — пробный
+PROBE_DENIED = "denied"    # circuit открыт или проба уже занята — провайдера пропускаем
 
+# Просить у OpenAI-совместимых провайдеров usage в последнем куске потока
+STREAM_USAGE = os.getenv("AI_STREAM_USAGE", "1") == "1"
 
-def _select_model(model_hint: Optional[str] = None) -> str:
+
+@dataclass
+class ProviderHealth:
     """
-    Выбор модели по назначению.
-    model_hint: chat (диалог), extract (команды), summary (сжатие истории).
-    Можно задать AI_MODEL (общий) или AI_MODEL_CHAT, AI_MODEL_EXTRACT, AI_MODEL_SUMMARY.
+    Здоровье провайдера: латентность последних вызовов, доля ошибок, состояние circuit breaker.
+
+    Closed — запросы идут; open — провайдер пропускается до open_until;
+    после cooldown — half-open: пропускаем один пробный запрос. Проба
+    занимается при реальной отправке (claim_probe), а не при сборке цепочки:
+    провайдер, до которого очередь не дошла, остаётся доступным.
     """
-    hint_map = {
-        "chat": os.getenv("AI_MODEL_CHAT") or os.getenv("AI_MODEL"),
-        "extract": os.getenv("AI_MODEL_EXTRACT") or os.getenv("AI_MODEL"),
-        "summary": os.getenv("AI_MODEL_SUMMARY") or os.getenv("AI_MODEL"),
-    }
-    if model_hint and hint_map.get(model_hint):
-        return hint_map[model_hint]
 
-    env_model = os.getenv("AI_MODEL")
-    if env_model:
-        return env_model
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=200))
+    ewma_latency: Optional[float] = None
+    error_rate: float = 0.0
+    consecutive_failures: int = 0
+    open_until: float = 0.0
+    half_open_probe: bool = False
+
+    def available(self, now: Optional[float] = None) -> bool:
+        """Можно ли ставить провайдера в цепочку (состояние не меняет)."""
+        now = time.monotonic() if now is None else now
+        if self.consecutive_failures < CIRCUIT_FAILURES:
+            return True
+        # half-open: доступен, пока пробный запрос никто не занял
+        return now >= self.open_until and not self.half_open_probe
+
+    def claim_probe(self, now: Optional[float] = None) -> str:
+        """
+        Вызывается перед отправкой запроса (после очереди допуска).
+
+        PROBE_CLOSED — circuit закрыт, отправляем. PROBE_GRANTED — half-open,
+        запрос занял пробу: вызывающий обязан вызвать release_probe() в finally
+        (на случай отмены, без record_*). PROBE_DENIED — circuit открыт или
+        пробу уже занял другой запрос: провайдера нужно пропустить.
+        """
+        now = time.monotonic() if now is None else now
+        if self.consecutive_failures < CIRCUIT_FAILURES:
+            return PROBE_CLOSED
+        if now < self.open_until or self.half_open_probe:
+            return PROBE_DENIED
+        self.half_open_probe = True
+        return PROBE_GRANTED
+
+    def release_probe(self) -> None:
+        self.half_open_probe = False
+
+    def record_success(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self.ewma_latency = latency if self.ewma_latency is None else 0.8 * self.ewma_latency + 0.2 * latency
+        self.error_rate *= 0.8
+        self.consecutive_failures = 0
+        self.half_open_probe = False
+
+    def record_failure(self) -> None:
+        self.error_rate = 0.8 * self.error_rate + 0.2
+        self.consecutive_failures += 1
+        self.half_open_probe = False
+        if self.consecutive_failures >= CIRCUIT_FAILURES:
+            self.open_until = time.monotonic() + CIRCUIT_COOLDOWN_SECONDS
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        idx = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[idx]
+
+    def score(self, priority: int) -> float:
+        """Чем меньше, тем лучше: латентность с штрафом за ошибки и за позицию в конфиге."""
+        latency = self.ewma_latency if self.ewma_latency is not None else 1.0
+        return latency * (1 + 4 * self.error_rate) * (1 + 0.25 * priority)
+
+# --- Admission: конкурентность, rate shaping, приоритеты -----------------------------
+
+# Приоритет по назначению: интерактивный чат раньше фоновых summary / memory
+HINT_PRIORITY = {"chat": 0, "extract": 0, "summary": 10}
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("AI_QUEUE_TIMEOUT", "60"))
+# Дольше этого ждать Retry-After в рамках одного запроса не будем
+MAX_RETRY_AFTER_SECONDS = float(os.getenv("AI_MAX_RETRY_AFTER", "10"))
+
+
+def _provider_env(name: str, key: str, default: str) -> str:
+    """AI_<KEY>_<PROVIDER> с фолбэком на общий AI_<KEY>."""
+    return os.getenv(f"AI_{key}_{name.upper()}") or os.getenv(f"AI_{key}") or default
+
+
+class PriorityLimiter:
+    """Семафор с очередью по приоритету (меньше — раньше), FIFO внутри приоритета."""
+
+    def __init__(self, limit: int) -> None:
+        self._limit = max(1, limit)
+        self._active = 0
+        self._waiters: List[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def depth(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    async def acquire(self, priority: int) -> None:
+        if self._active < self._limit and not self.depth:
+            self._active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # слот уже выдан, но ожидающий отменён — возвращаем
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._active -= 1
+
+
+class TokenBucket:
+    """Token bucket на минуту (RPM / TPM). rate_per_minute <= 0 — без ограничения."""
+
+    def __init__(self, rate_per_minute: float) -> None:
+        self.rate = rate_per_minute
+        self._tokens = rate_per_minute
+        self._updated = time.monotonic()
+
+    async def take(self, amount: float) -> None:
+        if self.rate <= 0:
+            return
+        # Запрос больше ёмкости ждёт полного ведра, иначе не пройдёт никогда
+        amount = min(amount, self.rate)
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / 60.0)
+            self._updated = now
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return
+            await asyncio.sleep((amount - self._tokens) * 60.0 / self.rate)
+
+
+@dataclass
+class ProviderAdmission:
+    """
+    Допуск запросов к провайдеру: семафор с приоритетами, RPM/TPM token buckets
+    и пауза по Retry-After после 429.
+    """
+
+    limiter: PriorityLimiter
+    rpm: TokenBucket
+    tpm: TokenBucket
+    cooldown_until: float = 0.0
+    rate_limited_count: int = 0
+    consecutive_429: int = 0
+    waits: Deque[float] = field(default_factory=lambda: deque(maxlen=500))
+
+    @classmethod
+    def from_env(cls, name: str) -> "ProviderAdmission":
+        return cls(
+            limiter=PriorityLimiter(int(_provider_env(name, "MAX_CONCURRENCY", "4"))),
+            rpm=TokenBucket(float(_provider_env(name, "RPM", "0"))),
+            tpm=TokenBucket(float(_provider_env(name, "TPM", "0"))),
+        )
+
+    def cooling_down(self, now: Optional[float] = None) -> bool:
+        return (time.monotonic() if now is None else now) < self.cooldown_until
+
+    def note_rate_limited(self, retry_after: Optional[float]) -> float:
+        """Запомнить 429; без Retry-After — экспоненциальный backoff. Возвращает паузу."""
+        self.rate_limited_count += 1
+        self.consecutive_429 += 1
+        delay = retry_after if retry_after is not None else min(30.0, 2.0 ** self.consecutive_429)
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + delay)
+        return delay
+
+    def note_success(self) -> None:
+        self.consecutive_429 = 0
+
+    @asynccontextmanager
+    async def slot(self, priority: int, tokens: int):
+        started = time.monotonic()
+
+        async def _admit() -> None:
+            await self.limiter.acquire(priority)
+            try:
+                pause = self.cooldown_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                await self.rpm.take(1)
+                await self.tpm.take(tokens)
+            except BaseException:
+                self.limiter.release()
+                raise
+
+        try:
+            await asyncio.wait_for(_admit(), timeout=QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise AiRateLimitedError("AI admission queue timeout") from None
+        self.waits.append(time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self.limiter.release()
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self.waits)
+
+        def _pct(p: float) -> Optional[float]:
+            if not waits:
+                return None
+            return round(waits[min(len(waits) - 1, int(len(waits) * p / 100))], 4)
+
+        return {
+            "in_flight": self.limiter.active,
+            "queue_depth": self.limiter.depth,
+            "wait_p50": _pct(50),
+            "wait_p95": _pct(95),
+            "wait_max": round(waits[-1], 4) if waits else None,
+            "rate_limited": self.rate_limited_count,
+            "cooldown_seconds": round(max(0.0, self.cooldown_until - time.monotonic()), 2),
+        }
+
+
+def _estimate_request_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> int:
+    """Грубая оценка токенов запроса для TPM: текст сообщений плюс лимит ответа."""
+    return sum(estimate_tokens(str(m.get("content") or "")) for m in messages) + max_tokens
+
+
+def _retry_after_seconds(e: Exception) -> Optional[float]:
+    """Retry-After из ответа провайдера (секунды или HTTP-дата)."""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class Provider:
+    """
+    Один LLM-провайдер: адрес, ключ, модели по назначению и долгоживущий пул соединений.
+
+    kind: "openai" — OpenAI-совместимый API (OpenRouter, vsellm, Google),
+    "yandex" — нативный Yandex Foundation Models API.
+    """
+
+    name: str
+    kind: str
+    base_url: str
+    api_key: str
+    models: Dict[str, str]
+    headers: Dict[str, str] = field(default_factory=dict)
+    folder_id: Optional[str] = None
+    http: Optional[httpx.AsyncClient] = None
+    client: Optional[AsyncOpenAI] = None
+    health: ProviderHealth = field(default_factory=ProviderHealth)
+    admission: Optional[ProviderAdmission] = None
+
+    def __post_init__(self) -> None:
+        if self.admission is None:
+            self.admission = ProviderAdmission.from_env(self.name)
+
+    def model_for(self, model_hint: Optional[str]) -> str:
+        return self.models.get(model_hint or "chat") or self.models["chat"]
+
+
+def _model_map(default_model: str, *, use_env: bool) -> Dict[str, str]:
+    """
+    Модели по назначению: chat (диалог), extract (команды), summary (сжатие истории).
+    Для основного провайдера учитываются AI_MODEL и AI_MODEL_CHAT / _EXTRACT / _SUMMARY.
+    """
+    base = (os.getenv("AI_MODEL") if use_env else None) or default_model
+    models = {}
+    for hint in MODEL_HINTS:
+        override = os.getenv(f"AI_MODEL_{hint.upper()}") if use_env else None
+        models[hint] = override or base
+    return models
+
+
+def _discover_providers() -> List[Provider]:
+    """
+    Провайдеры из окружения в порядке приоритета: OpenRouter, vsellm, Google, Yandex.
+    Первый в списке — основной; AI_MODEL* относятся к нему.
+    Адреса переопределяются *_BASE_URL (например, на benchmarks/fake_llm.py для нагрузочных тестов).
+    """
+    found: List[Dict[str, Any]] = []
+    if os.getenv("OPENROUTER_API_KEY"):
+        found.append({
+            "name": "openrouter",
+            "kind": "openai",
+            "base_url": os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
+            "api_key": os.getenv("OPENROUTER_API_KEY"),
+            "default_model": "google/gemma-3-4b-it:free",
+            # Для OpenRouter нужны дополнительные заголовки
+            "headers": {
+                "HTTP-Referer": "https://tghub.duckdns.org",
+                "X-Title": "YouHub",
+            },
+        })
+    if os.getenv("VSELM_API_KEY"):
+        found.append({
+            "name": "vsellm",
+            "kind": "openai",
+            "base_url": os.getenv("VSELM_BASE_URL", "https://api.vsellm.ru/v1"),
+            "api_key": os.getenv("VSELM_API_KEY"),
+            "default_model": "gpt-3.5-turbo",
+        })
+    if os.getenv("GOOGLE_API_KEY"):
+        found.append({
+            "name": "google",
+            "kind": "openai",
+            "base_url": os.getenv(
+                "GOOGLE_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/openai/"
+            ),
+            "api_key": os.getenv("GOOGLE_API_KEY"),
+            "default_model": "gemini-pro",
+        })
+    # Yandex: Api-Key (секретный ключ) + folder id. Идентификатор ключа в запросах не используется.
+    if os.getenv("YANDEX_API_KEY") and os.getenv("YANDEX_FOLDER_ID"):
+        found.append({
+            "name": "yandex",
+            "kind": "yandex",
+            "base_url": os.getenv("YANDEX_BASE_URL", "https://llm.api.cloud.yandex.net"),
+            "api_key": os.getenv("YANDEX_API_KEY"),
+            "default_model": "yandexgpt-lite/latest",
+            "folder_id": os.getenv("YANDEX_FOLDER_ID"),
+        })
+
+    providers = []
+    for i, cfg in enumerate(found):
+        default_model = cfg.pop("default_model")
+        providers.append(Provider(models=_model_map(default_model, use_env=(i == 0)), **cfg))
+    return providers
 
-    if _base_url and "openrouter.ai" in _base_url:
-        return "google/gemma-3-4b-it:free"
-    if _base_url and "vsellm.ru" in _base_url:
-        return "gpt-3.5-turbo"
-    if _base_url and "google" in _base_url.lower():
-        return "gemini-pro"
-    if _base_url == "yandex":
-        return os.getenv("AI_MODEL", "yandexgpt-lite/latest")
-    return "gpt-3.5-turbo"
 
+class ProviderRegistry:
+    """
+    Реестр провайдеров с пулами соединений.
+
+    Окружение читается один раз при создании; клиенты создаются в start()
+    (старт приложения) и закрываются в close(), чтобы повторные запросы
+    шли по уже установленным TCP/TLS-соединениям.
+    """
+
+    def __init__(self, providers: List[Provider]) -> None:
+        self.providers = providers
+        self._started = False
+
+    @property
+    def primary(self) -> Optional[Provider]:
+        return self.providers[0] if self.providers else None
+
+    def failover_chain(self) -> List[Provider]:
+        """
+        Порядок попыток: доступные провайдеры по health score. Провайдеры с открытым
+        circuit breaker или паузой по Retry-After пропускаются (если выключены все —
+        возвращаем всех по порядку: пауза по Retry-After ждётся в очереди допуска,
+        а открытый circuit отсекает claim_probe).
+        """
+        now = time.monotonic()
+        ranked = sorted(
+            enumerate(self.providers),
+            key=lambda item: item[1].health.score(item[0]),
+        )
+        available = [
+            p for _, p in ranked
+            if not p.admission.cooling_down(now) and p.health.available(now)
+        ]
+        return available or [p for _, p in ranked]
+
+    def start(self) -> None:
+        if self._started:
+            return
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("AI_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("AI_MAX_KEEPALIVE", "10")),
+            keepalive_expiry=60.0,
+        )
+        for p in self.providers:
+            p.http = httpx.AsyncClient(
+                http2=_HTTP2,
+                limits=limits,
+                timeout=120.0,  # Увеличен таймаут для бесплатных моделей
+            )
+            if p.kind == "openai":
+                p.client = AsyncOpenAI(
+                    api_key=p.api_key,
+                    base_url=p.base_url,
+                    timeout=120.0,
+                    default_headers=p.headers or None,
+                    http_client=p.http,
+                    # Повторы и переключение провайдеров — в chat(), не внутри SDK
+                    max_retries=0,
+                )
+        self._started = True
+
+    async def close(self) -> None:
+        for p in self.providers:
+            if p.http is not None:
+                await p.http.aclose()
+            p.http = None
+            p.client = None
+        self._started = False
+
+
+_registry: Optional[ProviderRegistry] = None
+
+
+def get_registry() -> ProviderRegistry:
+    """Реестр провайдеров (создаётся лениво, если приложение не вызвало start_ai_clients)."""
+    global _registry
+    if _registry is None:
+        _registry = ProviderRegistry(_discover_providers())
+    return _registry
+
+
+async def start_ai_clients() -> None:
+    """Прочитать конфигурацию и открыть пулы соединений (вызывается на старте API)."""
+    global _registry
+    if _registry is not None:
+        await _registry.close()
+    _registry = ProviderRegistry(_discover_providers())
+    _registry.start()
+
+
+async def close_ai_clients() -> None:
+    """Закрыть пулы соединений (вызывается при остановке API)."""
+    if _registry is not None:
+        await _registry.close()
+
+
+def is_ai_configured() -> bool:
+    """Return True if AI client is configured and ready."""
+
+    return get_registry().primary is not None
+
+
+def resolve_model(model_hint: Optional[str] = None) -> str:
+    """Модель основного провайдера для назначения (chat / extract / summary)."""
+    primary = get_registry().primary
+    if primary is None:
+        raise AiNotConfiguredError("AI client is not configured")
+    return primary.model_for(model_hint)
+
+
+def context_tokens(model_hint: Optional[str] = None) -> int:
+    """Сколько токенов (промпт + ответ) можно отдать модели для назначения."""
+    return CONTEXT_TOKENS.get(model_hint or "chat", CONTEXT_TOKENS["chat"])
+
+
+def _failover_chain() -> List[Provider]:
+    registry = get_registry()
+    if registry.primary is None:
+        raise AiNotConfiguredError("AI client is not configured")
+    registry.start()
+    return registry.failover_chain()
+
+
+def provider_health() -> List[Dict[str, Any]]:
+    """Снимок здоровья провайдеров (для диагностики)."""
+    now = time.monotonic()
+    return [
+        {
+            "provider": p.name,
+            "ewma_latency": p.health.ewma_latency,
+            "p95_latency": p.health.latency_percentile(95),
+            "error_rate": round(p.health.error_rate, 3),
+            "consecutive_failures": p.health.consecutive_failures,
+            "circuit_open": p.health.consecutive_failures >= CIRCUIT_FAILURES and now < p.health.open_until,
+        }
+        for p in get_registry().providers
+    ]
+
+
+def admission_stats() -> Dict[str, Dict[str, Any]]:
+    """Метрики допуска по провайдерам: очередь, ожидание, in-flight, 429."""
+    return {p.name: p.admission.stats() for p in get_registry().providers}
+
+
+def _status_code(e: Exception) -> Optional[int]:
+    if isinstance(e, APIStatusError):
+        return e.status_code
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code
+    return None
+
+
+def _is_transient(e: Exception) -> bool:
+    """Сетевые ошибки, таймауты, 429 и 5xx — имеет смысл повторить."""
+    if isinstance(e, (APIConnectionError, APITimeoutError, httpx.TransportError, ConnectionError)):
+        return True
+    status = _status_code(e)
+    return status is not None and (status == 429 or status >= 500)
+
+
+# --- Yandex Foundation Models -------------------------------------------------------
 
 def _yandex_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
     """Преобразовать сообщения в формат Yandex Foundation Models (role + text)."""
@@ -114,35 +607,75 @@ def _yandex_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
     return out
 
 
-async def _chat_yandex(
+def _yandex_request(
+    provider: Provider,
     messages: List[Dict[str, Any]],
     model: str,
     max_tokens: int,
     temperature: float,
-) -> str:
-    """Запрос к Yandex Foundation Models API (Api-Key + x-folder-id)."""
-    url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
-    folder_id = os.getenv("YANDEX_FOLDER_ID")
-    api_key = os.getenv("YANDEX_API_KEY")
+    stream: bool,
+) -> tuple[str, Dict[str, str], Dict[str, Any]]:
+    """URL, заголовки и тело запроса к Yandex Foundation Models API."""
+    url = provider.base_url.rstrip("/") + "/foundationModels/v1/completion"
     headers = {
         "Content-Type": "application/json",
-        "Authorization": f"Api-Key {api_key}",
-        "x-folder-id": folder_id,
+        "Authorization": f"Api-Key {provider.api_key}",
+        "x-folder-id": provider.folder_id or "",
         "x-data-logging-enabled": "false",
     }
     payload = {
-        "modelUri": f"gpt://{folder_id}/{model}",
+        "modelUri": f"gpt://{provider.folder_id}/{model}",
         "completionOptions": {
-            "stream": False,
+            "stream": stream,
             "temperature": temperature,
             "maxTokens": max_tokens,
         },
         "messages": _yandex_messages(messages),
     }
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        resp = await client.post(url, headers=headers, json=payload)
-        resp.raise_for_status()
-        data = resp.json()
+    return url, headers, payload
+
+
+def _yandex_usage(data: Dict[str, Any], usage: ai_usage.Usage) -> None:
+    """result.usage Yandex: числа приходят строками (inputTextTokens, completionTokens)."""
+    raw = data.get("result", {}).get("usage") or {}
+    try:
+        if "inputTextTokens" in raw:
+            usage.prompt_tokens = int(raw["inputTextTokens"])
+        if "completionTokens" in raw:
+            usage.completion_tokens = int(raw["completionTokens"])
+    except (TypeError, ValueError):
+        pass
+
+
+def _openai_usage(raw: Any, usage: ai_usage.Usage) -> None:
+    """usage OpenAI-совместимого ответа (объект или dict в куске потока)."""
+    if raw is None:
+        return
+    if not isinstance(raw, dict):
+        raw = {"prompt_tokens": getattr(raw, "prompt_tokens", None),
+               "completion_tokens": getattr(raw, "completion_tokens", None)}
+    if raw.get("prompt_tokens") is not None:
+        usage.prompt_tokens = int(raw["prompt_tokens"])
+    if raw.get("completion_tokens") is not None:
+        usage.completion_tokens = int(raw["completion_tokens"])
+
+
+async def _chat_yandex(
+    provider: Provider,
+    messages: List[Dict[str, Any]],
+    model: str,
+    max_tokens: int,
+    temperature: float,
+    usage: ai_usage.Usage,
+) -> str:
+    """Запрос к Yandex Foundation Models API (Api-Key + x-folder-id)."""
+    url, headers, payload = _yandex_request(
+        provider, messages, model, max_tokens, temperature, stream=False
+    )
+    resp = await provider.http.post(url, headers=headers, json=payload)
+    resp.raise_for_status()
+    data = resp.json()
+    _yandex_usage(data, usage)
     alternatives = data.get("result", {}).get("alternatives", [])
     if not alternatives:
         return ""
@@ -150,53 +683,363 @@ async def _chat_yandex(
     return (msg.get("text") or "").strip()
 
 
+async def _chat_yandex_stream(
+    provider: Provider,
+    messages: List[Dict[str, Any]],
+    model: str,
+    max_tokens: int,
+    temperature: float,
+    usage: ai_usage.Usage,
+) -> AsyncIterator[str]:
+    """
+    Потоковый запрос к Yandex Foundation Models API.
+
+    Yandex присылает JSON-строки с накопленным текстом альтернативы
+    (и накопленным usage); наружу отдаём только прирост.
+    """
+    url, headers, payload = _yandex_request(
+        provider, messages, model, max_tokens, temperature, stream=True
+    )
+    sent = ""
+    async with provider.http.stream("POST", url, headers=headers, json=payload) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            _yandex_usage(data, usage)
+            alternatives = data.get("result", {}).get("alternatives", [])
+            if not alternatives:
+                continue
+            text = alternatives[0].get("message", {}).get("text") or ""
+            if len(text) > len(sent):
+                yield text[len(sent):]
+                sent = text
+
+
+# --- Public interface ---------------------------------------------------------------
+
+async def _call_provider(
+    provider: Provider,
+    messages: List[Dict[str, Any]],
+    model_hint: Optional[str],
+    max_tokens: int,
+    temperature: float,
+    priority: int,
+    purpose: Optional[str] = None,
+) -> str:
+    """Один запрос к одному провайдеру: допуск (очередь, лимиты), здоровье, 429, учёт."""
+    model = provider.model_for(model_hint)
+    tokens = _estimate_request_tokens(messages, max_tokens)
+    attempt = _CallAttempt(provider, model, model_hint, messages, stream=False, purpose=purpose)
+    probe = PROBE_CLOSED
+    try:
+        async with provider.admission.slot(priority, tokens):
+            probe = provider.health.claim_probe()
+            if probe == PROBE_DENIED:
+                # Пока ждали в очереди, circuit открылся или пробу занял другой запрос
+                raise AiProviderUnavailableError(f"AI provider {provider.name} circuit is open")
+            attempt.begin()
+            try:
+                if provider.kind == "yandex":
+                    text = await _chat_yandex(
+                        provider, messages, model, max_tokens=max_tokens, temperature=temperature,
+                        usage=attempt.usage,
+                    )
+                else:
+                    response = await provider.client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                    )
+                    _openai_usage(response.usage, attempt.usage)
+                    text = (response.choices[0].message.content or "").strip()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                _note_failure(provider, e)
+                raise
+        attempt.text = text
+        provider.health.record_success(attempt.latency())
+        provider.admission.note_success()
+        attempt.outcome = "ok"
+        return text
+    except BaseException as e:
+        attempt.outcome = _outcome(e)
+        raise
+    finally:
+        if probe == PROBE_GRANTED:
+            provider.health.release_probe()
+        if probe != PROBE_DENIED:
+            attempt.record()
+
+
+class _CallAttempt:
+    """Одна попытка вызова провайдера — для учёта в ai_usage."""
+
+    def __init__(
+        self,
+        provider: Provider,
+        model: str,
+        model_hint: Optional[str],
+        messages: List[Dict[str, Any]],
+        *,
+        stream: bool,
+        purpose: Optional[str] = None,
+    ) -> None:
+        self.provider = provider
+        self.model = model
+        self.model_hint = model_hint
+        self.purpose = purpose
+        self.messages = messages
+        self.stream = stream
+        self.usage = ai_usage.Usage()
+        self.text = ""
+        self.outcome = "error"
+        self.queued = time.monotonic()
+        self.started: Optional[float] = None
+
+    def begin(self) -> None:
+        """Допуск получен — дальше время ответа провайдера."""
+        self.started = time.monotonic()
+
+    def latency(self) -> float:
+        return time.monotonic() - self.started if self.started is not None else 0.0
+
+    def record(self) -> None:
+        started = self.started if self.started is not None else time.monotonic()
+        ai_usage.record_call(
+            model_hint=self.model_hint,
+            purpose=self.purpose,
+            provider=self.provider.name,
+            model=self.model,
+            usage=self.usage,
+            estimated_prompt_tokens=_estimate_request_tokens(self.messages, 0),
+            estimated_completion_tokens=estimate_tokens(self.text),
+            latency=self.latency(),
+            queue_wait=started - self.queued,
+            outcome=self.outcome,
+            stream=self.stream,
+        )
+
+
+def _outcome(e: BaseException) -> str:
+    """Исход неудачной попытки для статистики."""
+    if isinstance(e, (asyncio.CancelledError, GeneratorExit)):
+        return "cancelled"
+    if isinstance(e, AiRateLimitedError):
+        return "queue_timeout"
+    if _status_code(e) == 429:
+        return "rate_limited"
+    return "error"
+
+
+def _note_failure(provider: Provider, e: Exception) -> None:
+    """429 — пауза провайдера по Retry-After (не поломка); остальное — в circuit breaker."""
+    if _status_code(e) == 429:
+        delay = provider.admission.note_rate_limited(_retry_after_seconds(e))
+        logger.warning("AI provider %s rate limited, cooling down %.1fs", provider.name, delay)
+        return
+    provider.health.record_failure()
+
+
+async def _hedged(
+    first: Provider,
+    second: Provider,
+    call: Callable[[Provider], Awaitable[str]],
+) -> str:
+    """
+    Hedged-запрос: второй провайдер стартует, если первый не уложился в свой
+    HEDGE_PERCENTILE латентности. Возвращается первый успешный ответ, второй отменяется.
+    """
+    delay = first.health.latency_percentile(HEDGE_PERCENTILE) or HEDGE_DEFAULT_DELAY_SECONDS
+    first_task = asyncio.ensure_future(call(first))
+    try:
+        done, _ = await asyncio.wait({first_task}, timeout=delay)
+    except BaseException:
+        # Вызывающего отменили во время ожидания — первый вызов не должен держать слот
+        first_task.cancel()
+        raise
+    if done:
+        if first_task.exception() is None:
+            return first_task.result()
+        # Первый упал быстро — хеджировать нечего, просто переходим ко второму
+        logger.warning("AI provider %s failed: %s", first.name, first_task.exception())
+        return await call(second)
+
+    logger.info("AI hedge: %s slower than %.1fs, starting %s", first.name, delay, second.name)
+    pending = {first_task, asyncio.ensure_future(call(second))}
+    last_error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+    assert last_error is not None
+    raise last_error
+
+
 async def chat(
     messages: List[Dict[str, str]],
     model_hint: Optional[str] = None,
     *,
     max_tokens: int = 400,
     temperature: float = 0.4,
+    priority: Optional[int] = None,
+    purpose: Optional[str] = None,
 ) -> str:
     """
-    Выполнить чат-запрос к ИИ. Retry 1 раз при сетевых ошибках.
+    Выполнить чат-запрос к ИИ.
+
+    Провайдеры пробуются по цепочке failover (health score + circuit breaker).
+    Если настроен один провайдер — retry 1 раз при временных ошибках
+    (после 429 — с паузой по Retry-After, если она не больше AI_MAX_RETRY_AFTER).
+    В hedged-режиме (AI_HEDGE=1) медленный первый провайдер дублируется вторым.
+    priority — место в очереди допуска; по умолчанию по model_hint.
+    purpose — метка вызова для учёта (chat / extract / person / summary / memory),
+    по умолчанию model_hint: модель выбирается по hint, статистика — по purpose.
     """
-    if _client is None:
-        raise AiNotConfiguredError("AI client is not configured")
+    chain = _failover_chain()
+    if priority is None:
+        priority = HINT_PRIORITY.get(model_hint or "chat", 0)
+
+    async def call(provider: Provider) -> str:
+        return await _call_provider(
+            provider, messages, model_hint, max_tokens, temperature, priority, purpose
+        )
+
+    last_error: Optional[BaseException] = None
+    start = 0
+    if HEDGE_ENABLED and len(chain) >= 2:
+        try:
+            return await _hedged(chain[0], chain[1], call)
+        except Exception as e:
+            last_error = e
+            start = 2
 
-    model = _select_model(model_hint)
-    last_error = None
+    for provider in chain[start:]:
+        try:
+            return await call(provider)
+        except Exception as e:
+            last_error = e
+            logger.warning("AI provider %s failed: %s", provider.name, e)
 
-    if _client == "yandex":
-        for attempt in range(2):
+    if len(chain) == 1 and last_error is not None and _is_transient(last_error):
+        provider = chain[0]
+        rate_limited = _status_code(last_error) == 429
+        pause = provider.admission.cooldown_until - time.monotonic() if rate_limited else 1.0
+        if pause <= MAX_RETRY_AFTER_SECONDS:
+            await asyncio.sleep(max(0.0, pause))
             try:
-                return await _chat_yandex(
-                    messages, model, max_tokens=max_tokens, temperature=temperature
-                )
-            except (httpx.HTTPError, httpx.RequestError, ConnectionError) as e:
+                return await call(provider)
+            except Exception as e:
                 last_error = e
-                if attempt < 1:
-                    await asyncio.sleep(1.0)
-                    continue
-                raise last_error
-        assert last_error is not None
-        raise last_error
 
-    for attempt in range(2):
+    assert last_error is not None
+    if _status_code(last_error) == 429:
+        raise AiRateLimitedError(str(last_error)) from last_error
+    raise last_error
+
+
+async def chat_stream(
+    messages: List[Dict[str, str]],
+    model_hint: Optional[str] = None,
+    *,
+    max_tokens: int = 400,
+    temperature: float = 0.4,
+    priority: Optional[int] = None,
+    purpose: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Потоковый чат-запрос: отдаёт куски ответа по мере генерации.
+
+    Переключение на следующий провайдер — только до первого куска:
+    после него повтор запроса продублировал бы текст.
+    """
+    if priority is None:
+        priority = HINT_PRIORITY.get(model_hint or "chat", 0)
+    tokens = _estimate_request_tokens(messages, max_tokens)
+    last_error: Optional[BaseException] = None
+    for provider in _failover_chain():
+        model = provider.model_for(model_hint)
+        attempt = _CallAttempt(provider, model, model_hint, messages, stream=True, purpose=purpose)
+        probe = PROBE_CLOSED
         try:
-            response = await _client.chat.completions.create(
-                model=model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature,
-            )
-            content = response.choices[0].message.content or ""
-            return content.strip()
-        except (APIConnectionError, APITimeoutError, ConnectionError) as e:
-            last_error = e
-            if attempt < 1:
-                await asyncio.sleep(1.0)
-                continue
-            raise last_error
+            async with provider.admission.slot(priority, tokens):
+                probe = provider.health.claim_probe()
+                if probe == PROBE_DENIED:
+                    last_error = AiProviderUnavailableError(f"AI provider {provider.name} circuit is open")
+                    logger.warning("AI provider %s skipped: circuit is open", provider.name)
+                    continue
+                attempt.begin()
+                try:
+                    if provider.kind == "yandex":
+                        stream = _chat_yandex_stream(
+                            provider, messages, model, max_tokens=max_tokens, temperature=temperature,
+                            usage=attempt.usage,
+                        )
+                    else:
+                        stream = _openai_stream(
+                            provider, messages, model, max_tokens, temperature, attempt.usage
+                        )
+                    async for delta in stream:
+                        attempt.text += delta
+                        yield delta
+                except (asyncio.CancelledError, GeneratorExit):
+                    raise
+                except Exception as e:
+                    _note_failure(provider, e)
+                    if attempt.text:
+                        raise
+                    last_error = e
+                    attempt.outcome = _outcome(e)
+                    logger.warning("AI provider %s stream failed: %s", provider.name, e)
+                    continue
+            provider.health.record_success(attempt.latency())
+            provider.admission.note_success()
+            attempt.outcome = "ok"
+            return
+        except BaseException as e:
+            attempt.outcome = _outcome(e)
+            raise
+        finally:
+            if probe == PROBE_GRANTED:
+                provider.health.release_probe()
+            if probe != PROBE_DENIED:
+                attempt.record()
     assert last_error is not None
+    if _status_code(last_error) == 429:
+        raise AiRateLimitedError(str(last_error)) from last_error
     raise last_error
 
+
+async def _openai_stream(
+    provider: Provider,
+    messages: List[Dict[str, Any]],
+    model: str,
+    max_tokens: int,
+    temperature: float,
+    usage: ai_usage.Usage,
+) -> AsyncIterator[str]:
+    stream = await provider.client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream=True,
+        # usage приходит последним куском без choices
+        extra_body={"stream_options": {"include_usage": True}} if STREAM_USAGE else None,
+    )
+    async for chunk in stream:
+        _openai_usage(getattr(chunk, "usage", None), usage)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
@@ -0,0 +1,226 @@
+"""
+Учёт вызовов LLM: токены, задержка, провайдер, модель, назначение и исход.
+
+ai_client записывает каждую попытку (в том числе неудачные и отменённые
+hedge-дубли) через record_call(). Записи копятся в памяти и периодически
+(AI_STATS_FLUSH_SECONDS) пачкой пишутся в таблицу ai_calls; по ней
+/api/admin/ai-stats считает p50/p95 задержки и токены по пользователям,
+назначениям модели (model_hint: chat / extract / summary) и видам вызова
+(purpose): chat — ответ в чате, extract — команда из фразы, person —
+контакт из фразы, summary — сжатие истории, memory — память агента.
+На одно сообщение чата приходится до четырёх вызовов, и by_purpose
+показывает, какой из них дороже.
+
+Пользователь берётся из contextvar: его выставляет обработчик чата
+(set_current_user), вызовы ИИ внутри запроса наследуют значение. Так же
+берётся сквозной id запроса (telemetry.correlation) — по нему вызовы
+склеиваются с логами бота и API.
+Если провайдер не вернул usage (часть потоковых ответов), токены оцениваются
+по длине текста и запись помечается usage_estimated.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import astuple, dataclass, fields
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import aiosqlite
+
+from telemetry import correlation
+
+logger = logging.getLogger(__name__)
+
+DATABASE = "data/hub.db"
+
+AI_STATS_FLUSH_SECONDS = float(os.getenv("AI_STATS_FLUSH_SECONDS", "30"))
+# Если БД недоступна, в памяти держим не больше стольких записей
+MAX_PENDING = 10000
+
+_current_user: ContextVar[Optional[str]] = ContextVar("ai_user", default=None)
+
+
+def set_current_user(user_id: Optional[str]) -> None:
+    """Привязать вызовы ИИ текущего запроса к пользователю."""
+    _current_user.set(user_id)
+
+
+def current_user() -> Optional[str]:
+    return _current_user.get()
+
+
+@dataclass
+class Usage:
+    """Токены из ответа провайдера (None — провайдер не сообщил)."""
+
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+@dataclass
+class AiCallRecord:
+    ts: float
+    user_id: Optional[str]
+    model_hint: str
+    provider: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    usage_estimated: int
+    latency_ms: float
+    queue_ms: float
+    outcome: str  # ok / error / rate_limited / queue_timeout / cancelled
+    stream: int
+    purpose: str = "chat"  # chat / extract / person / summary / memory
+    request_id: Optional[str] = None
+
+
+_COLUMNS = [f.name for f in fields(AiCallRecord)]
+
+
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))], 1)
+
+
+def summarize(rows: Iterable[Dict[str, Any]], key: str) -> Dict[str, Dict[str, Any]]:
+    """Группировка записей по полю key: число вызовов, ошибки, p50/p95, токены."""
+    groups: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for row in rows:
+        groups[str(row.get(key) or "—")].append(row)
+    out = {}
+    for name, items in groups.items():
+        ok = [r for r in items if r["outcome"] == "ok"]
+        latencies = [r["latency_ms"] for r in ok]
+        prompt = sum(r["prompt_tokens"] or 0 for r in ok)
+        completion = sum(r["completion_tokens"] or 0 for r in ok)
+        out[name] = {
+            "calls": len(items),
+            "errors": len(items) - len(ok),
+            "latency_p50_ms": _percentile(latencies, 50),
+            "latency_p95_ms": _percentile(latencies, 95),
+            "queue_p95_ms": _percentile([r["queue_ms"] for r in ok], 95),
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "avg_prompt_tokens": round(prompt / len(ok)) if ok else None,
+            "avg_completion_tokens": round(completion / len(ok)) if ok else None,
+        }
+    return out
+
+
+class UsageRecorder:
+    """Буфер записей в памяти + сводные счётчики с момента запуска."""
+
+    def __init__(self) -> None:
+        self._pending: List[AiCallRecord] = []
+        self.totals: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        )
+        self._lock = asyncio.Lock()
+        # Наблюдатели каждой записи (метрики API); исключения не мешают учёту
+        self.listeners: List[Callable[[AiCallRecord], None]] = []
+
+    def record(self, rec: AiCallRecord) -> None:
+        total = self.totals[rec.purpose]
+        total["calls"] += 1
+        if rec.outcome != "ok":
+            total["errors"] += 1
+        total["prompt_tokens"] += rec.prompt_tokens
+        total["completion_tokens"] += rec.completion_tokens
+        self._pending.append(rec)
+        if len(self._pending) > MAX_PENDING:
+            del self._pending[: len(self._pending) - MAX_PENDING]
+        logger.debug(
+            "AI call purpose=%s hint=%s provider=%s model=%s outcome=%s latency=%.0fms tokens=%s/%s",
+            rec.purpose, rec.model_hint, rec.provider, rec.model, rec.outcome, rec.latency_ms,
+            rec.prompt_tokens, rec.completion_tokens,
+        )
+        for listener in self.listeners:
+            try:
+                listener(rec)
+            except Exception:
+                logger.exception("AI usage listener failed")
+
+    async def flush(self, db_path: str = DATABASE) -> int:
+        """Записать накопленное в ai_calls. Возвращает число записей."""
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            placeholders = ", ".join("?" for _ in _COLUMNS)
+            try:
+                async with aiosqlite.connect(db_path) as db:
+                    await db.executemany(
+                        f"INSERT INTO ai_calls ({', '.join(_COLUMNS)}) VALUES ({placeholders})",
+                        [astuple(rec) for rec in batch],
+                    )
+                    await db.commit()
+            except aiosqlite.Error as e:
+                logger.warning("AI usage flush failed: %s", e)
+                self._pending = (batch + self._pending)[-MAX_PENDING:]
+                return 0
+            return len(batch)
+
+    async def run_periodic_flush(self, db_path: str = DATABASE) -> None:
+        """Фоновая задача API: сброс буфера раз в AI_STATS_FLUSH_SECONDS."""
+        while True:
+            await asyncio.sleep(AI_STATS_FLUSH_SECONDS)
+            await self.flush(db_path)
+
+
+recorder = UsageRecorder()
+
+
+def record_call(
+    *,
+    model_hint: Optional[str],
+    purpose: Optional[str] = None,
+    provider: str,
+    model: str,
+    usage: Usage,
+    estimated_prompt_tokens: int,
+    estimated_completion_tokens: int,
+    latency: float,
+    queue_wait: float,
+    outcome: str,
+    stream: bool,
+) -> None:
+    """Записать одну попытку вызова провайдера (вызывается из ai_client)."""
+    estimated = usage.prompt_tokens is None or usage.completion_tokens is None
+    recorder.record(
+        AiCallRecord(
+            ts=time.time(),
+            user_id=current_user(),
+            model_hint=model_hint or "chat",
+            purpose=purpose or model_hint or "chat",
+            provider=provider,
+            model=model,
+            prompt_tokens=usage.prompt_tokens if usage.prompt_tokens is not None else estimated_prompt_tokens,
+            completion_tokens=(
+                usage.completion_tokens if usage.completion_tokens is not None else estimated_completion_tokens
+            ),
+            usage_estimated=int(estimated),
+            latency_ms=round(latency * 1000, 1),
+            queue_ms=round(queue_wait * 1000, 1),
+            outcome=outcome,
+            stream=int(stream),
+            request_id=correlation.current() or None,
+        )
+    )
+
+
+async def load_calls(db_path: str, since: float) -> List[Dict[str, Any]]:
+    """Записи ai_calls начиная с момента since (unix time)."""
+    async with aiosqlite.connect(db_path) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM ai_calls WHERE ts >= ? ORDER BY ts",
+            (since,),
+        )
+        return [dict(row) for row in await cursor.fetchall()]
@@ -0,0 +1,294 @@
+"""
+Иерархическое инкрементальное резюме истории чата.
+
+На пользователя — ровно две строки таблицы chat_summary:
+
+- 'recent' — свежее резюме: сообщения, выпавшие из окна контекста, с момента
+  последнего переноса в долгосрочное;
+- 'long' — долгосрочное резюме: устойчивые факты (люди, цели, договорённости).
+
+У строки 'recent' есть водяной знак (id последнего вошедшего в резюме
+сообщения) и счётчик pending — сколько сообщений добавлено после него.
+Счётчик увеличивает репозиторий истории при записи, поэтому проверка
+«пора ли сжимать» не делает COUNT(*) по истории.
+
+Когда за окном последних `window` сообщений накопилось не меньше `chunk`
+несжатых, в фоне (после ответа пользователю) ИИ дописывает их в 'recent'
+и водяной знак сдвигается. Если 'recent' вырос больше
+CHAT_SUMMARY_RECENT_TOKENS, оно вливается в 'long' и обнуляется.
+Обрезка истории удаляет только сообщения не новее водяного знака.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, List, Set, Tuple
+
+import aiosqlite
+
+from .ai_client import chat as ai_chat, context_tokens
+from .tokens import MESSAGE_OVERHEAD_TOKENS, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DATABASE = "data/hub.db"
+
+CHAT_SUMMARY_RECENT_TOKENS = int(os.getenv("CHAT_SUMMARY_RECENT_TOKENS", "350"))
+FOLD_MAX_TOKENS = 260
+# Сколько резюме держим в памяти процесса
+_CACHE_USERS = 1000
+
+_ROLE_NAMES = {"user": "Пользователь", "assistant": "Ассистент", "system": "Резюме"}
+
+_FOLD_PROMPT = (
+    "Ты ведёшь краткое резюме диалога пользователя с ассистентом.\n"
+    "Обнови резюме с учётом новых сообщений: сохрани важные факты о пользователе, его целях, "
+    "задачах, людях и договорённостях; устаревшее убери.\n"
+    "Не пересказывай каждое сообщение, оставь только то, что может пригодиться в будущем.\n"
+    "Ответь одним абзацем на русском языке."
+)
+
+_PROMOTE_PROMPT = (
+    "Объедини долгосрочное резюме и свежее резюме диалога в одно долгосрочное.\n"
+    "Оставь устойчивые факты (люди, цели, предпочтения, договорённости), убери временное.\n"
+    "Не больше 6 предложений, на русском языке."
+)
+
+
+@dataclass
+class Summaries:
+    """Резюме пользователя по уровням."""
+
+    recent: str = ""
+    long: str = ""
+    watermark_id: int = 0
+
+    def render(self) -> str:
+        """Блок для системного промпта; пустая строка — резюме ещё нет."""
+        parts = [p for p in (self.long, self.recent) if p]
+        if not parts:
+            return ""
+        return "Краткое содержание прошлых разговоров:\n" + "\n".join(parts)
+
+
+def _transcript(rows: List[Tuple[int, str, str]]) -> str:
+    return "\n".join(f"{_ROLE_NAMES.get(role, role)}: {content}" for _, role, content in rows)
+
+
+class ChatSummarizer:
+    """Чтение резюме для промпта и фоновое сжатие истории."""
+
+    def __init__(self, db_path: str = DATABASE, *, chunk: int, window: int, shared: bool = False) -> None:
+        self.db_path = db_path
+        self.chunk = chunk
+        self.window = window
+        # Резюме может сжимать другой процесс (scripts/run_memory_batch.py из системного
+        # cron): кэш сверяется с водяным знаком в БД — каждое сжатие его сдвигает
+        self.shared = shared
+        # user_id -> (эпоха истории, резюме); эпоха меняется при очистке истории
+        self._cache: "OrderedDict[str, Tuple[int, Summaries]]" = OrderedDict()
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        # Попадания в кэш резюме (для /metrics)
+        self.hits = 0
+        self.misses = 0
+        # Вызываются с длительностью каждого фонового сжатия, секунды
+        self.fold_listeners: List[Callable[[float], None]] = []
+
+    def _remember(self, user_id: str, epoch: int, summaries: Summaries) -> None:
+        self._cache[user_id] = (epoch, summaries)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > _CACHE_USERS:
+            self._cache.popitem(last=False)
+
+    async def _watermark(self, db: aiosqlite.Connection, user_id: str) -> int:
+        cursor = await db.execute(
+            "SELECT watermark_id FROM chat_summary WHERE user_id = ? AND level = 'recent'",
+            (user_id,),
+        )
+        row = await cursor.fetchone()
+        return int(row[0] or 0) if row else 0
+
+    async def get(self, user_id: str, epoch: int = 0) -> Summaries:
+        """Резюме пользователя (из памяти; из БД — при первом обращении или после чужого сжатия)."""
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[0] == epoch:
+            fresh = True
+            if self.shared:
+                async with aiosqlite.connect(self.db_path) as db:
+                    fresh = await self._watermark(db, user_id) == cached[1].watermark_id
+            if fresh:
+                self._cache.move_to_end(user_id)
+                self.hits += 1
+                return cached[1]
+        self.misses += 1
+        summaries = Summaries()
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "SELECT level, content, watermark_id FROM chat_summary WHERE user_id = ?",
+                (user_id,),
+            )
+            for level, content, watermark_id in await cursor.fetchall():
+                if level == "recent":
+                    summaries.recent = content or ""
+                    summaries.watermark_id = int(watermark_id or 0)
+                elif level == "long":
+                    summaries.long = content or ""
+        self._remember(user_id, epoch, summaries)
+        return summaries
+
+    def needs_fold(self, pending: int) -> bool:
+        return pending - self.window >= self.chunk
+
+    def maybe_schedule(self, user_id: str, pending: int) -> None:
+        """Запустить сжатие в фоне, если за окном накопилось `chunk` сообщений."""
+        if not self.needs_fold(pending) or user_id in self._running:
+            return
+        self._running.add(user_id)
+        task = asyncio.create_task(self._fold_safely(user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fold_safely(self, user_id: str) -> None:
+        started = time.perf_counter()
+        try:
+            await self.fold(user_id)
+        except Exception as e:
+            logger.error("Error summarizing chat for user %s: %s", user_id, e)
+        finally:
+            self._running.discard(user_id)
+            elapsed = time.perf_counter() - started
+            logger.info("Chat summary fold for user %s took %.0f ms", user_id, elapsed * 1000)
+            for listener in self.fold_listeners:
+                try:
+                    listener(elapsed)
+                except Exception as e:
+                    logger.warning("Chat summary fold listener failed: %s", e)
+
+    async def fold(self, user_id: str) -> bool:
+        """
+        Дописать в 'recent' сообщения после водяного знака, кроме последних
+        `window`, при необходимости перенести 'recent' в 'long'.
+        Возвращает True, если резюме обновлено.
+        """
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "SELECT content, watermark_id FROM chat_summary WHERE user_id = ? AND level = 'recent'",
+                (user_id,),
+            )
+            row = await cursor.fetchone()
+            if row is None:
+                return False
+            recent, watermark_id = row[0] or "", int(row[1] or 0)
+            cursor = await db.execute(
+                "SELECT content FROM chat_summary WHERE user_id = ? AND level = 'long'",
+                (user_id,),
+            )
+            long_row = await cursor.fetchone()
+            long_text = (long_row[0] if long_row else "") or ""
+            cursor = await db.execute(
+                """
+                SELECT id, role, content, tokens FROM chat_history
+                WHERE user_id = ? AND id > ?
+                  AND id < (
+                    SELECT id FROM chat_history WHERE user_id = ?
+                    ORDER BY id DESC LIMIT 1 OFFSET ?
+                  )
+                ORDER BY id ASC
+                LIMIT ?
+                """,
+                (user_id, watermark_id, user_id, max(self.window - 1, 0), self.chunk * 2),
+            )
+            fetched = await cursor.fetchall()
+            if len(fetched) < self.chunk:
+                # Счётчик разошёлся с историей (обрезка сверх лимита) — выравниваем
+                await db.execute(
+                    "UPDATE chat_summary SET pending = ? WHERE user_id = ? AND level = 'recent'",
+                    (len(fetched) + self.window, user_id),
+                )
+                await db.commit()
+                return False
+
+        # Сколько сообщений влезает в контекст модели резюме (по сохранённым токенам);
+        # остальные уйдут в следующий раз
+        budget = context_tokens("summary") - FOLD_MAX_TOKENS - estimate_tokens(recent) - estimate_tokens(_FOLD_PROMPT)
+        rows: List[Tuple[int, str, str]] = []
+        for msg_id, role, content, msg_tokens in fetched:
+            content = content or ""
+            budget -= (msg_tokens if msg_tokens is not None else estimate_tokens(content)) + MESSAGE_OVERHEAD_TOKENS
+            if budget < 0 and rows:
+                break
+            rows.append((int(msg_id), role, content))
+
+        recent = await ai_chat(
+            [
+                {"role": "system", "content": _FOLD_PROMPT},
+                {
+                    "role": "user",
+                    "content": f"Текущее резюме:\n{recent or 'нет'}\n\nНовые сообщения:\n{_transcript(rows)}",
+                },
+            ],
+            model_hint="summary",
+            max_tokens=FOLD_MAX_TOKENS,
+            temperature=0.2,
+        )
+        if not recent:
+            return False
+        if estimate_tokens(recent) > CHAT_SUMMARY_RECENT_TOKENS:
+            promoted = await ai_chat(
+                [
+                    {"role": "system", "content": _PROMOTE_PROMPT},
+                    {
+                        "role": "user",
+                        "content": f"Долгосрочное резюме:\n{long_text or 'нет'}\n\nСвежее резюме:\n{recent}",
+                    },
+                ],
+                model_hint="summary",
+                max_tokens=320,
+                temperature=0.2,
+            )
+            if promoted:
+                long_text, recent = promoted, ""
+
+        new_watermark = rows[-1][0]
+        async with aiosqlite.connect(self.db_path) as db:
+            # Пока ждали ИИ, историю могли очистить («новый диалог») или сжать в другом
+            # процессе: пишем, только если 'recent' всё ещё с прочитанным водяным знаком
+            # и сжатые сообщения на месте. Обе записи — в одной транзакции (её открывает UPDATE)
+            cursor = await db.execute(
+                """
+                UPDATE chat_summary
+                SET content = ?, watermark_id = ?, pending = MAX(pending - ?, 0), updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = ? AND level = 'recent' AND watermark_id = ?
+                  AND EXISTS (SELECT 1 FROM chat_history WHERE id = ? AND user_id = ?)
+                """,
+                (recent, new_watermark, len(rows), user_id, watermark_id, new_watermark, user_id),
+            )
+            if cursor.rowcount != 1:
+                await db.rollback()
+                logger.info("Chat summary for user %s changed during fold, result dropped", user_id)
+                return False
+            await db.execute(
+                """
+                INSERT INTO chat_summary (user_id, level, content, watermark_id, pending)
+                VALUES (?, 'long', ?, ?, 0)
+                ON CONFLICT(user_id, level) DO UPDATE SET
+                    content = excluded.content,
+                    watermark_id = excluded.watermark_id,
+                    updated_at = CURRENT_TIMESTAMP
+                """,
+                (user_id, long_text, new_watermark),
+            )
+            await db.commit()
+        self._cache.pop(user_id, None)  # перечитается из БД при следующем get
+        logger.info("Chat history summarized for user %s up to id %s", user_id, new_watermark)
+        return True
+
+    async def drain(self) -> None:
+        """Дождаться фоновых сжатий (остановка API)."""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
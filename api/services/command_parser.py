@@ -0,0 +1,576 @@
+"""
+Разбор прямых команд пользователя без ИИ (задачи, финансы, проекты, контакты).
+
+Движок табличный: все регулярки скомпилированы при импорте и собраны в список
+правил в порядке приоритета. Каждое правило знает литералы, без которых оно
+сработать не может; один проход объединённой регуляркой по тексту находит все
+такие литералы, и дальше проверяются только правила, чьи литералы есть в тексте.
+Обычная реплика без командных слов отсекается за один поиск.
+
+Порядок правил повторяет прежнюю цепочку re.search (первое совпавшее правило
+побеждает), результат тот же — это проверяет
+benchmarks/bench_command_parser.py --check на эталонном корпусе.
+"""
+from __future__ import annotations
+
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Pattern, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- Нормализация ---------------------------------------------------------------------
+
+# Убираем эмодзи и лишние символы, чтобы не попадали в заголовки задач
+_NOISE_RE = re.compile(r'[^\w\s\.\,\-\:\;\!\?ёа-я0-9]')
+_SPACES_RE = re.compile(r'\s+')
+
+# Вопрос без этих префиксов — не команда
+_STRONG_PREFIXES = (
+    "создай задачу", "добавь задачу",
+    "создай контакт", "добавь контакт",
+    "создай карточку", "добавь карточку", "добавь человека",
+)
+
+# --- Справочники ----------------------------------------------------------------------
+
+_PERSON_ROLES = frozenset([
+    'мама', 'папа', 'отец', 'мать', 'брат', 'сестра', 'муж', 'жена', 'супруг', 'супруга', 'сын', 'дочь',
+    'дядя', 'тётя', 'тетя', 'дед', 'бабушка', 'друг', 'подруга', 'коллега',
+    'партнер', 'партнёр', 'партнер по бизнесу', 'партнёр по бизнесу',
+    'бизнес партнер', 'бизнес-партнер', 'компаньон', 'сооснователь', 'совладелец',
+    'начальник', 'директор', 'менеджер', 'клиент',
+    'заказчик', 'поставщик', 'инвестор', 'сосед', 'знакомый',
+])
+# В «обнови контакт» исторически без «супруг/супруга»
+_UPDATE_ROLES = _PERSON_ROLES - {'супруг', 'супруга'}
+# Последнее слово ФИО в «создай контакт …», которое считаем ролью
+_FIO_TAIL_ROLES = frozenset([
+    'мама', 'папа', 'отец', 'мать', 'брат', 'сестра', 'муж', 'жена', 'супруг', 'супруга', 'сын', 'дочь',
+    'дядя', 'тётя', 'тетя', 'дед', 'бабушка', 'друг', 'подруга', 'коллега',
+    'партнер', 'партнёр', 'компаньон', 'сооснователь', 'совладелец',
+    'начальник', 'директор', 'менеджер', 'клиент', 'заказчик', 'поставщик', 'инвестор', 'сосед', 'знакомый',
+])
+_ROLE_FRAGMENTS = ('партнер', 'бизнес', 'работ')
+_WEAKNESS_WORDS = frozenset([
+    'забывчивый', 'забывчива', 'вспыльчивый', 'вспыльчива',
+    'ленивый', 'ленива', 'жадный', 'жадная', 'нервный', 'нервная',
+    'непунктуальный', 'непунктуальна', 'необязательный', 'необязательна',
+])
+# Подсказки, что после ФИО идёт роль, а не сумма («добавь цель отпуск 200000»)
+_ROLE_HINT_WORDS = (
+    'мама', 'папа', 'сын', 'дочь', 'муж', 'жена', 'супруг', 'супруга', 'коллега', 'друг', 'подруга',
+    'начальник', 'клиент', 'партнер', 'компаньон', 'директор', 'брат', 'сестра', 'дед', 'бабушка',
+)
+_NOT_FIO_FIRST_WORDS = frozenset(('цель', 'расход', 'доход', 'задачу', 'контакт', 'карточку', 'заметку', 'человека'))
+_FIO_TASK_WORDS = ('купить', 'позвонить', 'сделать', 'проверить', 'написать', 'отправить', 'забрать', 'оплатить')
+
+# «Размытые» глаголы: в мягкой фразе (нужно/надо/не забыть) сначала уточняем
+_AMBIGUOUS_VERBS = (
+    'подумать', 'поразмышлять', 'обсудить', 'обговорить',
+    'поговорить', 'узнать', 'поискать', 'почитать',
+)
+# Несколько разных глаголов-действий в сообщении — просим разбить на задачи
+_MULTI_VERBS_RE = re.compile(
+    r'\b(купить|позвонить|написать|сделать|проверить|отправить|подготовить'
+    r'|встретиться|забрать|оплатить|заказать|разобраться|записаться)\b'
+)
+
+# Порядок важен: первое вхождение побеждает («пн» и т.п. — подстроки)
+_WEEKDAYS: Tuple[Tuple[str, int], ...] = (
+    ('понедельник', 0), ('пн', 0),
+    ('вторник', 1), ('вт', 1),
+    ('среда', 2), ('среду', 2), ('ср', 2),
+    ('четверг', 3), ('чт', 3),
+    ('пятница', 4), ('пятницу', 4), ('пт', 4),
+    ('суббота', 5), ('субботу', 5), ('сб', 5),
+    ('воскресенье', 6), ('воскресение', 6), ('вс', 6),
+)
+_WEEKDAY_STRIP_RE: Dict[str, Pattern[str]] = {
+    name: re.compile(rf'\s*(на\s+|в\s+)?{name}\s*', re.IGNORECASE) for name, _ in _WEEKDAYS
+}
+
+_DATE_RE = re.compile(r'(\d{1,2})\.(\d{1,2})(?:\.(\d{4}))?')
+_DATE_STRIP_RE = re.compile(r'\s*\d{1,2}\.\d{1,2}(?:\.\d{4})?\s*')
+_TITLE_NOISE_RE = re.compile(
+    r'\b(на завтра|на сегодня|на послезавтра|завтра|сегодня|срочно|важно|пожалуйста|плиз|плииз)\b',
+    re.IGNORECASE,
+)
+_TRAILING_DATE_RE = re.compile(r'\s+(\d{1,2})\.(\d{1,2})(?:\.(\d{4}))?$')
+_TRAILING_DATE_STRIP_RE = re.compile(r'\s+\d{1,2}\.\d{1,2}(?:\.\d{4})?\s*$')
+_BIRTH_DATE_RE = re.compile(r'(?:дата\s+рождения\s+)?(\d{1,2}\.\d{1,2}\.\d{4})', re.IGNORECASE)
+_PARTS_SPLIT_RE = re.compile(r'[,;]')
+_ONLY_NUMBER_RE = re.compile(r'^[\d\s.,]+$')
+
+
+# --- Общие помощники -----------------------------------------------------------------
+
+def _extract_birth_date_from_text(text: str):
+    """Извлекает дату рождения (DD.MM.YYYY или «дата рождения DD.MM.YYYY») из текста. Возвращает (дата в YYYY-MM-DD или None, текст без даты)."""
+    text = text.strip()
+    match = _BIRTH_DATE_RE.search(text)
+    if not match:
+        return None, text
+    try:
+        d, m, y = match.group(1).split('.')
+        date_iso = f"{y}-{m.zfill(2)}-{d.zfill(2)}"
+    except Exception:
+        return None, text
+    rest = (text[:match.start()] + text[match.end():]).strip()
+    rest = _SPACES_RE.sub(' ', rest).strip()
+    return date_iso, rest
+
+
+def _split_roles_strengths_weaknesses(parts: List[str], roles: FrozenSet[str]) -> dict:
+    """Раскладывает части строки на роли, сильные и слабые стороны."""
+    found_roles = []
+    strengths = []
+    weaknesses = []
+    for part in parts:
+        wl = part.lower()
+        if wl in roles or any(w in wl for w in _ROLE_FRAGMENTS):
+            found_roles.append(part)
+        elif wl in _WEAKNESS_WORDS:
+            weaknesses.append(part)
+        else:
+            strengths.append(part)
+    data = {}
+    if found_roles:
+        data['relation'] = ', '.join(found_roles)
+    if strengths:
+        data['strengths'] = ', '.join(strengths)
+    if weaknesses:
+        data['weaknesses'] = ', '.join(weaknesses)
+    return data
+
+
+def _parse_person_roles_strengths_weaknesses(rest: str):
+    """Парсит строку после ФИО: роли, сильные и слабые стороны. Возвращает dict с relation, strengths, weaknesses."""
+    if not rest:
+        return {}
+    if ',' in rest or ';' in rest:
+        parts = [p.strip() for p in _PARTS_SPLIT_RE.split(rest) if p.strip()]
+    else:
+        parts = rest.split()
+    return _split_roles_strengths_weaknesses(parts, _PERSON_ROLES)
+
+
+def _parse_amount(raw: str) -> Optional[float]:
+    """«1 200,50» → 1200.5; не число или не больше нуля — None."""
+    try:
+        amount = float(raw.replace(',', '.').replace(' ', '').strip())
+    except ValueError:
+        return None
+    return amount if amount > 0 else None
+
+
+def parse_relative_date(text: str) -> str:
+    """Преобразует относительные даты в формат YYYY-MM-DD."""
+    today = datetime.now().date()
+    text_lower = text.lower()
+
+    if 'сегодня' in text_lower:
+        return today.isoformat()
+    elif 'завтра' in text_lower:
+        return (today + timedelta(days=1)).isoformat()
+    elif 'послезавтра' in text_lower:
+        return (today + timedelta(days=2)).isoformat()
+    elif 'через неделю' in text_lower:
+        return (today + timedelta(weeks=1)).isoformat()
+    elif 'через месяц' in text_lower:
+        return (today + timedelta(days=30)).isoformat()
+
+    # Пытаемся найти дату в формате DD.MM или DD.MM.YYYY
+    date_match = _DATE_RE.search(text)
+    if date_match:
+        day = int(date_match.group(1))
+        month = int(date_match.group(2))
+        year = int(date_match.group(3)) if date_match.group(3) else today.year
+        try:
+            return datetime(year, month, day).date().isoformat()
+        except Exception:
+            pass
+
+    return None
+
+
+# --- Обработчики правил ----------------------------------------------------------------
+# Каждый получает совпадение и нормализованный текст; None — правило не подошло,
+# разбор продолжается со следующего правила.
+
+def _task_deadline(title: str, msg: str) -> Tuple[str, str]:
+    """Срок задачи из даты / «завтра» / дня недели (по умолчанию сегодня) и заголовок без него."""
+    today = datetime.now().date()
+    date_match = _DATE_RE.search(title)
+    if date_match:
+        day = int(date_match.group(1))
+        month = int(date_match.group(2))
+        year = int(date_match.group(3)) if date_match.group(3) else datetime.now().year
+        try:
+            deadline = datetime(year, month, day).date().isoformat()
+            return deadline, _DATE_STRIP_RE.sub(' ', title).strip()
+        except ValueError:
+            pass
+
+    if 'завтра' in msg:
+        return (today + timedelta(days=1)).isoformat(), title
+    if 'послезавтра' in msg:
+        return (today + timedelta(days=2)).isoformat(), title
+    for day_name, day_num in _WEEKDAYS:
+        if day_name in msg:
+            days_ahead = day_num - today.weekday()
+            if days_ahead <= 0:  # Если день уже прошёл или сегодня - следующая неделя
+                days_ahead += 7
+            title = _WEEKDAY_STRIP_RE[day_name].sub(' ', title).strip()
+            return (today + timedelta(days=days_ahead)).isoformat(), title
+    return today.isoformat(), title
+
+
+def _task_handler(soft: bool) -> Callable[[re.Match, str], Optional[dict]]:
+    def handle(match: re.Match, msg: str) -> Optional[dict]:
+        logger.debug("Task pattern matched: %s -> %s", match.re.pattern, match.group(1))
+        title = match.group(1).strip()
+
+        # Защита от нескольких задач в одном сообщении
+        verb_count = len(set(_MULTI_VERBS_RE.findall(msg)))
+        if verb_count > 1:
+            logger.debug("Detected multiple actions in one message (verbs=%s), asking user to split", verb_count)
+            return {"action": "ask_split_tasks"}
+
+        deadline, title = _task_deadline(title, msg)
+
+        # Убираем слова про дату и служебные слова из названия
+        title_clean = _TITLE_NOISE_RE.sub(' ', title).strip()
+        if len(title_clean) > 120:
+            title_clean = title_clean[:117].rstrip() + '...'
+
+        # Мягкая фраза (нужно/надо/не забыть) с «размытым» глаголом — сначала уточняем
+        if soft:
+            tl = title_clean.lower() or title.lower()
+            if any(v in tl for v in _AMBIGUOUS_VERBS):
+                logger.debug("Ambiguous soft task phrase, asking for confirmation: %s", tl)
+                return {
+                    "action": "ask_task_confirmation",
+                    "title": title_clean.capitalize() if title_clean else title.capitalize(),
+                }
+
+        priority = "high" if ('срочно' in msg or 'важно' in msg) else "medium"
+        return {
+            "action": "create_task",
+            "title": title_clean.capitalize() if title_clean else title.capitalize(),
+            "deadline": deadline,
+            "priority": priority,
+        }
+    return handle
+
+
+def _done(match: re.Match, msg: str) -> Optional[dict]:
+    return {"action": "complete_task", "title": match.group(1).strip()}
+
+
+def _expense(match: re.Match, msg: str) -> Optional[dict]:
+    amount = _parse_amount(match.group(1))
+    if amount is None:
+        return None
+    rest = match.group(2).strip()
+    category = rest
+    for suffix in (' сегодня', ' завтра', ' послезавтра'):
+        if category.endswith(suffix):
+            category = category[:-len(suffix)].strip()
+    date_match = _TRAILING_DATE_RE.search(category)
+    if date_match:
+        category = _TRAILING_DATE_STRIP_RE.sub('', category).strip()
+    if not category or len(category) > 100:
+        category = "Прочее"
+    tx_date = datetime.now().date().isoformat()
+    if 'завтра' in rest:
+        tx_date = (datetime.now().date() + timedelta(days=1)).isoformat()
+    elif 'послезавтра' in rest:
+        tx_date = (datetime.now().date() + timedelta(days=2)).isoformat()
+    elif date_match:
+        try:
+            day, month = int(date_match.group(1)), int(date_match.group(2))
+            year = int(date_match.group(3)) if date_match.group(3) else datetime.now().year
+            tx_date = datetime(year, month, day).date().isoformat()
+        except (ValueError, IndexError):
+            pass
+    return {"action": "add_finance_transaction", "type": "expense", "amount": amount, "category": category, "date": tx_date}
+
+
+def _income(match: re.Match, msg: str) -> Optional[dict]:
+    amount = _parse_amount(match.group(1))
+    if amount is None:
+        return None
+    rest = (match.group(2) if match.lastindex >= 2 else "").strip()
+    category = rest if rest and len(rest) <= 100 else "Доход"
+    return {"action": "add_finance_transaction", "type": "income", "amount": amount, "category": category, "date": datetime.now().date().isoformat()}
+
+
+def _goal(match: re.Match, msg: str) -> Optional[dict]:
+    title = match.group(1).strip()
+    if not title or len(title) > 200:
+        return None
+    target = _parse_amount(match.group(2))
+    if target is None:
+        return None
+    return {"action": "add_finance_goal", "title": title[:200], "target_amount": target}
+
+
+def _project(match: re.Match, msg: str) -> Optional[dict]:
+    title = match.group(1).strip()
+    if title and len(title) <= 200:
+        return {"action": "create_project", "title": title}
+    return None
+
+
+def _project_note(match: re.Match, msg: str) -> Optional[dict]:
+    project_name = match.group(1).strip()
+    text = match.group(2).strip()
+    if project_name and text:
+        return {"action": "add_project_note", "project": project_name, "text": text}
+    return None
+
+
+def _fio_with_date(match: re.Match, msg: str) -> Optional[dict]:
+    """«добавь иванов иван иванович 01.01.1990 …»"""
+    fio = match.group(1).strip()
+    d, m, y = match.group(2).split('.')
+    data = {'birth_date': f"{y}-{m.zfill(2)}-{d.zfill(2)}"}
+    rest = match.group(3).strip()
+    if rest:
+        data.update(_parse_person_roles_strengths_weaknesses(rest))
+    logger.debug("FIO pattern with date: %s, data: %s", fio, data)
+    return {"action": "create_person", "fio": fio.title(), **data}
+
+
+def _fio_without_date(match: re.Match, msg: str) -> Optional[dict]:
+    """ФИО (2–4 слова) + роль/характеристики; «добавь цель отпуск 200000» сюда не попадает."""
+    fio = match.group(1).strip()
+    rest = match.group(2).strip()
+    first_word = fio.split()[0].lower() if fio.split() else ''
+    if first_word in _NOT_FIO_FIRST_WORDS:
+        return None
+    rest_lower = rest.lower()
+    has_role_hint = ',' in rest or any(r in rest_lower for r in _ROLE_HINT_WORDS)
+    if any(word in fio.lower() for word in _FIO_TASK_WORDS):
+        return None
+    if not has_role_hint and _ONLY_NUMBER_RE.match(rest.replace(' ', '')):
+        return None
+    birth_date, rest = _extract_birth_date_from_text(rest)
+    data = {}
+    if birth_date:
+        data['birth_date'] = birth_date
+    data.update(_parse_person_roles_strengths_weaknesses(rest))
+    logger.debug("FIO pattern without date: %s, data: %s", fio, data)
+    return {"action": "create_person", "fio": fio.title(), **data}
+
+
+def _person(match: re.Match, msg: str) -> Optional[dict]:
+    """Явные фразы: «создай контакт …», «карточка: …»."""
+    birth_date, text = _extract_birth_date_from_text(match.group(1).strip())
+    data = {}
+    if birth_date:
+        data['birth_date'] = birth_date
+
+    parts = [p.strip() for p in _PARTS_SPLIT_RE.split(text) if p.strip()]
+    if not parts:
+        return None
+    # Последнее слово в первой части может быть ролью (супруга, коллега и т.д.)
+    words_fio = parts[0].split()
+    if len(words_fio) >= 2 and words_fio[-1].lower() in _FIO_TAIL_ROLES:
+        fio = ' '.join(words_fio[:-1]).strip()
+        data['relation'] = words_fio[-1].title()
+    else:
+        fio = parts[0]
+    # Остальные части — характеристики (роли/сильные/слабые)
+    if parts[1:]:
+        parsed = _parse_person_roles_strengths_weaknesses(', '.join(parts[1:]))
+        if parsed.get('relation') and not data.get('relation'):
+            data['relation'] = parsed['relation']
+        elif parsed.get('relation') and data.get('relation'):
+            data['relation'] = data['relation'] + ', ' + parsed['relation']
+        if parsed.get('strengths'):
+            data['strengths'] = parsed['strengths']
+        if parsed.get('weaknesses'):
+            data['weaknesses'] = parsed['weaknesses']
+
+    logger.debug("Creating person: %s, data: %s", fio, data)
+    return {"action": "create_person", "fio": fio.title(), **data}
+
+
+def _update_person(match: re.Match, msg: str) -> Optional[dict]:
+    """«обнови контакт Иванов…, сделай его партнёром по бизнесу»"""
+    parts = [w.strip() for w in _PARTS_SPLIT_RE.split(match.group(2).strip()) if w.strip()]
+    return {
+        "action": "update_person",
+        "fio_query": match.group(1).strip(),
+        **_split_roles_strengths_weaknesses(parts, _UPDATE_ROLES),
+    }
+
+
+# --- Таблица правил ------------------------------------------------------------------
+
+class _Rule(NamedTuple):
+    triggers: FrozenSet[str]  # литералы, без которых регулярка не совпадёт
+    regex: Pattern[str]
+    handle: Callable[[re.Match, str], Optional[dict]]
+
+
+def _rules(
+    handler: Callable[[re.Match, str], Optional[dict]],
+    *patterns: Tuple[Tuple[str, ...], str],
+) -> List[_Rule]:
+    return [_Rule(frozenset(triggers), re.compile(pattern), handler) for triggers, pattern in patterns]
+
+
+_task = _task_handler(soft=False)
+_soft_task = _task_handler(soft=True)
+_AMOUNT = r'([\d\s]+(?:[.,]\d+)?)'
+
+# Порядок = приоритет: задачи, выполнение, финансы и цели (до контактов, чтобы
+# «добавь цель …» не стала контактом), проекты, контакты, обновление контакта.
+_RULES: List[_Rule] = [
+    *_rules(
+        _task,
+        (("создай задачу",), r'создай задачу[:\s]+(.+)'),
+        (("добавь задачу",), r'добавь задачу[:\s]+(.+)'),
+        (("напомни",), r'напомни[:\s]*[,:]?\s*(.+)'),
+        (("задача",), r'задача[:\s]+(.+)'),
+    ),
+    *_rules(
+        _soft_task,
+        (("нужно",), r'нужно\s+(.+)'),
+        (("надо",), r'надо\s+(.+)'),
+        (("не забыть",), r'не забыть\s+(.+)'),
+    ),
+    *_rules(
+        _task,
+        (("купить",), r'купить\s+(.+)'),
+        # Глаголы-инфинитивы в начале (позвонить, сделать, разобраться...)
+        (("звонить",), r'^((?:по)?звонить\s+.+)'),
+        (("сделать",), r'^(сделать\s+.+)'),
+        (("разобраться",), r'^(разобраться\s+.+)'),
+        (("написать",), r'^(написать\s+.+)'),
+        (("отправить",), r'^(отправить\s+.+)'),
+        (("проверить",), r'^(проверить\s+.+)'),
+        (("подготовить",), r'^(подготовить\s+.+)'),
+        (("встретиться",), r'^(встретиться\s+.+)'),
+        (("забрать",), r'^(забрать\s+.+)'),
+        (("оплатить",), r'^(оплатить\s+.+)'),
+        (("заказать",), r'^(заказать\s+.+)'),
+        (("записаться",), r'^(записаться\s+.+)'),
+    ),
+    *_rules(
+        _done,
+        (("выполн",), r'выполн(?:ено|ил|ена)[:\s]+(.+)'),
+        (("сделан",), r'сделан[оа]?[:\s]+(.+)'),
+        (("готово",), r'готово[:\s]+(.+)'),
+        (("закрой задачу",), r'закрой задачу[:\s]+(.+)'),
+    ),
+    *_rules(
+        _expense,
+        (("расход",), rf'(?:добавь\s+)?расход\s+{_AMOUNT}\s+(?:на\s+)?(.+)'),
+        (("потратил",), rf'потратил[а]?\s+{_AMOUNT}\s+(?:на\s+)?(.+)'),
+        (("трата",), rf'трата\s+{_AMOUNT}\s+(?:на\s+)?(.+)'),
+    ),
+    *_rules(
+        _income,
+        (("доход",), rf'(?:добавь\s+)?доход\s+{_AMOUNT}\s*(.*)'),
+        (("получил",), rf'получил[а]?\s+{_AMOUNT}\s*(.*)'),
+    ),
+    *_rules(
+        _goal,
+        (("создай", "цель"), rf'создай\s+(?:финансовую\s+)?цель\s+(.+?)\s+{_AMOUNT}\s*$'),
+        (("добавь", "цель"), rf'добавь\s+цель\s+(.+?)\s+{_AMOUNT}\s*$'),
+    ),
+    *_rules(
+        _project,
+        (("создай", "проект"), r'создай\s+проект\s+(.+)'),
+        (("новый", "проект"), r'новый\s+проект\s+(.+)'),
+        (("добавь", "проект"), r'добавь\s+проект\s+(.+)'),
+    ),
+    *_rules(
+        _project_note,
+        (("запиши", "проект"), r'запиши\s+в\s+проект\s+(.+?):\s*(.+)'),
+        (("добавь", "проект"), r'добавь\s+в\s+проект\s+(.+?):\s*(.+)'),
+        (("заметка", "проект"), r'заметка\s+в\s+проект\s+(.+?):\s*(.+)'),
+    ),
+    *_rules(
+        _fio_with_date,
+        (("добавь",), r'добавь\s+([а-яё]+\s+[а-яё]+(?:\s+[а-яё]+){0,2})\s+(\d{1,2}\.\d{1,2}\.\d{4})\s*(.*)'),
+    ),
+    *_rules(
+        _fio_without_date,
+        (("добавь",), r'добавь\s+([а-яё]+\s+[а-яё]+(?:\s+[а-яё]+){0,2})\s+(.+)'),
+    ),
+    *_rules(
+        _person,
+        (("создай карточку",), r'создай карточку[:\s]+(.+)'),
+        (("создай контакт",), r'создай контакт[:\s]+(.+)'),
+        (("добавь контакт",), r'добавь контакт[:\s]+(.+)'),
+        (("добавь человека",), r'добавь человека[:\s]+(.+)'),
+        (("добавь карточку",), r'добавь карточку[:\s]+(.+)'),
+        (("новый контакт",), r'новый контакт[:\s]+(.+)'),
+        (("запиши контакт",), r'запиши контакт[:\s]+(.+)'),
+        (("карточка",), r'карточка[:\s]+(.+)'),
+    ),
+    *_rules(
+        _update_person,
+        (("обнови контакт",), r'обнови контакт\s+(.+?)\s*(?:,|–|-)\s*(.+)'),
+    ),
+]
+
+_TRIGGERS = sorted({t for rule in _RULES for t in rule.triggers}, key=len, reverse=True)
+# Один проход: lookahead находит литерал в каждой позиции (длинные — первыми)
+_TRIGGER_RE = re.compile("(?=(" + "|".join(re.escape(t) for t in _TRIGGERS) + "))")
+# Найденный литерал означает и все литералы, которые в нём содержатся
+# («добавь задачу» → «добавь»): lookahead в одной позиции отдаёт только самый длинный
+_IMPLIED: Dict[str, FrozenSet[str]] = {
+    t: frozenset(other for other in _TRIGGERS if other in t) for t in _TRIGGERS
+}
+# Таблица диспетчеризации: литерал → номера правил, где он нужен
+_RULES_BY_TRIGGER: Dict[str, Tuple[int, ...]] = {
+    t: tuple(i for i, rule in enumerate(_RULES) if t in rule.triggers) for t in _TRIGGERS
+}
+
+
+def _present_triggers(msg: str) -> FrozenSet[str]:
+    found = {m.group(1) for m in _TRIGGER_RE.finditer(msg)}
+    if not found:
+        return frozenset()
+    return frozenset().union(*(_IMPLIED[t] for t in found))
+
+
+def _candidate_rules(present: FrozenSet[str]) -> List[_Rule]:
+    """Правила, все литералы которых есть в тексте, в порядке приоритета."""
+    indexes = sorted({i for t in present for i in _RULES_BY_TRIGGER[t]})
+    return [_RULES[i] for i in indexes if _RULES[i].triggers <= present]
+
+
+def normalize_message(message: str) -> str:
+    """Нижний регистр, без эмодзи и лишних символов, одиночные пробелы."""
+    msg = _NOISE_RE.sub(' ', message.lower().strip())
+    return _SPACES_RE.sub(' ', msg).strip()
+
+
+def parse_user_command(message: str, user_id: str):
+    """Парсит команды пользователя напрямую, без ИИ."""
+    msg = normalize_message(message)
+    logger.debug("Parsing message: %s", msg)
+
+    # Если это явно вопрос (есть "?") и нет сильных командных слов — ничего не делаем
+    if "?" in msg and not msg.startswith(_STRONG_PREFIXES):
+        return None
+
+    present = _present_triggers(msg)
+    if not present:
+        return None
+    for rule in _candidate_rules(present):
+        match = rule.regex.search(msg)
+        if match is None:
+            continue
+        result = rule.handle(match, msg)
+        if result is not None:
+            return result
+    return None
@@ -0,0 +1,253 @@
+"""
+Отбор контактов, проектов и операций для системного промпта чата.
+
+Раньше в промпт целиком уходили все контакты, все активные проекты и последние
+операции. У пользователя с сотнями контактов это тысячи токенов на каждую
+реплику. Здесь каждая сущность получает оценку релевантности:
+
+- упоминание в сообщении пользователя (сильнее) и в недавней истории;
+- близость срока (дедлайн проекта, день рождения контакта);
+- свежесть (недавно созданные / недавние операции).
+
+В промпт попадают лучшие, пока не исчерпан бюджет токенов секции и лимит
+количества; об остальных — одна короткая строка-сводка.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from .prompt_format import row_text, section
+from .tokens import estimate_tokens
+
+# Веса оценки
+MENTION_IN_MESSAGE = 3.0
+MENTION_IN_HISTORY = 1.5
+DEADLINE_WEIGHT = 1.0
+RECENCY_WEIGHT = 0.5
+
+DEADLINE_HORIZON_DAYS = 30
+BIRTHDAY_HORIZON_DAYS = 14
+SUMMARY_NAMES = 10
+
+_WORD_RE = re.compile(r"[a-zа-яё0-9]+")
+
+
+def _keys(text: str) -> set:
+    """
+    Ключи слов для сравнения без морфологии: первые 4 буквы («Ивану» ~ «Иван»).
+    Слова из 3 букв — целиком, короче — игнорируются.
+    """
+    out = set()
+    for word in _WORD_RE.findall((text or "").lower().replace("ё", "е")):
+        if len(word) >= 4:
+            out.add(word[:4])
+        elif len(word) == 3:
+            out.add(word)
+    return out
+
+
+def _mention(name_keys: set, text_keys: set) -> float:
+    """Доля слов имени, встретившихся в тексте (0..1)."""
+    if not name_keys:
+        return 0.0
+    return len(name_keys & text_keys) / len(name_keys)
+
+
+def _days_until(value: Optional[str], today: date) -> Optional[int]:
+    if not value:
+        return None
+    try:
+        return (date.fromisoformat(str(value)[:10]) - today).days
+    except ValueError:
+        return None
+
+
+def _deadline_score(deadline: Optional[str], today: date) -> float:
+    """Просрочено — 1, в пределах горизонта — линейно от 1 до 0."""
+    days = _days_until(deadline, today)
+    if days is None or days > DEADLINE_HORIZON_DAYS:
+        return 0.0
+    if days <= 0:
+        return 1.0
+    return 1.0 - days / DEADLINE_HORIZON_DAYS
+
+
+def _birthday_score(birth_date: Optional[str], today: date) -> float:
+    """Ближайший день рождения в пределах BIRTHDAY_HORIZON_DAYS."""
+    if not birth_date:
+        return 0.0
+    try:
+        born = date.fromisoformat(str(birth_date)[:10])
+    except ValueError:
+        return 0.0
+    for year in (today.year, today.year + 1):
+        try:
+            upcoming = born.replace(year=year)
+        except ValueError:  # 29 февраля
+            upcoming = date(year, 3, 1)
+        days = (upcoming - today).days
+        if days >= 0:
+            break
+    if days > BIRTHDAY_HORIZON_DAYS:
+        return 0.0
+    return 1.0 - days / (BIRTHDAY_HORIZON_DAYS + 1)
+
+
+@dataclass
+class Selection:
+    """Отобранные элементы и сводка по остальным."""
+
+    items: List[Dict[str, Any]] = field(default_factory=list)
+    omitted: int = 0
+    summary: str = ""
+
+    def render(self, columns: Optional[Sequence[str]] = None, today: Optional[date] = None) -> str:
+        """Для промпта: компактная таблица выбранных + строка-сводка."""
+        if not self.items and not self.omitted:
+            return "нет"
+        body = section(self.items, columns, today=today) if self.items else ""
+        if self.summary:
+            body = f"{body}\n{self.summary}" if body else self.summary
+        return body
+
+
+def select(
+    items: Sequence[Dict[str, Any]],
+    scores: Sequence[float],
+    *,
+    budget_tokens: int,
+    max_items: int,
+    summarize: Callable[[List[Dict[str, Any]]], str],
+) -> Selection:
+    """
+    Жадный отбор по убыванию оценки (при равенстве — исходный порядок),
+    пока помещается в бюджет и лимит количества.
+    """
+    order = sorted(range(len(items)), key=lambda i: -scores[i])
+    chosen: List[int] = []
+    rest: List[Dict[str, Any]] = []
+    used = 0
+    for i in order:
+        cost = estimate_tokens(row_text(items[i])) + 1
+        if len(chosen) < max_items and used + cost <= budget_tokens:
+            chosen.append(i)
+            used += cost
+        else:
+            rest.append(items[i])
+    chosen.sort()  # в промпте — в исходном порядке
+    return Selection(
+        items=[items[i] for i in chosen],
+        omitted=len(rest),
+        summary=summarize(rest) if rest else "",
+    )
+
+
+def _names_summary(noun: str, names: Iterable[str]) -> str:
+    names = [n for n in names if n]
+    shown = names[:SUMMARY_NAMES]
+    more = len(names) - len(shown)
+    tail = f" и ещё {more}" if more > 0 else ""
+    return f"ещё {len(names)} {noun} не показаны: {', '.join(shown)}{tail}"
+
+
+def _recency(n: int, rank: int) -> float:
+    """rank 0 — самый свежий."""
+    return 1.0 - rank / n if n else 0.0
+
+
+def select_contacts(
+    people: Sequence[Dict[str, Any]],
+    *,
+    message: str,
+    history_text: str,
+    today: date,
+    budget_tokens: int,
+    max_items: int,
+) -> Selection:
+    """people — в порядке от новых к старым (как из БД по created_at DESC)."""
+    msg_keys, hist_keys = _keys(message), _keys(history_text)
+    scores = []
+    for rank, person in enumerate(people):
+        name_keys = _keys(person.get("fio") or "")
+        scores.append(
+            MENTION_IN_MESSAGE * _mention(name_keys, msg_keys)
+            + MENTION_IN_HISTORY * _mention(name_keys, hist_keys)
+            + DEADLINE_WEIGHT * _birthday_score(person.get("birth_date"), today)
+            + RECENCY_WEIGHT * _recency(len(people), rank)
+        )
+    return select(
+        people,
+        scores,
+        budget_tokens=budget_tokens,
+        max_items=max_items,
+        summarize=lambda rest: _names_summary("контактов", (p.get("fio") for p in rest)),
+    )
+
+
+def select_projects(
+    projects: Sequence[Dict[str, Any]],
+    *,
+    message: str,
+    history_text: str,
+    today: date,
+    budget_tokens: int,
+    max_items: int,
+) -> Selection:
+    """projects — в порядке от новых к старым."""
+    msg_keys, hist_keys = _keys(message), _keys(history_text)
+    scores = []
+    for rank, project in enumerate(projects):
+        title_keys = _keys(project.get("title") or "")
+        scores.append(
+            MENTION_IN_MESSAGE * _mention(title_keys, msg_keys)
+            + MENTION_IN_HISTORY * _mention(title_keys, hist_keys)
+            + DEADLINE_WEIGHT * _deadline_score(project.get("deadline"), today)
+            + RECENCY_WEIGHT * _recency(len(projects), rank)
+        )
+    return select(
+        projects,
+        scores,
+        budget_tokens=budget_tokens,
+        max_items=max_items,
+        summarize=lambda rest: _names_summary("проектов", (p.get("title") for p in rest)),
+    )
+
+
+def select_operations(
+    operations: Sequence[Dict[str, Any]],
+    *,
+    message: str,
+    budget_tokens: int,
+    max_items: int,
+) -> Selection:
+    """operations — от новых к старым; упоминание категории/комментария поднимает операцию."""
+    msg_keys = _keys(message)
+    scores = []
+    for rank, op in enumerate(operations):
+        op_keys = _keys(f"{op.get('category') or ''} {op.get('comment') or ''}")
+        scores.append(
+            MENTION_IN_MESSAGE * _mention(op_keys, msg_keys)
+            + RECENCY_WEIGHT * _recency(len(operations), rank)
+        )
+
+    def summarize(rest: List[Dict[str, Any]]) -> str:
+        expense = sum(op.get("amount") or 0 for op in rest if op.get("type") == "expense")
+        income = sum(op.get("amount") or 0 for op in rest if op.get("type") == "income")
+        return f"ещё {len(rest)} операций не показаны (расход {expense:.0f} ₽, доход {income:.0f} ₽)"
+
+    return select(
+        operations,
+        scores,
+        budget_tokens=budget_tokens,
+        max_items=max_items,
+        summarize=summarize,
+    )
+
+
+def history_text(history: Sequence[Dict[str, Any]], last: int = 6) -> str:
+    """Текст последних сообщений истории для поиска упоминаний."""
+    return " ".join(str(m.get("content") or "") for m in list(history)[-last:])
+
@@ -0,0 +1,284 @@
+"""
+Поиск по старой истории чата (BM25 по локальному инвертированному индексу).
+
+В ИИ уходит короткое окно последних сообщений, а из более старой истории —
+несколько реплик, релевантных текущему сообщению: «как звали того
+риелтора?» находит ход диалога месячной давности, даже если он давно
+выпал из окна и от него осталось лишь резюме.
+
+Индекс живёт в памяти процесса, по одному на пользователя (LRU на
+HISTORY_INDEX_USERS). Он достраивается инкрементально: на каждый запрос
+из БД читаются только сообщения с id больше последнего проиндексированного,
+а обрезанные старые (id меньше минимального в БД) выкидываются. Удаление
+произвольных сообщений (очистка истории, чистка фраз, резюмирование)
+меняет эпоху истории в api/repositories/chat_history.py — индекс
+пересобирается.
+
+Термы — слова без стоп-слов, обрезанные до 5 букв (грубая замена
+стемминга: «риелтор», «риелтора», «риелтору» → «риелт»).
+"""
+from __future__ import annotations
+
+import math
+import os
+import re
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .tokens import MESSAGE_OVERHEAD_TOKENS, estimate_tokens, truncate_to_tokens
+
+# Параметры BM25
+K1 = 1.2
+B = 0.75
+MIN_SCORE = 1.0  # ниже — совпадение случайное, в контекст не берём
+
+CHAT_RETRIEVAL_TURNS = int(os.getenv("CHAT_RETRIEVAL_TURNS", "3"))
+CHAT_RETRIEVAL_TOKENS = int(os.getenv("CHAT_RETRIEVAL_TOKENS", "400"))
+HISTORY_INDEX_USERS = int(os.getenv("HISTORY_INDEX_USERS", "500"))
+# Длинные ответы ассистента в найденных репликах обрезаем
+SNIPPET_CHARS = 300
+# Не влезающее в бюджет сообщение окна обрезаем, только если останется хотя бы столько
+MIN_TRUNCATED_TOKENS = 60
+
+STEM_LENGTH = 5
+
+_WORD_RE = re.compile(r"[a-zа-яё0-9]+")
+_STOPWORDS = frozenset(
+    """
+    и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по
+    только ее мне было вот от меня еще нет о из ему теперь когда даже ну вдруг ли
+    если уже или ни быть был него до вас нибудь опять уж вам ведь там потом себя
+    ничего ей может они тут где есть надо ней для мы тебя их чем была сам чтоб без
+    будто чего раз тоже себе под будет ж тогда кто этот того потому этого какой
+    совсем ним здесь этом один почти мой тем чтобы нее сейчас были куда зачем всех
+    никогда можно при наконец два об другой хоть после над больше тот через эти нас
+    про всего них какая много разве три эту моя впрочем хорошо свою этой перед иногда
+    лучше чуть том нельзя такой им более всегда конечно всю между это мне привет
+    спасибо пожалуйста скажи подскажи
+    """.split()
+)
+
+
+def terms(text: str) -> List[str]:
+    """Термы для индекса и запроса."""
+    out = []
+    for word in _WORD_RE.findall((text or "").lower().replace("ё", "е")):
+        if len(word) < 3 or word in _STOPWORDS:
+            continue
+        out.append(word[:STEM_LENGTH])
+    return out
+
+
+@dataclass
+class _Doc:
+    id: int
+    role: str
+    content: str
+    created_at: str
+    length: int
+    tokens: int
+
+
+class HistoryIndex:
+    """Инвертированный индекс истории одного пользователя."""
+
+    def __init__(self, epoch: int = 0) -> None:
+        self.epoch = epoch
+        self.docs: Dict[int, _Doc] = {}
+        self.ids: List[int] = []  # по возрастанию
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.total_length = 0
+        self.max_id = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Добавить сообщения (id, role, content, created_at, tokens) с id больше max_id."""
+        for row in rows:
+            doc_id = int(row["id"])
+            if doc_id <= self.max_id:
+                continue
+            content = row.get("content") or ""
+            tf = Counter(terms(content))
+            stored_tokens = row.get("tokens")
+            doc = _Doc(
+                doc_id,
+                row["role"],
+                content,
+                str(row.get("created_at") or ""),
+                sum(tf.values()),
+                int(stored_tokens) if stored_tokens is not None else estimate_tokens(content),
+            )
+            self.docs[doc_id] = doc
+            self.ids.append(doc_id)
+            self.total_length += doc.length
+            for term, count in tf.items():
+                self.postings.setdefault(term, {})[doc_id] = count
+            self.max_id = doc_id
+
+    def drop_before(self, min_id: Optional[int]) -> None:
+        """Выкинуть сообщения, обрезанные в БД (id меньше min_id; None — история пуста)."""
+        cut = len(self.ids) if min_id is None else next(
+            (i for i, doc_id in enumerate(self.ids) if doc_id >= min_id), len(self.ids)
+        )
+        for doc_id in self.ids[:cut]:
+            doc = self.docs.pop(doc_id)
+            self.total_length -= doc.length
+            for term in set(terms(doc.content)):
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(doc_id, None)
+                    if not posting:
+                        del self.postings[term]
+        del self.ids[:cut]
+
+    def recent(self, limit: int) -> List[Dict[str, str]]:
+        """Последние limit сообщений в хронологическом порядке (как get_recent_history)."""
+        if limit <= 0:
+            return []
+        return [
+            {"role": self.docs[doc_id].role, "content": self.docs[doc_id].content}
+            for doc_id in self.ids[-limit:]
+        ]
+
+    def recent_within(self, limit: int, budget_tokens: int) -> Tuple[List[Dict[str, str]], int]:
+        """
+        Последние сообщения (не больше limit), которые помещаются в budget_tokens
+        по сохранённым оценкам токенов. Берём с конца, пока помещается; сообщение,
+        на котором бюджет кончился, обрезается, если от бюджета осталась заметная часть.
+        Возвращает сообщения в хронологическом порядке и израсходованные токены.
+        """
+        picked: List[Dict[str, str]] = []
+        used = 0
+        for doc_id in reversed(self.ids[-limit:] if limit > 0 else []):
+            doc = self.docs[doc_id]
+            cost = doc.tokens + MESSAGE_OVERHEAD_TOKENS
+            if used + cost <= budget_tokens:
+                picked.append({"role": doc.role, "content": doc.content})
+                used += cost
+                continue
+            left = budget_tokens - used - MESSAGE_OVERHEAD_TOKENS
+            if left >= MIN_TRUNCATED_TOKENS:
+                picked.append({"role": doc.role, "content": truncate_to_tokens(doc.content, left)})
+                used = budget_tokens
+            break
+        picked.reverse()
+        return picked, used
+
+    def search(self, query: str, *, before_id: int, limit: int) -> List[Tuple[float, int]]:
+        """Лучшие по BM25 сообщения с id < before_id: [(score, id)] по убыванию."""
+        query_terms = set(terms(query))
+        if not query_terms or not self.ids:
+            return []
+        n = len(self.ids)
+        avg_length = self.total_length / n or 1.0
+        scores: Dict[int, float] = {}
+        for term in query_terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                if doc_id >= before_id:
+                    continue
+                norm = K1 * (1 - B + B * self.docs[doc_id].length / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+        ranked = sorted(((s, d) for d, s in scores.items() if s >= MIN_SCORE), reverse=True)
+        return ranked[:limit]
+
+    def turn(self, doc_id: int) -> List[_Doc]:
+        """Ход диалога вокруг сообщения: реплика пользователя + ответ ассистента."""
+        pos = self.ids.index(doc_id)
+        doc = self.docs[doc_id]
+        if doc.role == "user" and pos + 1 < len(self.ids):
+            nxt = self.docs[self.ids[pos + 1]]
+            return [doc, nxt] if nxt.role == "assistant" else [doc]
+        if doc.role == "assistant" and pos > 0:
+            prev = self.docs[self.ids[pos - 1]]
+            return [prev, doc] if prev.role == "user" else [doc]
+        return [doc]
+
+
+class HistorySearch:
+    """Индексы пользователей (LRU)."""
+
+    def __init__(self, max_users: int = HISTORY_INDEX_USERS) -> None:
+        self.max_users = max_users
+        self._indexes: "OrderedDict[str, HistoryIndex]" = OrderedDict()
+        # hit — индекс уже в памяти, miss — собирается заново из БД
+        self.hits = 0
+        self.misses = 0
+
+    def index_for(self, user_id: str, epoch: int) -> HistoryIndex:
+        """Индекс пользователя; при смене эпохи истории — пустой (пересоберётся)."""
+        index = self._indexes.get(user_id)
+        if index is None or index.epoch != epoch:
+            self.misses += 1
+            index = HistoryIndex(epoch)
+            self._indexes[user_id] = index
+        else:
+            self.hits += 1
+        self._indexes.move_to_end(user_id)
+        while len(self._indexes) > self.max_users:
+            self._indexes.popitem(last=False)
+        return index
+
+
+_ROLE_NAMES = {"user": "Пользователь", "assistant": "Ассистент", "system": "Резюме"}
+
+
+def _date_label(created_at: str) -> str:
+    try:
+        return datetime.fromisoformat(created_at[:19]).strftime("%d.%m")
+    except ValueError:
+        return ""
+
+
+def retrieve(
+    index: HistoryIndex,
+    query: str,
+    *,
+    recent: int,
+    turns: int = CHAT_RETRIEVAL_TURNS,
+    budget_tokens: int = CHAT_RETRIEVAL_TOKENS,
+) -> str:
+    """
+    Блок для системного промпта: до turns ходов диалога старше окна из recent
+    последних сообщений, по релевантности к query, в пределах budget_tokens.
+    Пустая строка — ничего подходящего.
+    """
+    if turns <= 0 or len(index) <= recent:
+        return ""
+    before_id = index.ids[-recent] if recent > 0 else index.max_id + 1
+    chosen: Dict[int, _Doc] = {}
+    used = 0
+    picked = 0
+    for _, doc_id in index.search(query, before_id=before_id, limit=turns * 2):
+        if picked >= turns:
+            break
+        docs = [d for d in index.turn(doc_id) if d.id < before_id and d.id not in chosen]
+        if not docs:
+            continue
+        cost = sum(estimate_tokens(_snippet(d)) for d in docs)
+        if used + cost > budget_tokens:
+            continue
+        for d in docs:
+            chosen[d.id] = d
+        used += cost
+        picked += 1
+    if not chosen:
+        return ""
+    lines = [_snippet(chosen[doc_id]) for doc_id in sorted(chosen)]
+    return "Из более ранней переписки (если относится к вопросу):\n" + "\n".join(lines)
+
+
+def _snippet(doc: _Doc) -> str:
+    text = " ".join(doc.content.split())
+    if len(text) > SNIPPET_CHARS:
+        text = text[:SNIPPET_CHARS].rstrip() + "…"
+    label = _date_label(doc.created_at)
+    prefix = f"[{label}] " if label else ""
+    return f"{prefix}{_ROLE_NAMES.get(doc.role, doc.role)}: {text}"
@@ -0,0 +1,206 @@
+"""
+Локальный классификатор намерений: «none» (вопрос, болтовня) против команды.
+
+Нужен, чтобы не тратить LLM-запрос extract_command_with_ai на обычные реплики:
+если модель уверена, что команды нет, извлечение через ИИ пропускается.
+Сомнительные случаи по-прежнему уходят в LLM.
+
+Признаки — символьные n-граммы (хеширование в фиксированное число корзин),
+модель — логистическая регрессия. Чистый Python без numpy: признаков на
+сообщение — сотни, предсказание занимает десятки микросекунд.
+
+Обучение — scripts/train_intent_classifier.py по журналу ответов
+extract_command_with_ai (INTENT_LOG_PATH). Нет файла модели — классификатор
+выключен, поведение прежнее.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import re
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", "data/intent_model.json")
+# Журнал ответов LLM для обучения (JSONL); пусто — не пишем
+INTENT_LOG_PATH = os.getenv("INTENT_LOG_PATH", "")
+# Ниже этой вероятности команды — пропускаем LLM-извлечение
+INTENT_SKIP_THRESHOLD = float(os.getenv("INTENT_SKIP_THRESHOLD", "0.1"))
+
+DEFAULT_BUCKETS = 1 << 18
+NGRAM_RANGE = (2, 4)
+
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Нижний регистр, ё→е, схлопнутые пробелы; цифры → 0 (суммы не важны, важен факт числа)."""
+    text = (text or "").lower().replace("ё", "е")
+    text = re.sub(r"\d", "0", text)
+    return _SPACES_RE.sub(" ", text).strip()
+
+
+def features(text: str, buckets: int = DEFAULT_BUCKETS) -> Dict[int, float]:
+    """Хешированные символьные n-граммы внутри слов (с границами) + начало фразы."""
+    counts: Dict[int, float] = {}
+    norm = normalize(text)
+    low, high = NGRAM_RANGE
+    for word in norm.split(" "):
+        padded = f" {word} "
+        for n in range(low, high + 1):
+            for i in range(len(padded) - n + 1):
+                idx = zlib.crc32(padded[i:i + n].encode("utf-8")) % buckets
+                counts[idx] = counts.get(idx, 0.0) + 1.0
+    # Первое слово — сильный сигнал («потратил», «напомни», «как»)
+    first = norm.split(" ", 1)[0] if norm else ""
+    if first:
+        idx = zlib.crc32(("^" + first).encode("utf-8")) % buckets
+        counts[idx] = counts.get(idx, 0.0) + 1.0
+    # L2-нормировка, чтобы длина сообщения не решала за модель
+    norm_sq = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    return {k: v / norm_sq for k, v in counts.items()}
+
+
+def _sigmoid(z: float) -> float:
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+
+class IntentClassifier:
+    """Бинарная логистическая регрессия: вероятность того, что в сообщении команда."""
+
+    def __init__(
+        self,
+        weights: Optional[Dict[int, float]] = None,
+        bias: float = 0.0,
+        buckets: int = DEFAULT_BUCKETS,
+    ) -> None:
+        self.weights: Dict[int, float] = weights or {}
+        self.bias = bias
+        self.buckets = buckets
+
+    def predict_proba(self, text: str) -> float:
+        z = self.bias
+        for idx, value in features(text, self.buckets).items():
+            z += self.weights.get(idx, 0.0) * value
+        return _sigmoid(z)
+
+    def fit(
+        self,
+        samples: List[Tuple[str, int]],
+        *,
+        epochs: int = 15,
+        lr: float = 0.5,
+        l2: float = 1e-5,
+        seed: int = 42,
+    ) -> None:
+        """SGD по (текст, метка 0/1). Признаки считаются один раз."""
+        rng = random.Random(seed)
+        data = [(features(text, self.buckets), label) for text, label in samples]
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            step = lr / (1.0 + epoch * 0.5)
+            for feats, label in data:
+                z = self.bias + sum(self.weights.get(i, 0.0) * v for i, v in feats.items())
+                grad = _sigmoid(z) - label
+                self.bias -= step * grad
+                for i, v in feats.items():
+                    w = self.weights.get(i, 0.0)
+                    self.weights[i] = w - step * (grad * v + l2 * w)
+        # Нули не храним — файл модели меньше
+        self.weights = {i: w for i, w in self.weights.items() if abs(w) > 1e-6}
+
+    def save(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "version": 1,
+            "buckets": self.buckets,
+            "bias": self.bias,
+            "weights": {str(i): round(w, 6) for i, w in self.weights.items()},
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+        return cls(
+            weights={int(i): float(w) for i, w in payload["weights"].items()},
+            bias=float(payload["bias"]),
+            buckets=int(payload["buckets"]),
+        )
+
+
+_classifier: Optional[IntentClassifier] = None
+_loaded = False
+
+
+def get_classifier() -> Optional[IntentClassifier]:
+    """Модель из INTENT_MODEL_PATH (один раз на процесс) или None, если файла нет."""
+    global _classifier, _loaded
+    if not _loaded:
+        _loaded = True
+        if INTENT_MODEL_PATH and os.path.exists(INTENT_MODEL_PATH):
+            try:
+                _classifier = IntentClassifier.load(INTENT_MODEL_PATH)
+                logger.info("Intent classifier loaded from %s", INTENT_MODEL_PATH)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Intent classifier not loaded: %s", e)
+    return _classifier
+
+
+def should_skip_extraction(text: str) -> bool:
+    """True — модель уверена, что команды нет, LLM-извлечение не нужно."""
+    classifier = get_classifier()
+    if classifier is None:
+        return False
+    return classifier.predict_proba(text) < INTENT_SKIP_THRESHOLD
+
+
+def _append_log(path: str, line: str) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+async def log_extraction(text: str, intent: str) -> None:
+    """Дописать ответ LLM в журнал для обучения (если INTENT_LOG_PATH задан); файл — вне event loop."""
+    if not INTENT_LOG_PATH:
+        return
+    record = {"ts": datetime.now().isoformat(timespec="seconds"), "text": text, "intent": intent}
+    try:
+        await asyncio.to_thread(_append_log, INTENT_LOG_PATH, json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logger.debug("Intent log write failed: %s", e)
+
+
+def read_log(paths: Iterable[str]) -> List[Tuple[str, int]]:
+    """Журнал → пары (текст, 1 если команда иначе 0); повторы текста схлопываются."""
+    samples: Dict[str, int] = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                text = (record.get("text") or "").strip()
+                if not text:
+                    continue
+                intent = (record.get("intent") or "none").strip().lower()
+                samples[text] = 0 if intent == "none" else 1
+    return list(samples.items())
@@ -0,0 +1,170 @@
+"""
+Кэш ответов ИИ для запросов извлечения (extract_command_with_ai, extract_person_with_ai).
+
+Эти запросы детерминированы на практике (фиксированный промпт, temperature 0.1),
+а пользователи повторяют одни и те же фразы — «потратил 500 на обед»,
+«выполнил купить молоко». Ключ — sha256 от вида запроса, модели, текста промпта,
+подсказки с датой и сообщения со схлопнутыми пробелами; в значении — сырой ответ
+модели. Регистр в ключе сохраняется: ответ копирует из сообщения названия задач
+и имена, и чужое написание («позвонить ивану») не должно доставаться другим.
+
+Два уровня: LRU в памяти процесса (LLM_CACHE_MEMORY_ENTRIES) и таблица
+llm_cache в SQLite, которая переживает перезапуск. У записей есть срок жизни
+(LLM_CACHE_TTL_SECONDS); таблица периодически чистится от просроченных и
+лишних записей (LLM_CACHE_DB_ENTRIES). Счётчик попаданий копится в памяти
+и пишется в таблицу вместе со следующей записью — чтение остаётся без транзакций.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+DATABASE = "data/hub.db"
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "2000"))
+LLM_CACHE_DB_ENTRIES = int(os.getenv("LLM_CACHE_DB_ENTRIES", "20000"))
+# Как часто (в записях) чистить таблицу
+_PRUNE_EVERY = 200
+
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """Только пробелы: регистр и пунктуацию ответ извлечения копирует из сообщения."""
+    return _SPACES_RE.sub(" ", (message or "").strip())
+
+
+def make_key(kind: str, model: str, prompt: str, message: str, date_hint: str = "") -> str:
+    """Ключ кэша: меняется при смене модели, промпта, даты или сути сообщения."""
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+    raw = "\x1f".join((kind, model, prompt_hash, date_hint, normalize_message(message)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LlmCache:
+    """LRU в памяти поверх таблицы llm_cache."""
+
+    def __init__(
+        self,
+        db_path: str = DATABASE,
+        *,
+        ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+        memory_entries: int = LLM_CACHE_MEMORY_ENTRIES,
+        db_entries: int = LLM_CACHE_DB_ENTRIES,
+        enabled: bool = LLM_CACHE_ENABLED,
+    ) -> None:
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.db_entries = db_entries
+        self.enabled = enabled
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._writes = 0
+        # key -> попадания, ещё не записанные в llm_cache.hits
+        self._pending_hits: Dict[str, int] = {}
+        self.hits_memory = 0
+        self.hits_db = 0
+        self.misses = 0
+
+    def _remember(self, key: str, value: str, expires_at: float) -> None:
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        cached = self._memory.get(key)
+        if cached is not None:
+            value, expires_at = cached
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                self._note_hit(key)
+                return value
+            del self._memory[key]
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                cursor = await db.execute(
+                    "SELECT value, expires_at FROM llm_cache WHERE key = ?",
+                    (key,),
+                )
+                row = await cursor.fetchone()
+        except aiosqlite.Error as e:
+            logger.warning("LLM cache read failed: %s", e)
+            row = None
+        if row and row[1] > now:
+            self._remember(key, row[0], row[1])
+            self.hits_db += 1
+            self._note_hit(key)
+            return row[0]
+        self.misses += 1
+        return None
+
+    def _note_hit(self, key: str) -> None:
+        self._pending_hits[key] = self._pending_hits.get(key, 0) + 1
+
+    async def put(self, key: str, kind: str, value: str) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        self._remember(key, value, expires_at)
+        self._writes += 1
+        hits, self._pending_hits = self._pending_hits, {}
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                if hits:
+                    await db.executemany(
+                        "UPDATE llm_cache SET hits = hits + ? WHERE key = ?",
+                        [(count, hit_key) for hit_key, count in hits.items()],
+                    )
+                await db.execute(
+                    """
+                    INSERT OR REPLACE INTO llm_cache (key, kind, value, created_at, expires_at, hits)
+                    VALUES (?, ?, ?, ?, ?, 0)
+                    """,
+                    (key, kind, value, now, expires_at),
+                )
+                if self._writes % _PRUNE_EVERY == 0:
+                    await self._prune(db, now)
+                await db.commit()
+        except aiosqlite.Error as e:
+            logger.warning("LLM cache write failed: %s", e)
+
+    async def _prune(self, db: aiosqlite.Connection, now: float) -> None:
+        """Удалить просроченные записи и самые старые сверх LLM_CACHE_DB_ENTRIES."""
+        await db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+        await db.execute(
+            """
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.db_entries,),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.hits_memory + self.hits_db
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self._memory),
+            "hits_memory": self.hits_memory,
+            "hits_db": self.hits_db,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+        }
@@ -0,0 +1,207 @@
+"""
+Пакетная обработка памяти чата в непиковые часы.
+
+Без пакетного режима память обновляется прямо в ходе диалога: после каждого
+ответа LLM — memory_summary агента (update_memory_after_turn), по мере роста
+истории — её резюме (chat_summary). Это лишние вызовы ИИ в часы пик.
+
+С MEMORY_BATCH=1 оба обновления в диалоге выключены: ход лишь отмечается
+(agent_state.pending_turns, chat_summary.pending), а задача раз в сутки
+(MEMORY_BATCH_CRON, по умолчанию 03:30 МСК) находит пользователей:
+
+- у которых за окном контекста накопилось не меньше CHAT_SUMMARY_CHUNK
+  несжатых сообщений — дописывает историю в резюме;
+- у которых есть неучтённые в памяти ходы — обновляет memory_summary по
+  последним сообщениям диалога;
+
+и обрабатывает их с ограниченной параллельностью на дешёвой модели
+резюме (model_hint="summary", в очереди допуска — после интерактивных).
+
+Запуск вручную или из системного cron: python scripts/run_memory_batch.py
+(тогда MEMORY_BATCH_CRON= пустой — без планировщика в API).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+import aiosqlite
+
+from telemetry import correlation
+
+from . import ai_usage
+from .chat_summary import ChatSummarizer
+
+logger = logging.getLogger(__name__)
+
+DATABASE = "data/hub.db"
+
+MEMORY_BATCH_ENABLED = os.getenv("MEMORY_BATCH", "0") == "1"
+MEMORY_BATCH_CRON = os.getenv("MEMORY_BATCH_CRON", "30 3 * * *")
+MEMORY_BATCH_CONCURRENCY = int(os.getenv("MEMORY_BATCH_CONCURRENCY", "2"))
+MEMORY_BATCH_MAX_USERS = int(os.getenv("MEMORY_BATCH_MAX_USERS", "500"))
+# Сколько последних сообщений смотреть при обновлении памяти
+MEMORY_BATCH_MESSAGES = 30
+# Сколько раз подряд сжимать историю одного пользователя за запуск
+MAX_FOLDS_PER_USER = 5
+
+_ROLE_NAMES = {"user": "Пользователь", "assistant": "Ассистент", "system": "Резюме"}
+
+
+@dataclass
+class BatchReport:
+    summary_users: int = 0
+    summary_folds: int = 0
+    memory_users: int = 0
+    memory_updated: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class MemoryBatchJob:
+    """Поиск кандидатов и обработка резюме/памяти пачкой."""
+
+    def __init__(
+        self,
+        db_path: str = DATABASE,
+        *,
+        summarizer: ChatSummarizer,
+        agent: Any,
+        concurrency: int = MEMORY_BATCH_CONCURRENCY,
+        max_users: int = MEMORY_BATCH_MAX_USERS,
+    ) -> None:
+        self.db_path = db_path
+        self.summarizer = summarizer
+        self.agent = agent  # AgentCore: load_state / consolidate_memory / save_memory
+        self.concurrency = concurrency
+        self.max_users = max_users
+        self._lock = asyncio.Lock()
+        self.last_report: Optional[BatchReport] = None
+
+    async def _candidates(self) -> tuple[List[str], List[str]]:
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                """
+                SELECT user_id FROM chat_summary
+                WHERE level = 'recent' AND pending >= ?
+                ORDER BY pending DESC
+                LIMIT ?
+                """,
+                (self.summarizer.window + self.summarizer.chunk, self.max_users),
+            )
+            summary_users = [r[0] for r in await cursor.fetchall()]
+            cursor = await db.execute(
+                """
+                SELECT user_id FROM agent_state
+                WHERE pending_turns > 0
+                ORDER BY pending_turns DESC
+                LIMIT ?
+                """,
+                (self.max_users,),
+            )
+            memory_users = [r[0] for r in await cursor.fetchall()]
+        return summary_users, memory_users
+
+    async def _summarize(self, user_id: str) -> int:
+        folds = 0
+        while folds < MAX_FOLDS_PER_USER and await self.summarizer.fold(user_id):
+            folds += 1
+        return folds
+
+    async def _consolidate(self, user_id: str) -> bool:
+        state = await self.agent.load_state(user_id)
+        consumed = state.pending_turns
+        if consumed <= 0:
+            return False
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                """
+                SELECT role, content FROM chat_history
+                WHERE user_id = ?
+                ORDER BY id DESC
+                LIMIT ?
+                """,
+                (user_id, min(consumed * 2, MEMORY_BATCH_MESSAGES)),
+            )
+            rows = list(reversed(await cursor.fetchall()))
+        transcript = "\n".join(f"{_ROLE_NAMES.get(role, role)}: {content}" for role, content in rows)
+        memory = await self.agent.consolidate_memory(state, transcript or "\n".join(state.recent_actions))
+        if not memory:
+            return False
+        await self.agent.save_memory(user_id, memory, consumed)
+        return True
+
+    async def run(self) -> BatchReport:
+        """Один проход; параллельный повторный запуск ждёт завершения текущего."""
+        async with self._lock:
+            started = time.monotonic()
+            report = BatchReport()
+            summary_users, memory_users = await self._candidates()
+            report.summary_users, report.memory_users = len(summary_users), len(memory_users)
+            semaphore = asyncio.Semaphore(max(self.concurrency, 1))
+            # Один id на проход: вызовы ИИ пакета склеиваются в ai_calls и логах
+            batch_token = correlation.set_current(correlation.new_id("batch-"))
+
+            async def summarize(user_id: str) -> None:
+                # У каждой задачи gather своя копия контекста — пользователь не протекает
+                ai_usage.set_current_user(user_id)
+                async with semaphore:
+                    try:
+                        # Сначала дождаться: «+= await» прочитал бы счётчик до ожидания
+                        folds = await self._summarize(user_id)
+                        report.summary_folds += folds
+                    except Exception as e:
+                        report.errors += 1
+                        logger.error("Memory batch: summary failed for user %s: %s", user_id, e)
+
+            async def consolidate(user_id: str) -> None:
+                ai_usage.set_current_user(user_id)
+                async with semaphore:
+                    try:
+                        if await self._consolidate(user_id):
+                            report.memory_updated += 1
+                    except Exception as e:
+                        report.errors += 1
+                        logger.error("Memory batch: memory failed for user %s: %s", user_id, e)
+
+            try:
+                # Сначала резюме: память затем видит уже сжатую историю
+                await asyncio.gather(*(summarize(uid) for uid in summary_users))
+                await asyncio.gather(*(consolidate(uid) for uid in memory_users))
+            finally:
+                correlation.reset(batch_token)
+            report.seconds = round(time.monotonic() - started, 1)
+            self.last_report = report
+            logger.info("Memory batch done: %s", report.as_dict())
+            return report
+
+
+def start_scheduler(job: MemoryBatchJob, cron: str = MEMORY_BATCH_CRON):
+    """
+    Планировщик в процессе API (AsyncIOScheduler, время МСК, как у напоминаний бота).
+    Пустой cron — не запускать (задачу гоняет внешний cron через scripts/run_memory_batch.py).
+    """
+    if not cron.strip():
+        return None
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from apscheduler.triggers.cron import CronTrigger
+
+    scheduler = AsyncIOScheduler(timezone="Europe/Moscow")
+    scheduler.add_job(
+        job.run,
+        CronTrigger.from_crontab(cron, timezone="Europe/Moscow"),
+        id="memory_batch",
+        coalesce=True,
+        max_instances=1,
+        misfire_grace_time=3600,
+    )
+    scheduler.start()
+    logger.info("Memory batch scheduled: %s (Europe/Moscow)", cron)
+    return scheduler
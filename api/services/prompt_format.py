@@ -0,0 +1,94 @@
+"""
+Компактная сериализация данных пользователя для системного промпта.
+
+json.dumps списка словарей повторяет имена ключей в каждой строке и тащит null,
+пустые строки и полные ISO-даты. Здесь список превращается в таблицу:
+строка-заголовок с именами колонок и по строке на запись, значения через «|».
+
+- колонки, пустые во всех строках, выкидываются; пустые значения — пустые ячейки;
+- даты YYYY-MM-DD → DD.MM (текущий год) или DD.MM.YY;
+- 80000.0 → 80000, True/False → да/нет, списки — через запятую;
+- «|» и переводы строк в значениях заменяются, чтобы не ломать таблицу.
+
+Модели читают такие таблицы не хуже JSON, а токенов уходит заметно меньше
+(проверка — benchmarks/bench_prompt_format.py).
+"""
+from __future__ import annotations
+
+import re
+from datetime import date
+from typing import Any, Dict, Optional, Sequence
+
+_ISO_DATE_RE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?$")
+_CELL_BREAK_RE = re.compile(r"[|\r\n]+")
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def format_value(value: Any, today: Optional[date] = None) -> str:
+    """Одно значение ячейки."""
+    if _is_empty(value):
+        return ""
+    if isinstance(value, bool):
+        return "да" if value else "нет"
+    if isinstance(value, float):
+        return f"{value:.0f}" if value.is_integer() else f"{value:g}"
+    if isinstance(value, (list, tuple)):
+        return ",".join(format_value(v, today) for v in value if not _is_empty(v))
+    if isinstance(value, dict):
+        return ",".join(f"{k}={format_value(v, today)}" for k, v in value.items() if not _is_empty(v))
+    text = str(value).strip()
+    m = _ISO_DATE_RE.match(text)
+    if m:
+        year, month, day = m.groups()
+        current_year = (today or date.today()).year
+        return f"{day}.{month}" if int(year) == current_year else f"{day}.{month}.{year[2:]}"
+    return _CELL_BREAK_RE.sub(" ", text)
+
+
+def table(
+    rows: Sequence[Dict[str, Any]],
+    columns: Optional[Sequence[str]] = None,
+    *,
+    today: Optional[date] = None,
+) -> str:
+    """
+    Список словарей → «колонка|колонка» и строки значений (через перевод строки).
+
+    columns — порядок колонок; по умолчанию ключи в порядке появления.
+    Пустой список (или все значения пустые) — пустая строка.
+    """
+    if not rows:
+        return ""
+    if columns is None:
+        seen: Dict[str, None] = {}
+        for row in rows:
+            for key in row:
+                seen.setdefault(key, None)
+        columns = list(seen)
+    cells = [[format_value(row.get(col), today) for col in columns] for row in rows]
+    keep = [i for i, _ in enumerate(columns) if any(r[i] for r in cells)]
+    if not keep:
+        return ""
+    lines = ["|".join(columns[i] for i in keep)]
+    lines.extend("|".join(r[i] for i in keep) for r in cells)
+    return "\n".join(lines)
+
+
+def section(
+    rows: Sequence[Dict[str, Any]],
+    columns: Optional[Sequence[str]] = None,
+    *,
+    today: Optional[date] = None,
+) -> str:
+    """Блок для строки промпта «• Заголовок: …»: таблица с новой строки или «нет»."""
+    body = table(rows, columns, today=today)
+    return "\n" + body if body else "нет"
+
+
+def row_text(row: Dict[str, Any], today: Optional[date] = None) -> str:
+    """Строка таблицы для одной записи (для оценки её стоимости в токенах)."""
+    return "|".join(format_value(v, today) for v in row.values())
+
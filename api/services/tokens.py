@@ -0,0 +1,35 @@
+"""
+Оценка числа токенов без токенизатора провайдера.
+
+Точный счёт зависит от модели; для бюджетов промпта и лимитов TPM достаточно
+грубой оценки. Русский текст дробится на токены мельче английского,
+поэтому берём ~3 символа на токен.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any
+
+CHARS_PER_TOKEN = 3
+# Служебные токены на сообщение чата (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Примерное число токенов в строке."""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Обрезать строку примерно до `tokens` токенов (с многоточием)."""
+    limit = max(tokens, 0) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[: max(limit - 1, 0)].rstrip() + "…"
+
+
+def estimate_json_tokens(value: Any) -> int:
+    """Токены значения в том виде, как оно попадает в промпт (json.dumps)."""
+    return estimate_tokens(json.dumps(value, ensure_ascii=False))
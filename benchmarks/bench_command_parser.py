@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Эталонный корпус и микробенчмарк для api/services/command_parser.py.
+
+Использование:
+  python benchmarks/bench_command_parser.py            # проверка корпуса + замер
+  python benchmarks/bench_command_parser.py --check    # только проверка (код выхода 1 при расхождении)
+  python benchmarks/bench_command_parser.py --update   # перезаписать эталон текущим разбором
+
+Эталон (command_parser_golden.json) снят с прежней реализации parse_user_command
+при «сегодня» = дате из файла; здесь datetime в парсере подменяется этой датой.
+Обновлять эталон стоит только при осознанном изменении поведения.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+# Добавляем корень проекта в path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from api.services import command_parser
+
+GOLDEN_PATH = Path(__file__).resolve().parent / "command_parser_golden.json"
+
+
+def _freeze_today(today: date) -> None:
+    """Подменяет datetime.now() в парсере на фиксированный день."""
+
+    class _Frozen(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls(today.year, today.month, today.day, 10, 30)
+
+    command_parser.datetime = _Frozen
+
+
+def check(golden: dict) -> int:
+    """Сверяет разбор с эталоном; возвращает число расхождений."""
+    failures = 0
+    for case in golden["cases"]:
+        got = command_parser.parse_user_command(case["message"], "0")
+        if got != case["expected"]:
+            failures += 1
+            print(f"MISMATCH {case['message']!r}\n  expected: {case['expected']}\n  got:      {got}")
+    total = len(golden["cases"])
+    print(f"Корпус: {total - failures}/{total} совпадений")
+    return failures
+
+
+def bench(messages, repeats: int) -> None:
+    """Время разбора одного сообщения: медиана по прогонам всего корпуса."""
+    for message in messages:  # прогрев
+        command_parser.parse_user_command(message, "0")
+    per_message = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for message in messages:
+            command_parser.parse_user_command(message, "0")
+        per_message.append((time.perf_counter() - started) / len(messages) * 1e6)
+    per_message.sort()
+    q1, _, q3 = statistics.quantiles(per_message, n=4)
+    print(
+        f"parse_user_command: медиана {statistics.median(per_message):.1f} мкс/сообщение "
+        f"(IQR {q1:.1f}–{q3:.1f}, {repeats} прогонов по {len(messages)} сообщений)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Эталон и микробенчмарк parse_user_command")
+    parser.add_argument("--check", action="store_true", help="Только сверка с эталоном")
+    parser.add_argument("--update", action="store_true", help="Перезаписать эталон текущим разбором")
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    golden = json.loads(GOLDEN_PATH.read_text(encoding="utf-8"))
+    _freeze_today(date.fromisoformat(golden["today"]))
+
+    if args.update:
+        for case in golden["cases"]:
+            case["expected"] = command_parser.parse_user_command(case["message"], "0")
+        GOLDEN_PATH.write_text(json.dumps(golden, ensure_ascii=False, indent=1) + "\n", encoding="utf-8")
+        print(f"Эталон обновлён: {GOLDEN_PATH}")
+        return
+
+    failures = check(golden)
+    if args.check:
+        sys.exit(1 if failures else 0)
+    bench([case["message"] for case in golden["cases"]], args.repeats)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
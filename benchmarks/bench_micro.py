@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарки CPU-функций, которые выполняются на каждом запросе.
+
+Использование:
+  python benchmarks/bench_micro.py run                      # замер, таблица
+  python benchmarks/bench_micro.py run -k parse --out now.json
+  python benchmarks/bench_micro.py save-baseline            # перезаписать micro_baseline.json
+  python benchmarks/bench_micro.py compare                  # замер против micro_baseline.json
+  python benchmarks/bench_micro.py compare old.json new.json --threshold 0.2
+
+Каждый случай — функция на фиксированном корпусе (команды из
+command_parser_golden.json, даты, строки контактов, подписанный initData,
+задачи для контекста чата, данные для промпта). Замер как у timeit: сначала
+разогрев, затем число вызовов в одном замере подбирается так, чтобы замер
+длился не меньше --min-sample-ms; --repeats замеров с выключенным GC.
+В отчёте — медиана и межквартильный размах (IQR) времени одного прохода
+по корпусу в микросекундах.
+
+compare помечает регрессию, если медиана выросла больше порога и
+межквартильные интервалы не пересекаются (чтобы не ловить шум); код
+выхода 1. Базовая линия зависит от машины — обновлять её стоит на той же
+машине, где идёт сравнение.
+"""
+
+import argparse
+import gc
+import hmac
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from hashlib import sha256
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import quote
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+sys.path.insert(0, str(BENCH_DIR))
+
+from api.agent_core import DEFAULT_PERSONA, AgentCore, AgentState
+from api.main import _dedupe_tasks, _strip_tasks
+from api.services import command_parser, prompt_format
+from api.telegram_auth import get_user_id_from_init_data
+from bench_command_parser import GOLDEN_PATH, _freeze_today
+
+BASELINE_PATH = BENCH_DIR / "micro_baseline.json"
+BOT_TOKEN = "123456:bench-token"
+
+DATES = [
+    "сегодня", "завтра вечером", "послезавтра", "через неделю", "через месяц",
+    "15.03", "1.4.2025", "к 28.02.2026", "в пятницу", "когда-нибудь", "до 31.12",
+]
+PERSON_TAILS = [
+    "сын, 02.09.2020, вредный, очень милый",
+    "коллега; надёжный; опаздывает",
+    "жена заботливая отлично организует",
+    "подрядчик, электрик, ответственный, дорогой",
+    "друг",
+    "",
+    "мама, добрая, переживает по пустякам, любит сад",
+]
+
+
+def _init_data(user_id: int, *, valid: bool = True) -> str:
+    """initData как от Telegram WebApp, подписанный BOT_TOKEN."""
+    fields = {
+        "auth_date": "1741770000",
+        "query_id": "AAHdF6IQAAAAAN0XohDhrOrc",
+        "user": json.dumps({"id": user_id, "first_name": "Тест", "language_code": "ru"}, ensure_ascii=False),
+    }
+    check = "\n".join(f"{k}={fields[k]}" for k in sorted(fields))
+    secret = hmac.new(b"WebAppData", BOT_TOKEN.encode(), sha256).digest()
+    digest = hmac.new(secret, check.encode(), sha256).hexdigest()
+    if not valid:
+        digest = "0" * len(digest)
+    return "&".join(f"{k}={quote(v)}" for k, v in fields.items()) + f"&hash={digest}"
+
+
+def _tasks(today: date, n: int = 120) -> List[Dict]:
+    """Активные задачи как из SELECT в _prepare_chat (с папками и дублями)."""
+    out = []
+    for i in range(n):
+        title = f"Задача {i % 90}" if i % 3 else f"[Работа] Задача {i % 90}"
+        out.append({
+            "id": i,
+            "title": title,
+            "description": "",
+            "deadline": (today + timedelta(days=i % 11 - 5)).isoformat(),
+            "priority": ("low", "medium", "high")[i % 3],
+            "done": 0,
+        })
+    return out
+
+
+def build_cases() -> Dict[str, Tuple[Callable[[], None], int]]:
+    """Случаи: имя → (один проход по корпусу, размер корпуса)."""
+    golden = json.loads(GOLDEN_PATH.read_text(encoding="utf-8"))
+    today = date.fromisoformat(golden["today"])
+    _freeze_today(today)
+    messages = [case["message"] for case in golden["cases"]]
+    init_data = [_init_data(100_000 + i) for i in range(8)] + [_init_data(1, valid=False)]
+    tasks = _tasks(today)
+    short_tasks = _strip_tasks(tasks)
+    goals = [
+        {"title": f"Цель {i}", "target_amount": 150000.0, "current_amount": 45000.0 + i,
+         "target_date": (today + timedelta(days=40 * i)).isoformat(), "priority": 1}
+        for i in range(6)
+    ]
+    state = AgentState(
+        user_id="bench",
+        persona=DEFAULT_PERSONA,
+        active_goals=[f"цель {i}" for i in range(8)],
+        recent_actions=[f"direct_action: 'сообщение {i}' -> 'ответ {i}'" for i in range(10)],
+        memory_summary="Пользователь копит на отпуск, ведёт ремонт и следит за расходами на еду.",
+    )
+    agent = AgentCore(":memory:")
+    base_prompt = "\n".join(f"• Строка данных пользователя номер {i}: " + "x" * 60 for i in range(40))
+
+    def parse_user_command():
+        for message in messages:
+            command_parser.parse_user_command(message, "0")
+
+    def parse_relative_date():
+        for text in DATES:
+            command_parser.parse_relative_date(text)
+
+    def parse_person_tail():
+        for text in PERSON_TAILS:
+            command_parser._parse_person_roles_strengths_weaknesses(text)
+
+    def init_data_auth():
+        for raw in init_data:
+            get_user_id_from_init_data(raw, BOT_TOKEN)
+
+    def build_system_prompt():
+        agent.build_system_prompt(base_prompt, state, "question")
+
+    def chat_dedupe_strip():
+        _strip_tasks(_dedupe_tasks(tasks))
+
+    def prompt_section():
+        prompt_format.section(short_tasks, today=today)
+        prompt_format.section(goals, today=today)
+
+    def prompt_json_dumps():
+        json.dumps(short_tasks, ensure_ascii=False)
+        json.dumps(goals, ensure_ascii=False)
+
+    return {
+        "parse_user_command": (parse_user_command, len(messages)),
+        "parse_relative_date": (parse_relative_date, len(DATES)),
+        "parse_person_roles_strengths_weaknesses": (parse_person_tail, len(PERSON_TAILS)),
+        "get_user_id_from_init_data": (init_data_auth, len(init_data)),
+        "agent_build_system_prompt": (build_system_prompt, 1),
+        "chat_dedupe_strip_tasks": (chat_dedupe_strip, len(tasks)),
+        "prompt_format_section": (prompt_section, len(short_tasks) + len(goals)),
+        "prompt_json_dumps": (prompt_json_dumps, len(short_tasks) + len(goals)),
+    }
+
+
+def measure(fn: Callable[[], None], *, repeats: int, warmup_s: float, min_sample_ms: float) -> Dict[str, float]:
+    """Время одного вызова fn в мкс: медиана, квартили, минимум по repeats замерам."""
+    deadline = time.perf_counter() + warmup_s
+    while time.perf_counter() < deadline:
+        fn()
+    # Подбор числа вызовов на замер (как timeit.autorange)
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if (time.perf_counter() - started) * 1000 >= min_sample_ms:
+            break
+        number *= 2
+
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            started = time.perf_counter()
+            for _ in range(number):
+                fn()
+            samples.append((time.perf_counter() - started) / number * 1e6)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    q1, _, q3 = statistics.quantiles(samples, n=4)
+    return {
+        "median_us": round(statistics.median(samples), 3),
+        "q1_us": round(q1, 3),
+        "q3_us": round(q3, 3),
+        "iqr_us": round(q3 - q1, 3),
+        "min_us": round(min(samples), 3),
+        "number": number,
+        "repeats": repeats,
+    }
+
+
+def run_suite(args: argparse.Namespace) -> Dict:
+    results = {}
+    for name, (fn, corpus) in build_cases().items():
+        if args.filter and args.filter not in name:
+            continue
+        stats = measure(fn, repeats=args.repeats, warmup_s=args.warmup, min_sample_ms=args.min_sample_ms)
+        stats["corpus"] = corpus
+        results[name] = stats
+        print(f"{name:<42} {stats['median_us']:>11.2f} мкс  IQR {stats['q1_us']:.2f}–{stats['q3_us']:.2f}"
+              f"  ({corpus} эл., {stats['number']}×{stats['repeats']})")
+    return {
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def compare(old: Dict, new: Dict, threshold: float) -> List[str]:
+    """Печатает изменения медиан; возвращает регрессии (рост > порога при непересекающихся IQR)."""
+    regressions = []
+    print(f"\n{'Случай':<42} {'было, мкс':>11} {'стало, мкс':>11} {'изм.':>7}")
+    for name, b in new["results"].items():
+        a = old["results"].get(name)
+        if a is None:
+            print(f"{name:<42} {'—':>11} {b['median_us']:>11.2f}   новый")
+            continue
+        change = (b["median_us"] - a["median_us"]) / a["median_us"] if a["median_us"] else 0.0
+        flag = ""
+        if change > threshold and b["q1_us"] > a["q3_us"]:
+            flag = "  РЕГРЕССИЯ"
+            regressions.append(f"{name}: {a['median_us']:.2f} → {b['median_us']:.2f} мкс ({change:+.0%})")
+        print(f"{name:<42} {a['median_us']:>11.2f} {b['median_us']:>11.2f} {change:>+7.0%}{flag}")
+    if old.get("python") != new.get("python") or old.get("machine") != new.get("machine"):
+        print(f"\nВнимание: базовая линия снята на {old.get('machine')}, Python {old.get('python')}")
+    return regressions
+
+
+def _write(path: Path, data: Dict) -> None:
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=1) + "\n", encoding="utf-8")
+    print(f"\nЗаписано: {path}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих функций API")
+    parser.add_argument("command", choices=["run", "save-baseline", "compare"])
+    parser.add_argument("files", nargs="*", help="compare: [старый.json новый.json] вместо нового замера")
+    parser.add_argument("-k", "--filter", help="только случаи, в имени которых есть подстрока")
+    parser.add_argument("--repeats", type=int, default=30)
+    parser.add_argument("--warmup", type=float, default=0.2, help="секунд разогрева на случай")
+    parser.add_argument("--min-sample-ms", type=float, default=20.0)
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--threshold", type=float, default=0.15, help="допустимый рост медианы (0.15 = 15%%)")
+    parser.add_argument("--out", help="run: записать результат в файл")
+    args = parser.parse_args()
+
+    if args.command == "compare" and len(args.files) == 2:
+        old, new = (json.loads(Path(p).read_text(encoding="utf-8")) for p in args.files)
+    else:
+        new = run_suite(args)
+        if args.command == "save-baseline":
+            _write(Path(args.baseline), new)
+            return
+        if args.command == "run":
+            if args.out:
+                _write(Path(args.out), new)
+            return
+        old = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+
+    regressions = compare(old, new, args.threshold)
+    if regressions:
+        print(f"\nРегрессии (порог {args.threshold:.0%}):")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nРегрессий нет.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Сравнение размера блоков данных в промпте чата: json.dumps против
+компактных таблиц api/services/prompt_format.py.
+
+Использование:
+  python benchmarks/bench_prompt_format.py               # требуется сокращение не меньше 35%
+  python benchmarks/bench_prompt_format.py --min-reduction 0.4
+
+Создаёт временную БД, заполняет её scripts/seed_test_data.py и строит те же
+блоки, что идут в base_prompt: задачи, контакты, проекты, операции, цели,
+лимиты. Токены — по оценке api/services/tokens.py. Код выхода 1, если
+сокращение меньше порога.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import aiosqlite
+
+USER_ID = "bench"
+
+
+async def load_blocks(today: date) -> dict:
+    """Данные в том виде, в каком _prepare_chat передаёт их в промпт."""
+    start_month = today.replace(day=1).isoformat()
+    async with aiosqlite.connect("data/hub.db") as db:
+        db.row_factory = aiosqlite.Row
+
+        async def rows(sql, params=(USER_ID,)):
+            cursor = await db.execute(sql, params)
+            return [dict(r) for r in await cursor.fetchall()]
+
+        tasks = await rows(
+            "SELECT title, deadline, priority FROM tasks WHERE user_id = ? AND done = 0 ORDER BY deadline ASC"
+        )
+        people = []
+        for row in await rows("SELECT fio, data FROM people WHERE user_id = ?"):
+            person = {"fio": row["fio"]}
+            person.update(json.loads(row["data"]))
+            people.append(person)
+        projects = await rows(
+            "SELECT id, title, status, deadline, budget, revenue_goal FROM projects WHERE user_id = ? AND status != 'done'"
+        )
+        operations = await rows(
+            "SELECT date, amount, type, category, comment FROM finance_transactions "
+            "WHERE user_id = ? ORDER BY date DESC, id DESC LIMIT 20"
+        )
+        goals = await rows(
+            "SELECT title, target_amount, current_amount, target_date, priority FROM finance_goals WHERE user_id = ?"
+        )
+        spent = {
+            r["category"]: r["total"]
+            for r in await rows(
+                "SELECT category, SUM(amount) AS total FROM finance_transactions "
+                "WHERE user_id = ? AND type = 'expense' AND date >= ? GROUP BY category",
+                (USER_ID, start_month),
+            )
+        }
+        limits = [
+            {"category": r["category"], "spent": spent.get(r["category"], 0) or 0, "limit": r["amount"],
+             "over": (spent.get(r["category"], 0) or 0) > r["amount"]}
+            for r in await rows("SELECT category, amount FROM finance_limits WHERE user_id = ?")
+        ]
+    return {
+        "tasks": tasks,
+        "people": people,
+        "projects": projects,
+        "operations": operations,
+        "goals": goals,
+        "limits": limits,
+    }
+
+
+async def run(min_reduction: float) -> bool:
+    from api.main import PROJECT_PROMPT_COLUMNS, init_db
+    from api.services.prompt_format import section
+    from api.services.tokens import estimate_json_tokens, estimate_tokens
+    import seed_test_data
+
+    await init_db()
+    await seed_test_data.seed(USER_ID)
+    today = date.today()
+    blocks = await load_blocks(today)
+
+    total_json = total_compact = 0
+    print(f"{'блок':<12}{'строк':>7}{'JSON':>8}{'таблица':>9}{'экономия':>10}")
+    for name, rows in blocks.items():
+        columns = PROJECT_PROMPT_COLUMNS if name == "projects" else None
+        json_tokens = estimate_json_tokens(rows) if rows else estimate_tokens("нет")
+        compact_tokens = estimate_tokens(section(rows, columns, today=today))
+        total_json += json_tokens
+        total_compact += compact_tokens
+        saved = 1 - compact_tokens / json_tokens if json_tokens else 0
+        print(f"{name:<12}{len(rows):>7}{json_tokens:>8}{compact_tokens:>9}{saved:>10.0%}")
+    reduction = 1 - total_compact / total_json
+    print(f"{'итого':<12}{'':>7}{total_json:>8}{total_compact:>9}{reduction:>10.0%}")
+    ok = reduction >= min_reduction
+    print(("OK" if ok else "FAIL") + f": сокращение {reduction:.0%} (порог {min_reduction:.0%})")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Размер блоков данных промпта: JSON против таблиц")
+    parser.add_argument("--min-reduction", type=float, default=0.35)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)  # API и seed работают с относительным data/hub.db
+        try:
+            ok = asyncio.run(run(args.min_reduction))
+        finally:
+            os.chdir(cwd)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Локальная замена LLM-провайдеров для нагрузочных тестов.
+
+Отвечает в форматах, которые понимает api/services/ai_client.py:
+
+- OpenAI-совместимый POST /v1/chat/completions (и /chat/completions) —
+  обычный ответ и поток SSE с финальным куском usage (stream_options);
+- Yandex Foundation Models POST /foundationModels/v1/completion — JSON
+  и поток JSON-строк с накопленным текстом и result.usage.
+
+Запросы извлечения (_extract_json_with_ai в api/main.py) распознаются по
+началу промпта и получают заготовленный JSON: по умолчанию команда
+{"intent": "none"} (чат идёт дальше как обычный диалог), контакт — фиксированная
+карточка. Остальное — текст-заглушка длиной --reply-tokens (не больше max_tokens
+запроса).
+
+Задержка до первого байта — из распределения (--latency):
+  fixed:300            всегда 300 мс
+  uniform:200:900      равномерно от 200 до 900 мс
+  lognormal:600:0.5    логнормальное с медианой 600 мс и sigma 0.5
+В потоке между кусками ещё --chunk-delay мс. Ошибки: --error-rate (доля
+ответов 500), --rate-limit-rate (доля 429 с Retry-After).
+
+Использование:
+  python benchmarks/fake_llm.py --port 8910 --latency lognormal:600:0.5 --rate-limit-rate 0.02
+
+и API с ключом любого провайдера, указывающим на заглушку:
+  OPENROUTER_API_KEY=fake OPENROUTER_BASE_URL=http://127.0.0.1:8910/v1
+  YANDEX_API_KEY=fake YANDEX_FOLDER_ID=fake YANDEX_BASE_URL=http://127.0.0.1:8910
+
+GET /stats — счётчики запросов и инъекций, POST /stats/reset — обнулить.
+benchmarks/loadtest.py запускает заглушку этой же командой отдельным процессом.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from api.services.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+# Начала промптов извлечения из api/main.py
+COMMAND_PROMPT_PREFIX = "Определи намерение пользователя по сообщению."
+PERSON_PROMPT_PREFIX = "Из строки пользователя извлеки данные контакта"
+
+DEFAULT_COMMAND_JSON = '{"intent":"none"}'
+DEFAULT_PERSON_JSON = (
+    '{"fio": "Иванов Иван Иванович", "relation": "коллега", "birth_date": null, '
+    '"strengths": "", "weaknesses": ""}'
+)
+
+_FILLER = (
+    "Хорошо, давайте разберёмся по шагам. Сначала стоит посмотреть на текущие задачи "
+    "и сроки, затем распределить время и отметить главное на эту неделю. "
+)
+# Сколько токенов ответа в одном куске потока
+STREAM_CHUNK_TOKENS = 8
+
+
+class Latency:
+    """Распределение задержки в мс из строки вида kind:param[:param]."""
+
+    def __init__(self, spec: str) -> None:
+        parts = spec.split(":")
+        self.kind = parts[0]
+        try:
+            self.params = [float(p) for p in parts[1:]]
+        except ValueError:
+            raise ValueError(f"Bad latency spec: {spec!r}") from None
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}.get(self.kind)
+        if expected is None or len(self.params) != expected:
+            raise ValueError(f"Bad latency spec: {spec!r} (fixed:MS, uniform:MIN:MAX, lognormal:MEDIAN:SIGMA)")
+        self.spec = spec
+
+    def sample_ms(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(self.params[0], self.params[1])
+        median, sigma = self.params
+        return median * rng.lognormvariate(0.0, sigma)
+
+
+@dataclass
+class FakeLLMConfig:
+    latency: str = "lognormal:600:0.5"
+    chunk_delay_ms: float = 30.0
+    reply_tokens: int = 120
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: int = 1
+    command_json: str = DEFAULT_COMMAND_JSON
+    person_json: str = DEFAULT_PERSON_JSON
+    seed: Optional[int] = None
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.requests = 0
+        self.streams = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.by_kind: Dict[str, int] = {}
+        self.started = time.time()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "streams": self.streams,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "by_kind": dict(self.by_kind),
+            "seconds": round(time.time() - self.started, 1),
+        }
+
+
+def _request_kind(prompt_text: str) -> str:
+    if prompt_text.startswith(COMMAND_PROMPT_PREFIX):
+        return "command"
+    if prompt_text.startswith(PERSON_PROMPT_PREFIX):
+        return "person"
+    return "chat"
+
+
+def _filler(tokens: int) -> str:
+    chars = max(tokens, 1) * CHARS_PER_TOKEN
+    text = _FILLER * (chars // len(_FILLER) + 1)
+    return text[:chars].rstrip()
+
+
+def _chunks(text: str) -> List[str]:
+    size = STREAM_CHUNK_TOKENS * CHARS_PER_TOKEN
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def create_app(config: FakeLLMConfig) -> FastAPI:
+    """Приложение-заглушка с заданными задержками и инъекцией ошибок."""
+    app = FastAPI(title="fake-llm")
+    latency = Latency(config.latency)
+    rng = random.Random(config.seed)
+    stats = _Stats()
+    app.state.config = config
+    app.state.stats = stats
+
+    def reply_for(prompt_text: str, max_tokens: int) -> tuple[str, str]:
+        kind = _request_kind(prompt_text)
+        stats.by_kind[kind] = stats.by_kind.get(kind, 0) + 1
+        if kind == "command":
+            return kind, config.command_json
+        if kind == "person":
+            return kind, config.person_json
+        return kind, _filler(min(config.reply_tokens, max_tokens or config.reply_tokens))
+
+    async def injected_failure() -> Optional[JSONResponse]:
+        """Задержка до ответа; 429 или 500 с заданной вероятностью."""
+        stats.requests += 1
+        await asyncio.sleep(latency.sample_ms(rng) / 1000)
+        roll = rng.random()
+        if roll < config.rate_limit_rate:
+            stats.rate_limited += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit exceeded (fake)", "code": 429}},
+                status_code=429,
+                headers={"Retry-After": str(config.retry_after)},
+            )
+        if roll < config.rate_limit_rate + config.error_rate:
+            stats.errors += 1
+            return JSONResponse({"error": {"message": "Internal error (fake)", "code": 500}}, status_code=500)
+        return None
+
+    async def openai_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        first_user = next((str(m.get("content") or "") for m in messages if m.get("role") == "user"), "")
+        prompt_tokens = sum(estimate_tokens(str(m.get("content") or "")) for m in messages)
+        failure = await injected_failure()
+        if failure is not None:
+            return failure
+        _, text = reply_for(first_user, int(body.get("max_tokens") or 0))
+        model = body.get("model") or "fake"
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": estimate_tokens(text),
+            "total_tokens": prompt_tokens + estimate_tokens(text),
+        }
+        if not body.get("stream"):
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        stats.streams += 1
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        def chunk(delta: Dict[str, Any], finish: Optional[str] = None, **extra: Any) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}] if delta is not None else [],
+                **extra,
+            }
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        async def events() -> AsyncIterator[str]:
+            yield chunk({"role": "assistant", "content": ""})
+            for i, piece in enumerate(_chunks(text)):
+                if i:
+                    await asyncio.sleep(config.chunk_delay_ms / 1000)
+                yield chunk({"content": piece})
+            yield chunk({}, "stop")
+            if include_usage:
+                yield chunk(None, usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    app.post("/v1/chat/completions")(openai_completions)
+    app.post("/chat/completions")(openai_completions)
+
+    @app.post("/foundationModels/v1/completion")
+    async def yandex_completion(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        first_user = next((str(m.get("text") or "") for m in messages if m.get("role") == "user"), "")
+        prompt_tokens = sum(estimate_tokens(str(m.get("text") or "")) for m in messages)
+        options = body.get("completionOptions") or {}
+        failure = await injected_failure()
+        if failure is not None:
+            return failure
+        _, text = reply_for(first_user, int(options.get("maxTokens") or 0))
+        model_version = "fake"
+
+        def result(partial: str, status: str) -> Dict[str, Any]:
+            # Yandex отдаёт числа usage строками
+            return {
+                "result": {
+                    "alternatives": [{"message": {"role": "assistant", "text": partial}, "status": status}],
+                    "usage": {
+                        "inputTextTokens": str(prompt_tokens),
+                        "completionTokens": str(estimate_tokens(partial)),
+                        "totalTokens": str(prompt_tokens + estimate_tokens(partial)),
+                    },
+                    "modelVersion": model_version,
+                }
+            }
+
+        if not options.get("stream"):
+            return result(text, "ALTERNATIVE_STATUS_FINAL")
+
+        stats.streams += 1
+
+        async def lines() -> AsyncIterator[str]:
+            sent = ""
+            pieces = _chunks(text)
+            for i, piece in enumerate(pieces):
+                if i:
+                    await asyncio.sleep(config.chunk_delay_ms / 1000)
+                sent += piece
+                status = "ALTERNATIVE_STATUS_FINAL" if i == len(pieces) - 1 else "ALTERNATIVE_STATUS_PARTIAL"
+                yield json.dumps(result(sent, status), ensure_ascii=False) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/json")
+
+    @app.get("/stats")
+    async def get_stats():
+        return {"config": asdict(config), **stats.as_dict()}
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        stats.reset()
+        return {"ok": True}
+
+    return app
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Локальная заглушка LLM (OpenAI-совместимый и Yandex API)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8910)
+    parser.add_argument("--latency", default=FakeLLMConfig.latency,
+                        help="fixed:MS | uniform:MIN:MAX | lognormal:MEDIAN:SIGMA (мс до первого байта)")
+    parser.add_argument("--chunk-delay", type=float, default=FakeLLMConfig.chunk_delay_ms,
+                        help="мс между кусками потока")
+    parser.add_argument("--reply-tokens", type=int, default=FakeLLMConfig.reply_tokens)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=FakeLLMConfig.retry_after)
+    parser.add_argument("--command-json", default=DEFAULT_COMMAND_JSON, help="ответ на извлечение команды")
+    parser.add_argument("--person-json", default=DEFAULT_PERSON_JSON, help="ответ на извлечение контакта")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeLLMConfig:
+    return FakeLLMConfig(
+        latency=args.latency,
+        chunk_delay_ms=args.chunk_delay,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        command_json=args.command_json,
+        person_json=args.person_json,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    import uvicorn
+
+    args = parse_args()
+    config = config_from_args(args)
+    Latency(config.latency)  # ошибка в спецификации — до старта сервера
+    print(f"Fake LLM on http://{args.host}:{args.port} (latency {config.latency})")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест API: смесь сценариев от тысяч синтетических пользователей.
+
+Сценарии повторяют то, что делает Hub (hub/app.js) и бот:
+  hub_open     — loadAllData (GET tasks/people/projects параллельно), затем
+                 Finance.load (GET finance/summary, затем finance/transactions);
+  task_toggle  — список задач, при пустом — создание, и PATCH done туда-обратно;
+  transaction  — POST finance/transactions и пересчёт finance/summary;
+  chat         — POST /api/chat (ИИ — локальная заглушка benchmarks/fake_llm.py).
+
+Модель нагрузки замкнутая: --concurrency виртуальных клиентов, каждый берёт
+случайного пользователя из --users и сценарий по весам --mix, выполняет и
+(при --think-ms) ждёт. Первые --warmup секунд не учитываются.
+
+Без --url тест сам поднимает окружение во временном каталоге: заглушку LLM и
+uvicorn api.main:app (отдельными процессами, чтобы генератор не делил с ними
+GIL) с ключом OpenRouter, указывающим на заглушку. Начальные данные — копия
+--db (например, из scripts/seed_test_data.py --scale) или пустая БД.
+
+Использование:
+  python benchmarks/loadtest.py run --users 5000 --concurrency 64 --duration 60
+  python benchmarks/loadtest.py run --mix hub_open=50,chat=50 --llm-latency lognormal:900:0.6
+  python benchmarks/loadtest.py run --url http://127.0.0.1:8000 --out before.json
+  python benchmarks/loadtest.py compare before.json after.json --threshold 0.10
+
+Результат — JSON (по умолчанию benchmarks/results/loadtest-<коммит>-<время>.json):
+RPS и p50/p95/p99 по эндпоинтам и сценариям. compare печатает изменения и
+завершается с кодом 1, если p95 какого-либо эндпоинта вырос (или RPS упал)
+больше порога.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Tuple
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+DEFAULT_MIX = "hub_open=55,task_toggle=20,transaction=15,chat=10"
+# Ключи провайдеров, которые не должны попасть из .env в поднятый API
+_PROVIDER_KEYS = ("OPENROUTER_API_KEY", "VSELM_API_KEY", "GOOGLE_API_KEY", "YANDEX_API_KEY", "YANDEX_FOLDER_ID")
+
+_CHAT_MESSAGES = [
+    "Что у меня на сегодня?",
+    "Сколько я потратил в этом месяце?",
+    "Помоги спланировать неделю",
+    "Как продвигается проект?",
+    "Напомни, что я обещал сделать",
+    "Какие задачи просрочены?",
+    "Посоветуй, на чём сэкономить",
+    "Кому из близких скоро день рождения?",
+]
+_CATEGORIES = ["еда", "транспорт", "дом", "развлечения", "здоровье", "связь"]
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Перцентиль по ближайшему рангу (значения уже отсортированы)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def latency_summary(latencies_ms: List[float], errors: int, seconds: float) -> Dict[str, Any]:
+    values = sorted(latencies_ms)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "rps": round(len(values) / seconds, 2) if seconds > 0 else 0.0,
+        "mean_ms": round(sum(values) / len(values), 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 50), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "p99_ms": round(percentile(values, 99), 2),
+        "max_ms": round(values[-1], 2) if values else 0.0,
+    }
+
+
+@dataclass
+class _Series:
+    latencies_ms: List[float] = field(default_factory=list)
+    errors: int = 0
+    statuses: Dict[str, int] = field(default_factory=dict)
+
+
+class Recorder:
+    """Задержки по эндпоинтам (метод + шаблон пути) и сценариям; пока measuring=False — разогрев."""
+
+    def __init__(self) -> None:
+        self.endpoints: Dict[str, _Series] = {}
+        self.scenarios: Dict[str, _Series] = {}
+        self.measuring = False
+
+    def endpoint(self, name: str, ms: float, status: int | str) -> None:
+        """status — код ответа или имя исключения клиента (таймаут, обрыв)."""
+        if not self.measuring:
+            return
+        series = self.endpoints.setdefault(name, _Series())
+        key = str(status)
+        series.statuses[key] = series.statuses.get(key, 0) + 1
+        if not isinstance(status, int) or status >= 400:
+            series.errors += 1
+        else:
+            series.latencies_ms.append(ms)
+
+    def scenario(self, name: str, ms: float, ok: bool) -> None:
+        if not self.measuring:
+            return
+        series = self.scenarios.setdefault(name, _Series())
+        if ok:
+            series.latencies_ms.append(ms)
+        else:
+            series.errors += 1
+
+    def report(self, seconds: float) -> Dict[str, Any]:
+        def block(items: Dict[str, _Series]) -> Dict[str, Any]:
+            out = {}
+            for name in sorted(items):
+                s = items[name]
+                out[name] = latency_summary(s.latencies_ms, s.errors, seconds)
+                if s.statuses:
+                    out[name]["statuses"] = dict(sorted(s.statuses.items()))
+            return out
+
+        endpoints = block(self.endpoints)
+        total = sum(e["count"] for e in endpoints.values())
+        return {
+            "seconds": round(seconds, 1),
+            "requests": total,
+            "errors": sum(e["errors"] for e in endpoints.values()),
+            "rps": round(total / seconds, 2) if seconds > 0 else 0.0,
+            "endpoints": endpoints,
+            "scenarios": block(self.scenarios),
+        }
+
+
+class Session:
+    """HTTP-запросы от имени одного синтетического пользователя с учётом задержек."""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, user_id: str, rng: random.Random) -> None:
+        self.client = client
+        self.recorder = recorder
+        self.headers = {"X-User-Id": user_id}
+        self.rng = rng
+
+    async def call(self, method: str, path: str, name: str, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        status: int | str = 0
+        try:
+            resp = await self.client.request(method, path, headers=self.headers, **kwargs)
+            status = resp.status_code
+            resp.raise_for_status()
+            return resp.json()
+        except Exception as e:
+            if not status:
+                status = type(e).__name__
+            raise
+        finally:
+            self.recorder.endpoint(f"{method} {name}", (time.perf_counter() - started) * 1000, status)
+
+
+async def scenario_hub_open(s: Session) -> None:
+    await asyncio.gather(
+        s.call("GET", "/api/tasks", "/api/tasks"),
+        s.call("GET", "/api/people", "/api/people"),
+        s.call("GET", "/api/projects", "/api/projects"),
+    )
+    month = date.today().strftime("%Y-%m")
+    await s.call("GET", "/api/finance/summary", "/api/finance/summary", params={"month": month})
+    await s.call("GET", "/api/finance/transactions", "/api/finance/transactions", params={"month": month})
+
+
+async def scenario_task_toggle(s: Session) -> None:
+    tasks = await s.call("GET", "/api/tasks", "/api/tasks")
+    if not tasks:
+        created = await s.call(
+            "POST", "/api/tasks", "/api/tasks",
+            json={"title": f"Задача {s.rng.randint(1, 10_000)}", "priority": "medium"},
+        )
+        tasks = [{"id": created.get("id"), "done": False}] if isinstance(created, dict) and created.get("id") else []
+    if not tasks:
+        return
+    task = s.rng.choice(tasks)
+    done = bool(task.get("done"))
+    for value in (not done, done):
+        await s.call("PATCH", f"/api/tasks/{task['id']}", "/api/tasks/{id}", json={"done": value})
+
+
+async def scenario_transaction(s: Session) -> None:
+    income = s.rng.random() < 0.2
+    await s.call(
+        "POST", "/api/finance/transactions", "/api/finance/transactions",
+        json={
+            "date": date.today().isoformat(),
+            "amount": round(s.rng.uniform(1000, 80000) if income else -s.rng.uniform(50, 5000), 2),
+            "type": "income" if income else "expense",
+            "category": "зарплата" if income else s.rng.choice(_CATEGORIES),
+            "comment": "",
+        },
+    )
+    await s.call("GET", "/api/finance/summary", "/api/finance/summary", params={"month": date.today().strftime("%Y-%m")})
+
+
+async def scenario_chat(s: Session) -> None:
+    await s.call("POST", "/api/chat", "/api/chat", json={"message": s.rng.choice(_CHAT_MESSAGES)})
+
+
+SCENARIOS: Dict[str, Callable[[Session], Awaitable[None]]] = {
+    "hub_open": scenario_hub_open,
+    "task_toggle": scenario_task_toggle,
+    "transaction": scenario_transaction,
+    "chat": scenario_chat,
+}
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"Неизвестный сценарий: {name!r} (есть: {', '.join(SCENARIOS)})")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+async def run_load(
+    url: str,
+    *,
+    users: int,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    mix: List[Tuple[str, float]],
+    think_ms: float,
+    seed: int,
+    timeout: float,
+) -> Dict[str, Any]:
+    recorder = Recorder()
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    limits = httpx.Limits(max_connections=concurrency * 3, max_keepalive_connections=concurrency * 3)
+    stop_at = time.monotonic() + warmup + duration
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+
+        async def worker(n: int) -> None:
+            rng = random.Random(seed * 100_003 + n)
+            while time.monotonic() < stop_at:
+                name = rng.choices(names, weights)[0]
+                session = Session(client, recorder, f"load-{rng.randrange(users)}", rng)
+                started = time.perf_counter()
+                ok = True
+                try:
+                    await SCENARIOS[name](session)
+                except (httpx.HTTPError, ValueError):
+                    ok = False
+                recorder.scenario(name, (time.perf_counter() - started) * 1000, ok)
+                if think_ms > 0:
+                    await asyncio.sleep(rng.expovariate(1000 / think_ms))
+
+        workers = [asyncio.create_task(worker(n)) for n in range(concurrency)]
+        await asyncio.sleep(warmup)
+        recorder.measuring = True
+        measured_from = time.monotonic()
+        await asyncio.gather(*workers)
+        seconds = time.monotonic() - measured_from
+    return recorder.report(seconds)
+
+
+def _wait_ready(url: str, proc: subprocess.Popen, path: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"Процесс {proc.args} завершился с кодом {proc.returncode}")
+        try:
+            if httpx.get(url + path, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"{url} не ответил за {timeout:.0f} с")
+
+
+def _stop(proc: subprocess.Popen) -> None:
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+@contextmanager
+def local_stack(args: argparse.Namespace) -> Iterator[str]:
+    """Заглушка LLM + API во временном каталоге (data/hub.db — копия --db или пустая)."""
+    workdir = Path(tempfile.mkdtemp(prefix="tghub-load-"))
+    (workdir / "data").mkdir()
+    if args.db:
+        shutil.copyfile(args.db, workdir / "data" / "hub.db")
+    llm_url = f"http://127.0.0.1:{args.llm_port}"
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    env = dict(os.environ)
+    env.update({key: "" for key in _PROVIDER_KEYS})
+    env.update({
+        "PYTHONPATH": str(ROOT),
+        "OPENROUTER_API_KEY": "fake",
+        "OPENROUTER_BASE_URL": llm_url + "/v1",
+        "BOT_TOKEN": "",
+    })
+    log = open(workdir / "server.log", "w")
+    procs: List[subprocess.Popen] = []
+    try:
+        llm = subprocess.Popen(
+            [sys.executable, str(ROOT / "benchmarks" / "fake_llm.py"), "--port", str(args.llm_port),
+             "--latency", args.llm_latency, "--error-rate", str(args.llm_error_rate),
+             "--rate-limit-rate", str(args.llm_rate_limit_rate), "--seed", str(args.seed)],
+            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        procs.append(llm)
+        _wait_ready(llm_url, llm, "/stats")
+        api = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(args.api_port),
+             "--log-level", "warning", "--no-access-log"],
+            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        procs.append(api)
+        _wait_ready(api_url, api, "/api/health")
+        yield api_url
+    finally:
+        for proc in reversed(procs):
+            _stop(proc)
+        log.close()
+        if args.keep:
+            print(f"Рабочий каталог: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n{report['requests']} запросов за {report['seconds']} с — {report['rps']} RPS, ошибок: {report['errors']}")
+    for title, key in (("Эндпоинт", "endpoints"), ("Сценарий", "scenarios")):
+        print(f"\n{title:<36} {'count':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>5}")
+        for name, s in report[key].items():
+            print(f"{name:<36} {s['count']:>7} {s['rps']:>8} {s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8} {s['errors']:>5}")
+
+
+def cmd_run(args: argparse.Namespace) -> None:
+    mix = parse_mix(args.mix)
+    config = {
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "warmup": args.warmup,
+        "mix": args.mix,
+        "think_ms": args.think_ms,
+        "seed": args.seed,
+        "url": args.url or "local",
+        "db": args.db,
+        "llm_latency": None if args.url else args.llm_latency,
+    }
+
+    async def go(url: str) -> Dict[str, Any]:
+        return await run_load(
+            url,
+            users=args.users,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            warmup=args.warmup,
+            mix=mix,
+            think_ms=args.think_ms,
+            seed=args.seed,
+            timeout=args.timeout,
+        )
+
+    if args.url:
+        report = asyncio.run(go(args.url.rstrip("/")))
+    else:
+        with local_stack(args) as url:
+            report = asyncio.run(go(url))
+
+    commit = _git_commit()
+    result = {
+        "commit": commit,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "config": config,
+        **report,
+    }
+    print_report(report)
+    out = Path(args.out) if args.out else RESULTS_DIR / f"loadtest-{commit}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\nРезультат: {out}")
+
+
+def compare_reports(old: Dict[str, Any], new: Dict[str, Any], threshold: float) -> List[str]:
+    """Печатает сравнение по эндпоинтам; возвращает список регрессий."""
+    regressions = []
+    print(f"{'Эндпоинт':<36} {'rps':>17} {'p50':>19} {'p95':>19} {'p99':>19}")
+
+    def cell(a: float, b: float) -> str:
+        delta = (b - a) / a * 100 if a else 0.0
+        return f"{a:>7}→{b:<7} {delta:+5.0f}%"
+
+    for name in sorted(set(old["endpoints"]) | set(new["endpoints"])):
+        a, b = old["endpoints"].get(name), new["endpoints"].get(name)
+        if a is None or b is None:
+            print(f"{name:<36} {'только в ' + ('новом' if a is None else 'старом')}")
+            continue
+        print(f"{name:<36} " + " ".join(cell(a[k], b[k]) for k in ("rps", "p50_ms", "p95_ms", "p99_ms")))
+        if a["p95_ms"] and b["p95_ms"] > a["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {a['p95_ms']} → {b['p95_ms']} мс")
+        if a["rps"] and b["rps"] < a["rps"] * (1 - threshold):
+            regressions.append(f"{name}: RPS {a['rps']} → {b['rps']}")
+    print(f"\nВсего: {old['rps']} → {new['rps']} RPS, ошибок {old['errors']} → {new['errors']}")
+    return regressions
+
+
+def cmd_compare(args: argparse.Namespace) -> None:
+    old = json.loads(Path(args.old).read_text(encoding="utf-8"))
+    new = json.loads(Path(args.new).read_text(encoding="utf-8"))
+    print(f"{args.old} ({old.get('commit')}) → {args.new} ({new.get('commit')})\n")
+    if old.get("config") != new.get("config"):
+        print("Внимание: конфигурации прогонов различаются\n")
+    regressions = compare_reports(old, new, args.threshold)
+    if regressions:
+        print(f"\nРегрессии (порог {args.threshold:.0%}):")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API TG Hub")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="прогон нагрузки")
+    run.add_argument("--url", help="адрес запущенного API; без него окружение поднимается локально")
+    run.add_argument("--users", type=int, default=2000, help="синтетических пользователей")
+    run.add_argument("--concurrency", type=int, default=32, help="одновременных клиентов")
+    run.add_argument("--duration", type=float, default=30.0, help="секунд замера")
+    run.add_argument("--warmup", type=float, default=5.0, help="секунд разогрева (не учитываются)")
+    run.add_argument("--mix", default=DEFAULT_MIX, help=f"веса сценариев (по умолчанию {DEFAULT_MIX})")
+    run.add_argument("--think-ms", type=float, default=0.0, help="средняя пауза клиента между сценариями")
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--timeout", type=float, default=60.0, help="таймаут запроса, с")
+    run.add_argument("--out", help="файл результата JSON")
+    run.add_argument("--db", help="исходная БД для локального прогона (копируется)")
+    run.add_argument("--api-port", type=int, default=8765)
+    run.add_argument("--llm-port", type=int, default=8910)
+    run.add_argument("--llm-latency", default="lognormal:600:0.5", help="задержка заглушки LLM")
+    run.add_argument("--llm-error-rate", type=float, default=0.0)
+    run.add_argument("--llm-rate-limit-rate", type=float, default=0.0)
+    run.add_argument("--keep", action="store_true", help="не удалять рабочий каталог (БД, server.log)")
+    run.set_defaults(func=cmd_run)
+
+    compare = sub.add_parser("compare", help="сравнить два результата")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=0.10, help="допустимое ухудшение (0.10 = 10%%)")
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,8 +21,11 @@ from tg_hub_bot.handlers.payment import register_payment_handlers
 from tg_hub_bot.handlers.start import register_start_handler
 from tg_hub_bot.handlers.ai_chat import register_ai_chat_handler
 from tg_hub_bot.services.reminders import RemindersService
+from telemetry import bot as bot_metrics, correlation, loop_monitor, slow_queries
+from telemetry.server import start_metrics_server
 
 logging.basicConfig(level=logging.INFO)
+correlation.install_logging()
 logger = logging.getLogger(__name__)
 
 # ——— Создание Bot и Dispatcher ———
@@ -42,11 +45,18 @@ scheduler_service = create_scheduler_service(reminders_service)
 register_start_handler(dp, bot, WEBAPP_HUB_URL)
 register_payment_handlers(dp, bot, WEBAPP_HUB_URL)
 register_ai_chat_handler(dp, ai_service)
+# Сквозной id на каждый апдейт: в логах бота и в X-Request-Id запросов к API
+dp.update.outer_middleware(correlation.update_middleware)
+bot_metrics.install(dp, bot)
 
 
 async def main() -> None:
     logger.info("Запуск бота...")
+    slow_queries.install("bot")
+    loop_monitor.start()
     scheduler_service.start()
+    if bot_metrics.BOT_METRICS_PORT:
+        await start_metrics_server(bot_metrics.BOT_METRICS_PORT, bot_metrics.BOT_METRICS_HOST)
     await dp.start_polling(bot)
 
 
@@ -15,6 +15,17 @@ if (tg) {
 }
 // tg.initData — сырая строка; на мобилке initDataUnsafe иногда пуст, API проверит initData
 
+// Режим отладки: ?debug=1 (запоминается) или localStorage.hubDebug = '1'; ?debug=0 — выключить
+const DEBUG = (() => {
+    const flag = new URLSearchParams(location.search).get('debug');
+    try {
+        if (flag !== null) localStorage.setItem('hubDebug', flag === '1' ? '1' : '0');
+        return localStorage.getItem('hubDebug') === '1';
+    } catch (e) {
+        return flag === '1';
+    }
+})();
+
 function getHeaders() {
     const h = { 'Content-Type': 'application/json', 'X-User-Id': userId };
     if (tg?.initData) h['X-Telegram-Init-Data'] = tg.initData;
@@ -1562,6 +1573,23 @@ const Timeline = {
 const AI = {
     isLoading: false,
     isHistoryLoaded: false,
+
+    // Server-Timing (API_DEBUG=1) → «⏱ db 4 мс · extract 812 мс · llm 1240 мс · … · всего 2301 мс»
+    formatTimings(header) {
+        if (!header) return '';
+        const parts = [];
+        let total = '';
+        header.split(',').forEach(entry => {
+            const [name, ...params] = entry.trim().split(';');
+            const dur = params.map(p => p.trim()).find(p => p.startsWith('dur='));
+            if (!name || !dur) return;
+            const ms = Math.round(parseFloat(dur.slice(4)));
+            if (name === 'total') total = `всего ${ms} мс`;
+            else parts.push(`${name} ${ms} мс`);
+        });
+        if (total) parts.push(total);
+        return parts.length ? `⏱ ${parts.join(' · ')}` : '';
+    },
     
     async loadHistory() {
         if (this.isHistoryLoaded) return;
@@ -1625,9 +1653,15 @@ const AI = {
             document.getElementById(`loading-${loadingId}`).remove();
             
             const isAction = !!data.action_executed;
-            const meta = isAction
+            let meta = isAction
                 ? '<div class="chat-msg-meta">⚙ Выполнено действие в системе</div>'
                 : '';
+            if (DEBUG) {
+                const timings = this.formatTimings(response.headers.get('Server-Timing'));
+                const requestId = response.headers.get('X-Request-Id');
+                const debugLine = [timings, requestId && `id ${requestId}`].filter(Boolean).join(' · ');
+                if (debugLine) meta += `<div class="chat-msg-meta">${Utils.escape(debugLine)}</div>`;
+            }
             
             messages.innerHTML += `
                 <div class="chat-msg ai${isAction ? ' action' : ''}">
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Профили отдельных запросов API (telemetry/profiling.py, каталог data/profiles/).
+
+Снять профиль: заголовок X-Profile: 1 (API_DEBUG=1) или X-Profile: <ADMIN_TOKEN>;
+id профиля — в заголовке ответа X-Profile-Id.
+  curl -H "X-Profile: $ADMIN_TOKEN" -H "X-User-Id: 1" -d '{"message":"..."}' \\
+       -H "Content-Type: application/json" http://127.0.0.1:8000/api/chat -i
+
+Использование (из корня репозитория):
+  python scripts/profile_report.py list                    # последние профили
+  python scripts/profile_report.py show latest             # топ функций по cumulative
+  python scripts/profile_report.py show <id> --sort tottime --limit 40
+  python scripts/profile_report.py show <id> --ours        # только код репозитория
+  python scripts/profile_report.py show <id> --callees _prepare_chat
+  python scripts/profile_report.py show <id> --callers json.dumps
+
+Файл <id>.prof — обычный pstats: python -m pstats, snakeviz, gprof2dot.
+"""
+
+import argparse
+import io
+import json
+import pstats
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_index(directory: Path) -> List[Dict]:
+    items = []
+    for meta_path in sorted(directory.glob("*.json")):
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            continue
+        if (directory / f"{meta_path.stem}.prof").exists():
+            items.append(meta)
+    items.sort(key=lambda m: m.get("ts", 0))
+    return items
+
+
+def cmd_list(directory: Path, args: argparse.Namespace) -> None:
+    items = load_index(directory)
+    if args.path:
+        items = [m for m in items if args.path in m.get("path", "")]
+    items = items[-args.limit:]
+    if not items:
+        print(f"Профилей нет в {directory}")
+        return
+    print(f"{'время':<19} {'статус':>6} {'всего, мс':>10} {'CPU, мс':>9}  запрос / id")
+    for m in items:
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(m.get("ts", 0)))
+        query = f"?{m['query']}" if m.get("query") else ""
+        print(f"{when:<19} {m.get('status', ''):>6} {m.get('wall_ms', 0):>10.1f} {m.get('profiled_ms', 0):>9.1f}"
+              f"  {m.get('method')} {m.get('path')}{query}")
+        print(f"{'':<48}{m['id']}")
+
+
+def _resolve(directory: Path, profile_id: str) -> Path:
+    if profile_id == "latest":
+        items = load_index(directory)
+        if not items:
+            sys.exit(f"Профилей нет в {directory}")
+        profile_id = items[-1]["id"]
+    path = directory / f"{profile_id}.prof"
+    if not path.exists():
+        matches = sorted(directory.glob(f"*{profile_id}*.prof"))
+        if len(matches) != 1:
+            sys.exit(f"Профиль {profile_id} не найден" if not matches else f"Неоднозначный id: {profile_id}")
+        path = matches[0]
+    return path
+
+
+def cmd_show(directory: Path, args: argparse.Namespace) -> None:
+    path = _resolve(directory, args.id)
+    meta_path = path.with_suffix(".json")
+    if meta_path.exists():
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        print(f"{meta.get('method')} {meta.get('path')} → {meta.get('status')}: "
+              f"{meta.get('wall_ms')} мс всего, {meta.get('profiled_ms')} мс CPU в профиле\n")
+    out = io.StringIO()
+    stats = pstats.Stats(str(path), stream=out)
+    if not args.ours:
+        stats.strip_dirs()
+    stats.sort_stats(args.sort)
+    restrictions: list = [str(ROOT)] if args.ours else []
+    restrictions.append(args.limit)
+    if args.callees:
+        stats.print_callees(args.callees, *restrictions)
+    elif args.callers:
+        stats.print_callers(args.callers, *restrictions)
+    else:
+        stats.print_stats(*restrictions)
+    text = out.getvalue()
+    if args.ours:
+        text = text.replace(str(ROOT) + "/", "")
+    print(text)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Профили запросов API")
+    parser.add_argument("--dir", default=str(ROOT / "data" / "profiles"))
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_list = sub.add_parser("list", help="список профилей")
+    p_list.add_argument("--limit", type=int, default=30)
+    p_list.add_argument("--path", help="только запросы, в пути которых есть подстрока")
+
+    p_show = sub.add_parser("show", help="сводка профиля")
+    p_show.add_argument("id", help="id профиля (или его часть), latest — последний")
+    p_show.add_argument("--sort", default="cumulative", help="cumulative, tottime, ncalls, ...")
+    p_show.add_argument("--limit", type=int, default=30)
+    p_show.add_argument("--ours", action="store_true", help="только функции из кода репозитория")
+    p_show.add_argument("--callees", metavar="ФУНКЦИЯ", help="кого вызывает функция (дерево вниз)")
+    p_show.add_argument("--callers", metavar="ФУНКЦИЯ", help="кто вызывает функцию")
+    args = parser.parse_args()
+
+    directory = Path(args.dir)
+    if args.command == "list":
+        cmd_list(directory, args)
+    else:
+        cmd_show(directory, args)
+
+
+if __name__ == "__main__":
+    main()
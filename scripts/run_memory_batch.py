@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Разовый запуск пакетной обработки памяти чата (api/services/memory_jobs.py).
+
+Использование (из корня репозитория, рядом с data/hub.db):
+  python scripts/run_memory_batch.py
+  python scripts/run_memory_batch.py --concurrency 4 --max-users 1000
+
+Для системного cron вместо планировщика в API: MEMORY_BATCH=1 и пустой
+MEMORY_BATCH_CRON в .env, а в crontab, например:
+  30 3 * * * cd /opt/tg-hub && .venv/bin/python scripts/run_memory_batch.py
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+async def run(concurrency: int, max_users: int) -> dict:
+    from api import main
+    from api.services import ai_usage
+    from api.services.ai_client import close_ai_clients, is_ai_configured, start_ai_clients
+
+    await main.init_db()
+    if not is_ai_configured():
+        raise SystemExit("ИИ не настроен: нужен ключ провайдера в .env")
+    await start_ai_clients()
+    try:
+        main.memory_job.concurrency = concurrency
+        main.memory_job.max_users = max_users
+        report = await main.memory_job.run()
+    finally:
+        await ai_usage.recorder.flush(main.DATABASE)
+        await close_ai_clients()
+    return report.as_dict()
+
+
+def main():
+    from api.services.memory_jobs import MEMORY_BATCH_CONCURRENCY, MEMORY_BATCH_MAX_USERS
+
+    parser = argparse.ArgumentParser(description="Пакетное резюме истории и обновление памяти агента")
+    parser.add_argument("--concurrency", type=int, default=MEMORY_BATCH_CONCURRENCY)
+    parser.add_argument("--max-users", type=int, default=MEMORY_BATCH_MAX_USERS)
+    args = parser.parse_args()
+    report = asyncio.run(run(args.concurrency, args.max_users))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
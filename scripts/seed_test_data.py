@@ -9,13 +9,30 @@
 
 Данные выглядят как будто их заполнил живой человек: задачи, проекты,
 контакты, финансы, цели.
+
+Режим масштаба (для нагрузочных тестов и бенчмарков) — N синтетических
+пользователей load-0 … load-{N-1} (те же id, что у benchmarks/loadtest.py):
+  python scripts/seed_test_data.py --scale 5000                     # ~10 млн строк
+  python scripts/seed_test_data.py --scale 500 --seed 7 --today 2026-01-15 --tx-years 1
+  python scripts/seed_test_data.py --scale 100 --db /tmp/bench.db
+
+Объём данных пользователя задаётся средними (--tasks, --contacts, --chat и т.д.),
+которые умножаются на «активность» пользователя — логнормальный множитель со
+средним 1 (--skew — его разброс): немного очень активных пользователей и много
+умеренных, как в жизни. Каждый пользователь генерируется своим генератором от
+--seed, id строк назначаются заранее, поэтому при одинаковых --seed и --today
+результат один и тот же. Вставка — executemany, коммит раз в --batch-users
+пользователей.
 """
 
 import argparse
 import asyncio
 import json
+import math
 import os
+import random
 import sys
+import time
 from datetime import date, datetime, timedelta
 from pathlib import Path
 
@@ -24,6 +41,8 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 import aiosqlite
 
+from api.services.tokens import estimate_tokens
+
 DATABASE = "data/hub.db"
 
 # Тестовый user_id — подставь свой Telegram ID, чтобы видеть данные в Hub
@@ -39,10 +58,12 @@ async def wipe_and_recreate():
     
     # Импортируем init_db из API
     try:
-        from api.main import init_db
+        from api import main as api_main
     except ImportError:
-        from main import init_db
-    await init_db()
+        import main as api_main
+    api_main.DATABASE = DATABASE  # --db
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    await api_main.init_db()
     print("БД создана заново")
 
 
@@ -174,12 +195,313 @@ async def seed(user_id: str):
     print(f"Заполнено для user_id={user_id}: люди, проекты, задачи, финансы, цели, лимиты")
 
 
+# === Режим масштаба ===========================================================
+
+_LAST_NAMES = ["Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев", "Козлов",
+               "Новиков", "Морозов", "Волков", "Соловьёв", "Васильев", "Зайцев", "Павлов", "Семёнов"]
+_MALE_NAMES = ["Александр", "Дмитрий", "Максим", "Сергей", "Андрей", "Алексей", "Иван", "Михаил", "Никита"]
+_FEMALE_NAMES = ["Анна", "Мария", "Елена", "Ольга", "Наталья", "Татьяна", "Ирина", "Екатерина", "Светлана"]
+_RELATIONS = ["коллега", "друг", "подруга", "мама", "папа", "брат", "сестра", "сосед", "подрядчик",
+              "клиент", "начальник", "тренер", "врач", "риелтор"]
+_GROUPS = ["работа", "семья", "друзья", "ремонт", "спорт", "учёба"]
+_TASK_VERBS = ["Позвонить", "Купить", "Оплатить", "Написать", "Заказать", "Проверить", "Отправить",
+               "Забрать", "Подготовить", "Записаться", "Починить", "Обсудить"]
+_TASK_OBJECTS = ["счёт за интернет", "продукты на неделю", "отчёт по проекту", "билеты", "подарок маме",
+                 "к стоматологу", "документы в банк", "смеситель", "договор с подрядчиком", "посылку",
+                 "план на квартал", "резюме", "страховку машины", "запчасти", "коммуналку"]
+_PROJECT_TITLES = ["Ремонт квартиры", "Отпуск", "Переезд", "Запуск сайта", "Свадьба", "Дача",
+                   "Курс английского", "Новая работа", "Покупка машины", "День рождения"]
+_EXPENSE_CATEGORIES = [  # категория, вес, медиана суммы
+    ("продукты", 30, 900), ("еда", 20, 450), ("транспорт", 15, 250), ("развлечения", 8, 1500),
+    ("коммуналка", 3, 6000), ("здоровье", 5, 1800), ("связь", 3, 600), ("одежда", 5, 3500),
+    ("дом", 6, 1200), ("ремонт", 3, 7000), ("подарки", 2, 2500),
+]
+_GOAL_TITLES = ["Отпуск", "Подушка безопасности", "Новый ноутбук", "Первый взнос", "Машина", "Ремонт"]
+_CHAT_USER = [
+    "Что у меня на {day}?", "Сколько я потратил на {cat} в этом месяце?", "Напомни про {task}",
+    "Как дела с проектом «{project}»?", "Когда день рождения у {name}?", "Помоги спланировать {day}",
+    "Потратил {amount} на {cat}", "Что я обещал {name}?", "Добавь задачу {task}",
+    "Можно ли уложиться в бюджет на {cat}?",
+]
+_CHAT_ASSISTANT = [
+    "На {day} у вас {n} задач, главная — «{task}».", "В этом месяце на {cat} ушло {amount} ₽.",
+    "Записал: {task}.", "По проекту «{project}» открыто {n} задач, ближайший срок через неделю.",
+    "Напомню {name} о договорённости.", "Предлагаю начать с «{task}», остальное распределить по дням.",
+]
+_DAYS = ["сегодня", "завтра", "выходные", "понедельник", "эту неделю"]
+_TIMELINE_ACTIONS = [("created", "task"), ("completed", "task"), ("updated", "task"),
+                     ("created", "person"), ("note_added", "person"), ("created", "project"),
+                     ("updated", "project")]
+
+# Таблицы в порядке вставки (ссылки — на уже вставленные id)
+_SCALE_TABLES = {
+    "people": "INSERT INTO people (id, user_id, fio, data, created_at) VALUES (?, ?, ?, ?, ?)",
+    "person_notes": "INSERT INTO person_notes (person_id, text, created_at) VALUES (?, ?, ?)",
+    "projects": """INSERT INTO projects (id, user_id, title, description, status, deadline, budget, revenue_goal, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+    "project_notes": "INSERT INTO project_notes (project_id, text, created_at) VALUES (?, ?, ?)",
+    "project_members": "INSERT INTO project_members (project_id, person_id, role) VALUES (?, ?, ?)",
+    "tasks": """INSERT INTO tasks (id, user_id, title, description, deadline, priority, done, person_id, project_id,
+                                   reminder_enabled, reminder_time, recurrence_type, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+    "finance_transactions": """INSERT INTO finance_transactions (user_id, date, amount, type, category, comment, created_at)
+                               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+    "finance_goals": """INSERT INTO finance_goals (user_id, title, target_amount, current_amount, target_date, priority)
+                        VALUES (?, ?, ?, ?, ?, ?)""",
+    "finance_limits": "INSERT INTO finance_limits (user_id, category, amount) VALUES (?, ?, ?)",
+    "chat_history": "INSERT INTO chat_history (id, user_id, role, content, created_at, tokens) VALUES (?, ?, ?, ?, ?, ?)",
+    "chat_summary": """INSERT INTO chat_summary (user_id, level, content, watermark_id, pending)
+                       VALUES (?, ?, ?, ?, ?)""",
+    "timeline": """INSERT INTO timeline (user_id, action_type, entity_type, entity_id, entity_title, details, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+}
+
+
+class _ScaleIds:
+    """Следующие id для таблиц, на которые ссылаются другие строки."""
+
+    def __init__(self, start: dict) -> None:
+        self.next = dict(start)
+
+    def take(self, table: str, count: int) -> list:
+        first = self.next[table]
+        self.next[table] = first + count
+        return list(range(first, first + count))
+
+
+def _count(rng: random.Random, mean: float, activity: float) -> int:
+    """Количество записей пользователя: среднее × активность, округление случайное."""
+    value = mean * activity
+    return int(value) + (1 if rng.random() < value - int(value) else 0)
+
+
+def _ts(day: date, rng: random.Random) -> str:
+    return f"{day.isoformat()} {rng.randint(7, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}"
+
+
+def _scale_user_rows(user_id: str, rng: random.Random, ids: _ScaleIds, args, today: date, rows: dict) -> None:
+    """Добавить в rows[table] строки одного синтетического пользователя."""
+    sigma = args.skew
+    activity = rng.lognormvariate(0, sigma) / math.exp(sigma * sigma / 2)
+    history_days = max(int(args.tx_years * 365), 1)
+
+    def past_day(max_days: int = history_days) -> date:
+        # Свежие события чаще старых
+        return today - timedelta(days=min(int(rng.expovariate(3 / max_days)), max_days))
+
+    # Контакты и заметки к ним
+    people = []
+    for person_id in ids.take("people", _count(rng, args.contacts, activity)):
+        female = rng.random() < 0.5
+        last = rng.choice(_LAST_NAMES) + ("а" if female else "")
+        fio = f"{last} {rng.choice(_FEMALE_NAMES if female else _MALE_NAMES)}"
+        data = {"relation": rng.choice(_RELATIONS), "groups": [rng.choice(_GROUPS)]}
+        if rng.random() < 0.5:
+            born = today.replace(year=today.year - rng.randint(18, 70)) - timedelta(days=rng.randint(0, 364))
+            data["birth_date"] = born.isoformat()
+        if rng.random() < 0.3:
+            data["strengths"] = rng.choice(["надёжный", "всегда на связи", "разбирается в финансах", "весёлый"])
+        people.append((person_id, fio))
+        rows["people"].append((person_id, user_id, fio, json.dumps(data, ensure_ascii=False), _ts(past_day(), rng)))
+        for _ in range(_count(rng, args.notes, 1.0)):
+            rows["person_notes"].append((
+                person_id,
+                f"{rng.choice(['Созвонились', 'Встретились', 'Договорились', 'Обещал перезвонить'])}: "
+                f"{rng.choice(_TASK_OBJECTS)}",
+                _ts(past_day(), rng),
+            ))
+
+    # Проекты, участники, заметки
+    projects = []
+    for project_id in ids.take("projects", _count(rng, args.projects, activity)):
+        title = rng.choice(_PROJECT_TITLES)
+        status = rng.choices(["active", "paused", "done"], [6, 1, 3])[0]
+        projects.append((project_id, title))
+        deadline = (today + timedelta(days=rng.randint(-200, 200))).isoformat() if rng.random() < 0.7 else None
+        rows["projects"].append((
+            project_id, user_id, title, f"{title}: план и бюджет", status, deadline,
+            round(rng.lognormvariate(11, 1)), round(rng.lognormvariate(10, 1)) if rng.random() < 0.3 else None,
+            _ts(past_day(), rng),
+        ))
+        for person_id, _ in rng.sample(people, min(len(people), _count(rng, args.members, 1.0))):
+            rows["project_members"].append((project_id, person_id, rng.choice(["помощник", "подрядчик", "заказчик"])))
+        for _ in range(_count(rng, args.notes, 1.0)):
+            rows["project_notes"].append((project_id, f"Обсудили: {rng.choice(_TASK_OBJECTS)}", _ts(past_day(), rng)))
+
+    # Задачи: выполненные — история, открытые — часть просрочена, часть без срока
+    tasks = []
+    for task_id in ids.take("tasks", _count(rng, args.tasks, activity)):
+        title = f"{rng.choice(_TASK_VERBS)} {rng.choice(_TASK_OBJECTS)}"
+        done = rng.random() < args.done_share
+        if done:
+            deadline = past_day()
+        else:
+            deadline = today + timedelta(days=rng.randint(-14, 45)) if rng.random() < 0.75 else None
+        created = (deadline or today) - timedelta(days=rng.randint(0, 20))
+        reminder = not done and deadline is not None and rng.random() < 0.3
+        tasks.append((task_id, title))
+        rows["tasks"].append((
+            task_id, user_id, title, None, deadline.isoformat() if deadline else None,
+            rng.choices(["low", "medium", "high"], [2, 5, 2])[0], int(done),
+            rng.choice(people)[0] if people and rng.random() < 0.2 else None,
+            rng.choice(projects)[0] if projects and rng.random() < 0.3 else None,
+            int(reminder), f"{rng.randint(8, 21):02d}:{rng.choice(['00', '30'])}" if reminder else None,
+            rng.choices(["none", "daily", "weekly", "monthly"], [20, 1, 2, 1])[0],
+            _ts(min(created, today), rng),
+        ))
+
+    # Финансы: каждый месяц истории — зарплата и расходы по категориям
+    categories = [c for c, _, _ in _EXPENSE_CATEGORIES]
+    weights = [w for _, w, _ in _EXPENSE_CATEGORIES]
+    medians = {c: m for c, _, m in _EXPENSE_CATEGORIES}
+    salary = round(rng.lognormvariate(11.1, 0.4), -3)
+    per_month = args.tx_per_month * activity
+    month_start = today.replace(day=1)
+    for _ in range(max(int(args.tx_years * 12), 1)):
+        days_in_month = min((month_start.replace(day=28) + timedelta(days=4)).replace(day=1) - month_start,
+                            today - month_start + timedelta(days=1)).days
+        for pay_day in (5, 20):
+            if pay_day <= days_in_month:
+                day = month_start.replace(day=pay_day)
+                rows["finance_transactions"].append(
+                    (user_id, day.isoformat(), salary / 2, "income", "зарплата", "", _ts(day, rng))
+                )
+        for _ in range(_count(rng, per_month * days_in_month / 30, 1.0)):
+            day = month_start + timedelta(days=rng.randrange(days_in_month))
+            category = rng.choices(categories, weights)[0]
+            amount = round(medians[category] * rng.lognormvariate(0, 0.6), 2)
+            rows["finance_transactions"].append(
+                (user_id, day.isoformat(), -amount, "expense", category, "", _ts(day, rng))
+            )
+        month_start = (month_start - timedelta(days=1)).replace(day=1)
+
+    for title in rng.sample(_GOAL_TITLES, min(len(_GOAL_TITLES), _count(rng, args.goals, 1.0))):
+        target = round(rng.lognormvariate(11.5, 0.8), -3)
+        target_date = (today + timedelta(days=rng.randint(30, 720))).isoformat() if rng.random() < 0.6 else None
+        rows["finance_goals"].append(
+            (user_id, title, target, round(target * rng.random() * 0.8, -2), target_date, rng.randint(1, 3))
+        )
+    for category in rng.sample(categories, min(len(categories), _count(rng, args.limits, 1.0))):
+        rows["finance_limits"].append((user_id, category, round(medians[category] * rng.randint(10, 30), -2)))
+
+    # История чата: ходы «пользователь — ассистент» за последние месяцы
+    turns = _count(rng, args.chat, activity) // 2
+    chat_ids = ids.take("chat_history", turns * 2)
+    moments = sorted(
+        datetime.combine(past_day(min(history_days, 180)), datetime.min.time())
+        + timedelta(seconds=rng.randint(7 * 3600, 23 * 3600))
+        for _ in range(turns)
+    )
+
+    def fill(template: str) -> str:
+        return template.format(
+            day=rng.choice(_DAYS), cat=rng.choice(categories), task=rng.choice(tasks)[1] if tasks else "дела",
+            project=rng.choice(projects)[1] if projects else "ремонт", name=rng.choice(people)[1] if people else "маме",
+            amount=rng.randint(2, 300) * 50, n=rng.randint(1, 9),
+        )
+
+    for i, moment in enumerate(moments):
+        for offset, (role, template) in enumerate((("user", rng.choice(_CHAT_USER)),
+                                                    ("assistant", rng.choice(_CHAT_ASSISTANT)))):
+            content = fill(template)
+            stamp = (moment + timedelta(seconds=offset * rng.randint(2, 20))).strftime("%Y-%m-%d %H:%M:%S")
+            rows["chat_history"].append(
+                (chat_ids[i * 2 + offset], user_id, role, content, stamp, estimate_tokens(content))
+            )
+    if chat_ids:
+        # Установившееся состояние: всё, кроме последних pending сообщений, уже в резюме
+        pending = min(len(chat_ids), rng.randint(0, 60))
+        watermark = chat_ids[-pending - 1] if pending < len(chat_ids) else 0
+        rows["chat_summary"].append((user_id, "recent", "Пользователь ведёт задачи и бюджет, спрашивает о планах.",
+                                     watermark, pending))
+        rows["chat_summary"].append((user_id, "long", "Следит за расходами, планирует отпуск и ремонт.",
+                                     watermark, 0))
+
+    # Лента событий
+    entities = {"task": tasks, "person": people, "project": projects}
+    for _ in range(_count(rng, args.timeline, activity)):
+        action, entity_type = rng.choice(_TIMELINE_ACTIONS)
+        pool = entities[entity_type]
+        if not pool:
+            continue
+        entity_id, title = rng.choice(pool)
+        rows["timeline"].append((user_id, action, entity_type, entity_id, title, "", _ts(past_day(), rng)))
+
+
+async def seed_scale(args) -> None:
+    """N синтетических пользователей пачками executemany (см. описание модуля)."""
+    today = date.fromisoformat(args.today) if args.today else date.today()
+    started = time.monotonic()
+    total = 0
+    async with aiosqlite.connect(DATABASE) as db:
+        # Тестовые данные: надёжность записи не важна, скорость — да
+        await db.execute("PRAGMA synchronous = OFF")
+        await db.execute("PRAGMA cache_size = -200000")
+        start = {}
+        for table in ("people", "projects", "tasks", "chat_history"):
+            cursor = await db.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+            start[table] = (await cursor.fetchone())[0]
+        ids = _ScaleIds(start)
+
+        for batch_start in range(0, args.scale, args.batch_users):
+            rows = {table: [] for table in _SCALE_TABLES}
+            for n in range(batch_start, min(batch_start + args.batch_users, args.scale)):
+                rng = random.Random(args.seed * 1_000_003 + n)
+                _scale_user_rows(f"{args.user_prefix}{n}", rng, ids, args, today, rows)
+            for table, sql in _SCALE_TABLES.items():
+                if rows[table]:
+                    await db.executemany(sql, rows[table])
+            await db.commit()
+            batch_rows = sum(len(r) for r in rows.values())
+            total += batch_rows
+            done = min(batch_start + args.batch_users, args.scale)
+            elapsed = time.monotonic() - started
+            print(f"  {done}/{args.scale} пользователей, {total} строк, {total / elapsed:,.0f} строк/с")
+        await db.execute("ANALYZE")
+        await db.commit()
+
+    print(f"Заполнено: {args.scale} пользователей ({args.user_prefix}0…), {total} строк "
+          f"за {time.monotonic() - started:.0f} с (seed={args.seed}, today={today.isoformat()})")
+
+
 async def main():
+    global DATABASE
     parser = argparse.ArgumentParser(description="Удалить БД и создать тестовые данные")
     parser.add_argument("--user-id", default=DEFAULT_USER_ID, help="Telegram user_id (подставь свой чтобы видеть в Hub)")
     parser.add_argument("--no-wipe", action="store_true", help="Не удалять БД, только добавить данные")
+    parser.add_argument("--db", default=DATABASE, help=f"Путь к БД (по умолчанию {DATABASE})")
+    scale = parser.add_argument_group("режим масштаба")
+    scale.add_argument("--scale", type=int, default=0, metavar="N", help="N синтетических пользователей")
+    scale.add_argument("--seed", type=int, default=1, help="зерно генератора")
+    scale.add_argument("--today", help="«сегодня» для дат (YYYY-MM-DD), для воспроизводимости")
+    scale.add_argument("--user-prefix", default="load-", help="префикс user_id (по умолчанию load-)")
+    scale.add_argument("--batch-users", type=int, default=500, help="пользователей на транзакцию")
+    scale.add_argument("--skew", type=float, default=0.8, help="разброс активности пользователей (sigma)")
+    scale.add_argument("--tasks", type=float, default=40, help="задач на пользователя (в среднем)")
+    scale.add_argument("--done-share", type=float, default=0.6, help="доля выполненных задач")
+    scale.add_argument("--contacts", type=float, default=25)
+    scale.add_argument("--notes", type=float, default=2, help="заметок на контакт и на проект")
+    scale.add_argument("--projects", type=float, default=3)
+    scale.add_argument("--members", type=float, default=2, help="участников на проект")
+    scale.add_argument("--tx-years", type=float, default=3, help="лет истории операций")
+    scale.add_argument("--tx-per-month", type=float, default=45, help="расходов в месяц")
+    scale.add_argument("--goals", type=float, default=2)
+    scale.add_argument("--limits", type=float, default=4)
+    scale.add_argument("--chat", type=float, default=200, help="сообщений истории чата")
+    scale.add_argument("--timeline", type=float, default=150, help="событий ленты")
     args = parser.parse_args()
-    
+
+    DATABASE = args.db
+
+    if args.scale:
+        # Старые данные синтетических пользователей не удаляются: с --no-wipe
+        # используйте другой --user-prefix
+        if not args.no_wipe:
+            await wipe_and_recreate()
+        await seed_scale(args)
+        print("Готово.")
+        return
+
     if not args.no_wipe:
         await wipe_and_recreate()
     else:
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Отчёт по журналу медленных SQL-запросов (telemetry/slow_queries.py).
+
+Использование (из корня репозитория):
+  python scripts/slow_query_report.py                    # все data/slow_queries.*.jsonl
+  python scripts/slow_query_report.py --hours 24 --top 10
+  python scripts/slow_query_report.py --source bot --plans
+  python scripts/slow_query_report.py --json > report.json
+
+Записи группируются по отпечатку формы запроса; для группы — число
+срабатываний, суммарное время, p50/p95/максимум, процессы, пример запроса
+и последний план. Сортировка по суммарному времени: сверху то, что сильнее
+всего тормозит в сумме. FULL SCAN — в плане есть SCAN таблицы без индекса.
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def read_entries(files: Iterable[Path], since: float, source: str = "") -> List[Dict]:
+    entries = []
+    for path in files:
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("ts", 0) < since or (source and entry.get("source") != source):
+                    continue
+                entries.append(entry)
+    return entries
+
+
+def group(entries: List[Dict]) -> List[Dict]:
+    groups: Dict[str, List[Dict]] = defaultdict(list)
+    for entry in entries:
+        groups[entry["fingerprint"]].append(entry)
+    out = []
+    for fingerprint, items in groups.items():
+        items.sort(key=lambda e: e["ts"])
+        durations = [e["duration_ms"] for e in items]
+        last = items[-1]
+        out.append({
+            "fingerprint": fingerprint,
+            "count": len(items),
+            "total_ms": round(sum(durations), 1),
+            "p50_ms": round(_percentile(durations, 50), 1),
+            "p95_ms": round(_percentile(durations, 95), 1),
+            "max_ms": round(max(durations), 1),
+            "max_rows": max(e.get("rows", 0) for e in items),
+            "sources": sorted({e.get("source", "") for e in items}),
+            "full_scan": any(e.get("full_scan") for e in items),
+            "first_seen": items[0]["ts"],
+            "last_seen": last["ts"],
+            "sql": last["sql"],
+            "params": last.get("params"),
+            "plan": last.get("plan", []),
+            "request_id": last.get("request_id"),
+        })
+    out.sort(key=lambda g: g["total_ms"], reverse=True)
+    return out
+
+
+def _fmt_ts(ts: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(ts))
+
+
+def print_report(groups: List[Dict], *, plans: bool, sql_chars: int) -> None:
+    if not groups:
+        print("Медленных запросов нет.")
+        return
+    print(f"{'отпечаток':<12} {'раз':>5} {'всего, мс':>10} {'p50':>8} {'p95':>8} {'макс':>8} {'строк':>7}  запрос")
+    for g in groups:
+        flag = "FULL SCAN " if g["full_scan"] else ""
+        sql = g["sql"] if len(g["sql"]) <= sql_chars else g["sql"][:sql_chars] + "…"
+        print(
+            f"{g['fingerprint']:<12} {g['count']:>5} {g['total_ms']:>10.1f} {g['p50_ms']:>8.1f}"
+            f" {g['p95_ms']:>8.1f} {g['max_ms']:>8.1f} {g['max_rows']:>7}  {flag}{sql}"
+        )
+        if plans:
+            print(f"{'':<12} {','.join(g['sources'])}, {_fmt_ts(g['first_seen'])} — {_fmt_ts(g['last_seen'])},"
+                  f" параметры {json.dumps(g['params'], ensure_ascii=False)}"
+                  + (f", последний запрос {g['request_id']}" if g.get("request_id") else ""))
+            for line in g["plan"] or ["(плана нет)"]:
+                print(f"{'':<14}{line}")
+            print()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Медленные SQL-запросы по отпечаткам")
+    parser.add_argument("files", nargs="*", help="файлы журнала (по умолчанию data/slow_queries.*.jsonl*)")
+    parser.add_argument("--dir", default=str(ROOT / "data"), help="каталог журналов")
+    parser.add_argument("--hours", type=float, default=0, help="только за последние N часов (0 — все)")
+    parser.add_argument("--source", default="", help="только api или bot")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--plans", action="store_true", help="показать планы и типы параметров")
+    parser.add_argument("--sql-chars", type=int, default=120)
+    parser.add_argument("--json", action="store_true", help="вывести группы в JSON")
+    args = parser.parse_args()
+
+    files = [Path(p) for p in args.files] or sorted(Path(args.dir).glob("slow_queries.*.jsonl*"))
+    if not files:
+        sys.exit(f"Журналов нет в {args.dir} (SLOW_QUERY_MS > 0 в .env API/бота?)")
+    since = time.time() - args.hours * 3600 if args.hours else 0
+    groups = group(read_entries(files, since, args.source))[: args.top]
+    if args.json:
+        print(json.dumps(groups, ensure_ascii=False, indent=1))
+    else:
+        print_report(groups, plans=args.plans, sql_chars=args.sql_chars)
+
+
+if __name__ == "__main__":
+    main()
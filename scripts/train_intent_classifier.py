@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Обучение и проверка локального классификатора намерений (api/services/intent_classifier.py).
+
+Данные — журнал ответов extract_command_with_ai: включите INTENT_LOG_PATH
+в .env (например data/intent_log.jsonl), поработайте с ботом, затем:
+
+  python scripts/train_intent_classifier.py data/intent_log.jsonl
+  python scripts/train_intent_classifier.py data/intent_log.jsonl --out data/intent_model.json
+  python scripts/train_intent_classifier.py data/intent_log.jsonl --eval data/intent_model.json
+
+Скрипт откладывает часть примеров (--holdout), обучает на остальных и печатает
+точность, долю пропущенных LLM-вызовов, долю ошибочно пропущенных команд
+(главная метрика: такие сообщения не будут выполнены) и задержку предсказания.
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Добавляем корень проекта в path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from api.services.intent_classifier import (
+    INTENT_MODEL_PATH,
+    INTENT_SKIP_THRESHOLD,
+    IntentClassifier,
+    read_log,
+)
+
+
+def evaluate(model: IntentClassifier, samples, threshold: float) -> None:
+    """Точность по порогу 0.5 и качество решения «пропустить LLM» по threshold."""
+    if not samples:
+        print("Нет примеров для проверки.")
+        return
+    correct = skipped = wrongly_skipped = actionable = 0
+    latencies = []
+    for text, label in samples:
+        started = time.perf_counter()
+        proba = model.predict_proba(text)
+        latencies.append((time.perf_counter() - started) * 1e6)
+        correct += int((proba >= 0.5) == bool(label))
+        actionable += label
+        if proba < threshold:
+            skipped += 1
+            wrongly_skipped += label
+    total = len(samples)
+    latencies.sort()
+    print(f"Примеров: {total} (команд {actionable}, none {total - actionable})")
+    print(f"Точность (порог 0.5): {correct / total:.1%}")
+    print(f"Пропущено LLM-вызовов (порог {threshold}): {skipped / total:.1%}")
+    if actionable:
+        print(f"Команд ошибочно пропущено: {wrongly_skipped} ({wrongly_skipped / actionable:.1%} от команд)")
+    print(
+        "Задержка предсказания, мкс: p50 {:.0f}, p99 {:.0f}, среднее {:.0f}".format(
+            latencies[len(latencies) // 2],
+            latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            statistics.mean(latencies),
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обучить классификатор намерений по журналу extract_command_with_ai")
+    parser.add_argument("logs", nargs="+", help="JSONL-журналы (INTENT_LOG_PATH)")
+    parser.add_argument("--out", default=INTENT_MODEL_PATH, help="Куда сохранить модель")
+    parser.add_argument("--eval", metavar="MODEL", help="Только проверить готовую модель на журнале")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Доля примеров для проверки")
+    parser.add_argument("--epochs", type=int, default=15)
+    parser.add_argument("--threshold", type=float, default=INTENT_SKIP_THRESHOLD, help="Порог пропуска LLM")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    samples = read_log(args.logs)
+    if not samples:
+        print("Журнал пуст — обучать не на чем.")
+        sys.exit(1)
+
+    if args.eval:
+        evaluate(IntentClassifier.load(args.eval), samples, args.threshold)
+        return
+
+    random.Random(args.seed).shuffle(samples)
+    split = int(len(samples) * (1 - args.holdout))
+    train, test = samples[:split], samples[split:]
+
+    model = IntentClassifier()
+    started = time.perf_counter()
+    model.fit(train, epochs=args.epochs, seed=args.seed)
+    print(f"Обучено на {len(train)} примерах за {time.perf_counter() - started:.1f} с")
+    evaluate(model, test, args.threshold)
+
+    # Итоговая модель — на всех данных
+    final = IntentClassifier()
+    final.fit(samples, epochs=args.epochs, seed=args.seed)
+    final.save(args.out)
+    print(f"Модель сохранена: {args.out} ({len(final.weights)} весов)")
+
+
+if __name__ == "__main__":
+    main()
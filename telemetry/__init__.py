@@ -0,0 +1,15 @@
+"""
+Наблюдаемость API и бота: метрики Prometheus без внешних зависимостей.
+
+- metrics — Counter / Gauge / Histogram и реестр с выводом в текстовом формате;
+- sql — замер запросов aiosqlite (install() + слушатели);
+- llm — метрики вызовов LLM по записям учёта ai_usage;
+- tracing — SQL-запросы и этапы в рамках HTTP-запроса (N+1, Server-Timing);
+- slow_queries — журнал медленных запросов с EXPLAIN QUERY PLAN;
+- profiling — cProfile отдельного запроса по X-Profile;
+- loop_monitor — задержка event loop и стеки блокирующих вызовов;
+- correlation — сквозной id запроса (X-Request-Id) от апдейта бота до API;
+- asgi — middleware HTTP-метрик API и ответ для /metrics;
+- bot — метрики апдейтов, Bot API и задач напоминаний;
+- server — отдельный HTTP-слушатель /metrics для бота.
+"""
@@ -0,0 +1,71 @@
+"""
+ASGI-middleware метрик HTTP: число запросов, задержка и запросы в работе.
+
+Метка route — шаблон пути FastAPI (/api/tasks/{task_id}), а не сам путь,
+чтобы число рядов не росло с id. Запросы мимо маршрутов (404, статика
+nginx) попадают в route="other". Задержка — до отправки последнего байта
+ответа, для потоковых ответов включает всю генерацию.
+"""
+from __future__ import annotations
+
+import time
+from typing import Dict, Optional
+
+from telemetry.metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP-запросы к API", ["method", "route", "status"])
+HTTP_DURATION = Histogram("http_request_duration_seconds", "Время обработки HTTP-запроса", ["method", "route"])
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP-запросы в обработке")
+
+
+class MetricsMiddleware:
+    """Чистое ASGI-middleware (без BaseHTTPMiddleware — не буферизует потоковые ответы)."""
+
+    def __init__(self, app, *, skip_paths: tuple = ("/metrics",)) -> None:
+        self.app = app
+        self.skip_paths = skip_paths
+        self._routes: Optional[Dict[object, str]] = None
+
+    def _route_template(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "other"
+        if self._routes is None:
+            routes: Dict[object, str] = {}
+            for route in getattr(scope.get("app"), "routes", ()):
+                path = getattr(route, "path", None)
+                if path is not None:
+                    routes.setdefault(getattr(route, "endpoint", None), path)
+            self._routes = routes
+        return self._routes.get(endpoint, "other")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            method = scope["method"]
+            route = self._route_template(scope)
+            HTTP_REQUESTS.labels(method, route, status).inc()
+            HTTP_DURATION.labels(method, route).observe(elapsed)
+
+
+def metrics_response():
+    """Ответ Starlette с текущими метриками процесса."""
+    from starlette.responses import Response
+
+    return Response(REGISTRY.render(), headers={"Content-Type": CONTENT_TYPE})
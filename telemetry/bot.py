@@ -0,0 +1,97 @@
+"""
+Метрики бота: обработка апдейтов, запросы к Bot API, задачи напоминаний.
+
+- bot_update_duration_seconds{type, outcome} — outer-middleware диспетчера,
+  от получения апдейта до конца хендлера (включая вызов /api/chat);
+- telegram_api_requests_total{method, outcome} и telegram_api_request_duration_seconds{method}
+  — middleware сессии Bot; outcome=error у send_message — неудачные отправки;
+- bot_job_duration_seconds{job, outcome} — рассылки напоминаний (timed_job).
+
+Отдаются через start_metrics_server на BOT_METRICS_PORT (0 — выключено).
+"""
+from __future__ import annotations
+
+import functools
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from telemetry.metrics import Counter, Histogram
+
+BOT_METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "0"))
+BOT_METRICS_HOST = os.getenv("BOT_METRICS_HOST", "127.0.0.1")
+
+UPDATE_DURATION = Histogram(
+    "bot_update_duration_seconds", "Время обработки апдейта Telegram", ["type", "outcome"]
+)
+TELEGRAM_REQUESTS = Counter(
+    "telegram_api_requests_total", "Запросы к Bot API", ["method", "outcome"]
+)
+TELEGRAM_DURATION = Histogram(
+    "telegram_api_request_duration_seconds", "Время запроса к Bot API", ["method"]
+)
+JOB_DURATION = Histogram(
+    "bot_job_duration_seconds",
+    "Время задачи планировщика (рассылка напоминаний)",
+    ["job", "outcome"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+
+
+async def _update_middleware(
+    handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+    event: Any,
+    data: Dict[str, Any],
+) -> Any:
+    update_type = getattr(event, "event_type", None) or "unknown"
+    outcome = "error"
+    started = time.perf_counter()
+    try:
+        result = await handler(event, data)
+        outcome = "ok"
+        return result
+    finally:
+        UPDATE_DURATION.labels(update_type, outcome).observe(time.perf_counter() - started)
+
+
+class TelegramRequestMetrics(BaseRequestMiddleware):
+    """Счётчик и время запросов к Bot API по методу (sendMessage, getUpdates, ...)."""
+
+    async def __call__(self, make_request, bot: Bot, method):
+        name = getattr(method, "__api_method__", type(method).__name__)
+        outcome = "error"
+        started = time.perf_counter()
+        try:
+            response = await make_request(bot, method)
+            outcome = "ok"
+            return response
+        finally:
+            TELEGRAM_REQUESTS.labels(name, outcome).inc()
+            # getUpdates — long polling, его время не показательно
+            if name != "getUpdates":
+                TELEGRAM_DURATION.labels(name).observe(time.perf_counter() - started)
+
+
+def install(dp: Dispatcher, bot: Bot) -> None:
+    """Подключить метрики апдейтов и запросов к Bot API."""
+    dp.update.outer_middleware(_update_middleware)
+    bot.session.middleware(TelegramRequestMetrics())
+
+
+def timed_job(name: str, job: Callable[[], Awaitable[None]]) -> Callable[[], Awaitable[None]]:
+    """Обёртка задачи планировщика: время выполнения в bot_job_duration_seconds."""
+
+    @functools.wraps(job)
+    async def wrapper() -> None:
+        outcome = "error"
+        started = time.perf_counter()
+        try:
+            await job()
+            outcome = "ok"
+        finally:
+            JOB_DURATION.labels(name, outcome).observe(time.perf_counter() - started)
+
+    return wrapper
@@ -0,0 +1,108 @@
+"""
+Сквозной id запроса: одно сообщение пользователя в логах бота и API.
+
+Бот выдаёт id на каждый апдейт Telegram (outer-middleware диспетчера) и
+передаёт его в API заголовком X-Request-Id (ApiAiService). API берёт id из
+заголовка или создаёт свой, держит его в contextvar на время запроса и
+возвращает в ответе. По id склеиваются:
+
+- строки логов обоих процессов — фильтр логирования дописывает [id];
+- трассировка SQL и журнал медленных запросов (поле request_id);
+- записи ai_calls (колонка request_id) — вызовы LLM этого сообщения.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import uuid
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict
+
+HEADER = "X-Request-Id"
+_HEADER_KEY = HEADER.lower().encode("latin-1")
+# Чужой id принимается, только если он короткий и без спецсимволов (попадает в логи)
+_VALID = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+LOG_FORMAT = "%(levelname)s:%(name)s:[%(request_id)s] %(message)s"
+
+_request_id: ContextVar[str] = ContextVar("request_id", default="")
+
+
+def new_id(prefix: str = "") -> str:
+    return f"{prefix}{uuid.uuid4().hex[:12]}"
+
+
+def current() -> str:
+    """Id текущего запроса / апдейта ("" — вне запроса)."""
+    return _request_id.get()
+
+
+def set_current(request_id: str):
+    """Выставить id; возвращает токен для reset()."""
+    return _request_id.set(request_id)
+
+
+def reset(token) -> None:
+    _request_id.reset(token)
+
+
+class RequestIdFilter(logging.Filter):
+    """Добавляет record.request_id ("-" вне запроса) для формата логов."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get() or "-"
+        return True
+
+
+def install_logging(fmt: str = LOG_FORMAT) -> None:
+    """Фильтр и формат с [request_id] для обработчиков корневого логгера (после basicConfig)."""
+    for handler in logging.getLogger().handlers:
+        if any(isinstance(f, RequestIdFilter) for f in handler.filters):
+            continue
+        handler.addFilter(RequestIdFilter())
+        handler.setFormatter(logging.Formatter(fmt))
+
+
+class RequestIdMiddleware:
+    """ASGI-middleware API: id из X-Request-Id или новый, в contextvar и в заголовок ответа."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = ""
+        for name, raw in scope.get("headers", ()):
+            if name == _HEADER_KEY:
+                value = raw.decode("latin-1").strip()
+                if _VALID.match(value):
+                    request_id = value
+                break
+        request_id = request_id or new_id("api-")
+        header = (_HEADER_KEY, request_id.encode("latin-1"))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
+
+        token = _request_id.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_id.reset(token)
+
+
+async def update_middleware(
+    handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+    event: Any,
+    data: Dict[str, Any],
+) -> Any:
+    """Outer-middleware диспетчера бота: новый id на каждый апдейт Telegram."""
+    update_id = getattr(event, "update_id", None)
+    token = _request_id.set(new_id(f"tg{update_id}-" if update_id is not None else "tg-"))
+    try:
+        return await handler(event, data)
+    finally:
+        _request_id.reset(token)
@@ -0,0 +1,33 @@
+"""
+Метрики вызовов LLM по записям учёта ai_usage (подписка через recorder.listeners).
+
+Каждая попытка вызова провайдера (включая ошибки и отменённые hedge-дубли)
+попадает в llm_calls_total{provider, hint, purpose, outcome}; задержка и токены —
+только по успешным, как и в /api/admin/ai-stats. hint — назначение модели
+(model_hint, по нему выбирается модель), purpose — вид вызова
+(chat / extract / person / summary / memory).
+"""
+from __future__ import annotations
+
+from telemetry.metrics import FAST_BUCKETS, Counter, Histogram
+
+LLM_CALLS = Counter("llm_calls_total", "Вызовы LLM-провайдеров", ["provider", "hint", "purpose", "outcome"])
+LLM_DURATION = Histogram(
+    "llm_call_duration_seconds", "Задержка успешного вызова LLM (без ожидания слота)",
+    ["provider", "hint", "purpose"],
+)
+LLM_QUEUE_WAIT = Histogram(
+    "llm_queue_wait_seconds", "Ожидание слота допуска перед вызовом LLM", ["purpose"], buckets=FAST_BUCKETS + (5.0, 10.0, 30.0, 60.0)
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Токены успешных вызовов LLM", ["provider", "purpose", "kind"])
+
+
+def observe_call(rec) -> None:
+    """Слушатель ai_usage.recorder: rec — AiCallRecord."""
+    LLM_CALLS.labels(rec.provider, rec.model_hint, rec.purpose, rec.outcome).inc()
+    LLM_QUEUE_WAIT.labels(rec.purpose).observe(rec.queue_ms / 1000)
+    if rec.outcome != "ok":
+        return
+    LLM_DURATION.labels(rec.provider, rec.model_hint, rec.purpose).observe(rec.latency_ms / 1000)
+    LLM_TOKENS.labels(rec.provider, rec.purpose, "prompt").inc(rec.prompt_tokens)
+    LLM_TOKENS.labels(rec.provider, rec.purpose, "completion").inc(rec.completion_tokens)
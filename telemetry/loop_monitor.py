@@ -0,0 +1,109 @@
+"""
+Задержка event loop и поиск блокирующих вызовов (API и бот).
+
+Процесс обслуживает всех пользователей одним event loop, и синхронный
+вызов где угодно (тяжёлый regex, большой json.dumps, sqlite3 без aiosqlite)
+останавливает всех. Монитор:
+
+- задача в loop каждые LOOP_MONITOR_INTERVAL секунд засыпает и меряет, на
+  сколько проснулась позже — event_loop_lag_seconds;
+- поток-сторож замечает, что задача не просыпается дольше LOOP_BLOCK_MS,
+  и снимает стек потока loop в этот момент — это и есть блокирующий код;
+- когда loop оживает, в лог уходит одно предупреждение: сколько длилась
+  блокировка и снятый стек; event_loop_blocks_total растёт.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from telemetry.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR", "1") == "1"
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.25"))
+LOOP_BLOCK_MS = float(os.getenv("LOOP_BLOCK_MS", "300"))
+_STACK_FRAMES = 25
+
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Опоздание пробуждения задачи-монитора event loop",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+LOOP_BLOCKS = Counter("event_loop_blocks_total", "Блокировки event loop дольше LOOP_BLOCK_MS")
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, block_ms: float = LOOP_BLOCK_MS) -> None:
+        self.interval = interval
+        self.threshold = block_ms / 1000
+        # Последние блокировки (для отладки из консоли / admin-эндпоинтов)
+        self.recent: Deque[Dict] = deque(maxlen=20)
+        self._beat = time.monotonic()
+        self._stack: Optional[List[str]] = None
+        self._loop_thread = 0
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> "LoopMonitor":
+        """Запустить из работающего event loop."""
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            self._beat = time.monotonic()
+            LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                self._report(lag)
+
+    def _report(self, lag: float) -> None:
+        stack, self._stack = self._stack, None
+        LOOP_BLOCKS.inc()
+        self.recent.append({"ts": time.time(), "blocked_ms": round(lag * 1000, 1), "stack": stack or []})
+        logger.warning(
+            "Event loop blocked for %.0f ms%s",
+            lag * 1000,
+            (":\n" + "".join(stack)) if stack else " (stack not captured)",
+        )
+
+    def _watch(self) -> None:
+        captured_for = None
+        period = max(0.01, self.threshold / 4)
+        while not self._stop.wait(period):
+            beat = self._beat
+            if beat == captured_for or time.monotonic() - beat < self.interval + self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._stack = traceback.format_stack(frame)[-_STACK_FRAMES:]
+            captured_for = beat
+
+
+def start() -> Optional[LoopMonitor]:
+    """Монитор для текущего event loop (LOOP_MONITOR=0 — None)."""
+    if not LOOP_MONITOR_ENABLED:
+        return None
+    return LoopMonitor().start()
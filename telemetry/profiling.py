@@ -0,0 +1,184 @@
+"""
+Профилирование отдельного запроса API (cProfile) по заголовку или параметру.
+
+Запрос с X-Profile: <значение> или ?profile=<значение> профилируется, если
+значение "1" при API_DEBUG=1 или совпадает с ADMIN_TOKEN (для прода без
+перезапуска). Профиль — pstats-файл в data/profiles/ (дерево вызовов:
+snakeviz, gprof2dot, python -m pstats) и рядом JSON с метаданными; id
+артефакта приходит в заголовке ответа X-Profile-Id. Хранится не больше
+PROFILE_KEEP последних.
+
+Event loop один на все запросы, поэтому профайлер включается только на
+шагах задач этого запроса: корутины оборачиваются так, что cProfile
+работает между send() и следующим await, а задачи, созданные внутри
+запроса (gather, тело StreamingResponse), наследуют профиль через task
+factory. В профиль попадает CPU-время цикла на этот запрос; ожидание сети
+и потоки aiosqlite — нет (их видно в Server-Timing и трассировке SQL).
+
+Просмотр: python scripts/profile_report.py list | show <id>.
+"""
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import json
+import logging
+import os
+import pstats
+import re
+import time
+import uuid
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlencode
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "data/profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+
+_active: ContextVar[Optional[cProfile.Profile]] = ContextVar("request_profiler", default=None)
+
+
+class _Profiled:
+    """Awaitable-обёртка корутины: профайлер включён только пока выполняется её шаг."""
+
+    __slots__ = ("_coro", "_profiler")
+
+    def __init__(self, coro, profiler: cProfile.Profile) -> None:
+        self._coro = coro
+        self._profiler = profiler
+
+    def __await__(self):
+        coro, profiler = self._coro, self._profiler
+        value, error = None, None
+        while True:
+            profiler.enable()
+            try:
+                yielded = coro.send(value) if error is None else coro.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                profiler.disable()
+            try:
+                value, error = (yield yielded), None
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+
+
+async def _run_profiled(coro, profiler: cProfile.Profile):
+    return await _Profiled(coro, profiler)
+
+
+def _task_factory(previous):
+    def factory(loop, coro, **kwargs):
+        profiler = _active.get()
+        if profiler is not None:
+            coro = _run_profiled(coro, profiler)
+        if previous is not None:
+            return previous(loop, coro, **kwargs)
+        return asyncio.Task(coro, loop=loop, **kwargs)
+
+    return factory
+
+
+def install_task_factory(loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+    """Задачи, созданные внутри профилируемого запроса, тоже профилируются (вызывать в startup)."""
+    loop = loop or asyncio.get_running_loop()
+    previous = loop.get_task_factory()
+    if getattr(previous, "_request_profiling", False):
+        return
+    factory = _task_factory(previous)
+    factory._request_profiling = True
+    loop.set_task_factory(factory)
+
+
+def _slug(path: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "-", path).strip("-")[:60] or "root"
+
+
+def _public_query(query_string: bytes) -> str:
+    """Строка запроса без самого profile= (там может быть ADMIN_TOKEN)."""
+    params = parse_qs(query_string.decode("latin-1"), keep_blank_values=True)
+    params.pop("profile", None)
+    return urlencode(params, doseq=True)
+
+
+def _prune(directory: Path, keep: int) -> None:
+    profiles = sorted(directory.glob("*.prof"))
+    for old in profiles[: max(0, len(profiles) - keep)]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".json").unlink(missing_ok=True)
+
+
+def _save(directory: Path, profile_id: str, profiler: cProfile.Profile, meta: dict) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    meta["profiled_ms"] = round(pstats.Stats(profiler).total_tt * 1000, 1)
+    profiler.dump_stats(str(directory / f"{profile_id}.prof"))
+    (directory / f"{profile_id}.json").write_text(json.dumps(meta, ensure_ascii=False, indent=1), encoding="utf-8")
+    _prune(directory, PROFILE_KEEP)
+
+
+class ProfileMiddleware:
+    """ASGI-middleware: cProfile для запросов с X-Profile / ?profile= (см. модуль)."""
+
+    def __init__(self, app, *, token: str = "", debug: bool = False, directory: Path = PROFILE_DIR) -> None:
+        self.app = app
+        self.token = token
+        self.debug = debug
+        self.directory = directory
+
+    def _requested(self, scope) -> bool:
+        value = ""
+        for name, raw in scope.get("headers", ()):
+            if name == b"x-profile":
+                value = raw.decode("latin-1")
+                break
+        if not value and b"profile=" in scope.get("query_string", b""):
+            value = parse_qs(scope["query_string"].decode("latin-1")).get("profile", [""])[0]
+        if not value:
+            return False
+        return (self.debug and value == "1") or (bool(self.token) and value == self.token)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+        profiler = cProfile.Profile()
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}_{scope['method']}_{_slug(scope['path'])}_{uuid.uuid4().hex[:6]}"
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _active.set(profiler)
+        started = time.perf_counter()
+        try:
+            await _Profiled(self.app(scope, receive, send_wrapper), profiler)
+        finally:
+            _active.reset(token)
+            wall_ms = (time.perf_counter() - started) * 1000
+            meta = {
+                "id": profile_id,
+                "ts": round(time.time(), 3),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": _public_query(scope.get("query_string", b"")),
+                "status": status,
+                "wall_ms": round(wall_ms, 1),
+            }
+            try:
+                await asyncio.to_thread(_save, self.directory, profile_id, profiler, meta)
+                logger.info("Profile %s saved (%s %s, %.0f ms)", profile_id, scope["method"], scope["path"], wall_ms)
+            except OSError as e:
+                logger.warning("Profile %s not saved: %s", profile_id, e)
@@ -0,0 +1,29 @@
+"""
+Маленький HTTP-сервер с /metrics для процессов без своего веб-сервера (бот).
+
+Работает в том же event loop на aiohttp (уже есть в зависимостях aiogram).
+"""
+from __future__ import annotations
+
+import logging
+
+from aiohttp import web
+
+from telemetry.metrics import CONTENT_TYPE, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+async def _metrics(_request: web.Request) -> web.Response:
+    return web.Response(body=REGISTRY.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def start_metrics_server(port: int, host: str = "127.0.0.1") -> web.AppRunner:
+    """Поднять GET /metrics на host:port; вернуть runner (await runner.cleanup() при остановке)."""
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,130 @@
+"""
+Журнал медленных SQL-запросов API и бота.
+
+Запрос, суммарное время которого (выполнение + чтение строк) превысило
+SLOW_QUERY_MS, пишется одной JSON-строкой в data/slow_queries.<source>.jsonl
+(ротация по размеру, SLOW_QUERY_LOG_MB × SLOW_QUERY_LOG_BACKUPS; у каждого
+процесса свой файл). В записи — нормализованный текст и отпечаток формы,
+типы параметров (без значений: это данные пользователей), время, число
+строк, EXPLAIN QUERY PLAN (на отдельном соединении к той же базе) и
+сквозной id запроса (telemetry.correlation), в котором он выполнялся.
+EXPLAIN и запись в файл идут в фоне, вне event loop: запрос их не ждёт.
+
+Отчёт по отпечаткам: python scripts/slow_query_report.py.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import logging.handlers
+import os
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from telemetry import correlation, sql
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG_DIR = os.getenv("SLOW_QUERY_LOG_DIR", "data")
+SLOW_QUERY_LOG_MB = float(os.getenv("SLOW_QUERY_LOG_MB", "5"))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "3"))
+
+# Для этих запросов план есть смысл снимать (DDL и PRAGMA — нет)
+_EXPLAIN_OPS = {"select", "insert", "update", "delete", "replace", "with"}
+_MAX_SQL_CHARS = 4000
+
+_journal: Optional[logging.Logger] = None
+_source = ""
+
+
+def log_path(source: str, directory: str = SLOW_QUERY_LOG_DIR) -> Path:
+    return Path(directory) / f"slow_queries.{source}.jsonl"
+
+
+def _value_type(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "blob"
+    return type(value).__name__
+
+
+def params_shape(params: Any, many: bool = False) -> Any:
+    """Типы параметров без значений: ["str", "int"], {"uid": "str"}, для executemany — {"rows": N, "row": [...]}."""
+    if many:
+        rows = params if isinstance(params, (list, tuple)) else None
+        return {"rows": len(rows) if rows is not None else None, "row": params_shape(rows[0]) if rows else None}
+    if params is None:
+        return []
+    if isinstance(params, dict):
+        return {key: _value_type(value) for key, value in params.items()}
+    return [_value_type(value) for value in params]
+
+
+def is_full_scan(plan) -> bool:
+    """В плане есть полный проход таблицы (SCAN без индекса)."""
+    for line in plan:
+        detail = line.strip()
+        if detail.startswith("SCAN ") and "INDEX" not in detail:
+            return True
+    return False
+
+
+async def _on_slow_query(query: sql.Query, connection) -> None:
+    # Снимок до первого await: запрос продолжает читать строки
+    entry = {
+        "ts": round(time.time(), 3),
+        "source": _source,
+        "fingerprint": query.fingerprint,
+        "op": query.op,
+        "sql": query.normalized[:_MAX_SQL_CHARS],
+        "params": params_shape(query.params, query.many),
+        "duration_ms": round(query.seconds * 1000, 2),
+        "rows": query.rows,
+        "plan": [],
+        "full_scan": False,
+        "request_id": correlation.current() or None,
+    }
+    logger.warning(
+        "Slow query %.1f ms (%s rows) [%s]: %s",
+        entry["duration_ms"], query.rows, query.fingerprint, entry["sql"][:200],
+    )
+    if query.op in _EXPLAIN_OPS:
+        params = query.params
+        if query.many:
+            rows = params if isinstance(params, (list, tuple)) else None
+            params = rows[0] if rows else None
+        try:
+            plan = await sql.explain(connection, query.sql, params)
+        except Exception as e:  # база в памяти, параметры из генератора и т.п.
+            plan = [f"EXPLAIN failed: {e}"]
+        entry["plan"], entry["full_scan"] = plan, is_full_scan(plan)
+    if _journal is not None:
+        # RotatingFileHandler пишет и ротирует файл синхронно — в потоке
+        await asyncio.to_thread(_journal.info, json.dumps(entry, ensure_ascii=False))
+
+
+def install(source: str, *, threshold_ms: float = SLOW_QUERY_MS, directory: str = SLOW_QUERY_LOG_DIR) -> None:
+    """Включить журнал для процесса source ("api", "bot"); threshold_ms <= 0 — выключено."""
+    global _journal, _source
+    if threshold_ms <= 0 or _journal is not None:
+        return
+    path = log_path(source, directory)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(
+        path,
+        maxBytes=int(SLOW_QUERY_LOG_MB * 1024 * 1024),
+        backupCount=SLOW_QUERY_LOG_BACKUPS,
+        encoding="utf-8",
+    )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    journal = logging.getLogger(f"{__name__}.journal.{source}")
+    journal.setLevel(logging.INFO)
+    journal.propagate = False
+    journal.addHandler(handler)
+    _journal, _source = journal, source
+    sql.install()
+    sql.set_slow_query_hook(threshold_ms / 1000, _on_slow_query)
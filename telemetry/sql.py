@@ -0,0 +1,273 @@
+"""
+Замер SQL-запросов aiosqlite без правки кода, который их выполняет.
+
+install() оборачивает Connection.execute / executemany / execute_fetchall и
+Cursor.execute / executemany / fetch* (один раз на процесс). Каждый запрос
+описывается объектом Query; время выполнения и чтения строк уходит
+слушателям (add_listener) и в метрики db_queries_total /
+db_query_duration_seconds{op, phase}.
+
+Фаза execute — выполнение запроса в потоке соединения, fetch — чтение строк
+курсора (у SQLite заметная часть работы SELECT приходится именно на неё).
+Ошибка слушателя не влияет на запрос.
+
+Для медленных запросов (set_slow_query_hook) после выполнения или чтения
+курсора в фоне запускается асинхронный обработчик с тем же соединением —
+запрос его не ждёт. Обработчик может снять EXPLAIN QUERY PLAN (explain()) на
+отдельном соединении к той же базе: исходное к этому времени может быть закрыто.
+
+normalize_sql() / fingerprint() сводят запросы одной формы (разные литералы,
+длина списка IN) к одному тексту — по нему трассировка ищет повторы
+внутри запроса, а отчёт о медленных запросах группирует записи.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import hashlib
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, List, Optional, Set
+
+from telemetry.metrics import FAST_BUCKETS, Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+_OPS = {"SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH", "CREATE", "ALTER", "DROP", "PRAGMA"}
+
+DB_QUERIES = Counter("db_queries_total", "SQL-запросы (aiosqlite) по типу", ["op"])
+DB_ERRORS = Counter("db_query_errors_total", "SQL-запросы, завершившиеся ошибкой", ["op"])
+DB_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Время SQL-запроса: execute — выполнение, fetch — чтение строк",
+    ["op", "phase"],
+    buckets=FAST_BUCKETS,
+)
+
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=2048)
+def normalize_sql(sql: str) -> str:
+    """Текст запроса без литералов и лишних пробелов; списки (?, ?, ...) — как (?, ...)."""
+    text = _STRING_LITERAL.sub("?", sql)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = _WHITESPACE.sub(" ", text).strip().rstrip(";").rstrip()
+    return _PLACEHOLDER_LIST.sub("(?, ...)", text)
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    """Короткий идентификатор формы запроса (по normalize_sql)."""
+    return hashlib.sha1(normalize_sql(sql).encode("utf-8")).hexdigest()[:12]
+
+
+def statement_op(sql: str) -> str:
+    """Тип запроса по первому слову (SELECT / INSERT / ...; прочее — other)."""
+    head = sql.lstrip().split(None, 1)
+    op = head[0].upper() if head else ""
+    return op.lower() if op in _OPS else "other"
+
+
+@dataclass
+class Query:
+    """Один выполненный запрос; seconds и rows растут по мере чтения курсора."""
+
+    sql: str
+    params: Any
+    many: bool
+    op: str
+    seconds: float = 0.0
+    rows: int = 0
+    error: bool = False
+    slow_reported: bool = False
+
+    @property
+    def normalized(self) -> str:
+        return normalize_sql(self.sql)
+
+    @property
+    def fingerprint(self) -> str:
+        return fingerprint(self.sql)
+
+
+Listener = Callable[[Query, float, str], None]
+SlowQueryHook = Callable[[Query, Any], Awaitable[None]]
+_listeners: List[Listener] = []
+_installed = False
+_slow_threshold = 0.0
+_slow_hook: Optional[SlowQueryHook] = None
+# Запущенные обработчики медленных запросов (ссылки, чтобы задачи не собрал GC)
+_slow_tasks: Set[asyncio.Task] = set()
+
+
+def add_listener(listener: Listener) -> None:
+    """listener(query, elapsed_seconds, phase) после execute и после каждого fetch*."""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_listener(listener: Listener) -> None:
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def set_slow_query_hook(threshold_seconds: float, hook: Optional[SlowQueryHook]) -> None:
+    """hook(query, connection) — один раз на запрос, когда его время (execute + fetch) превысило порог."""
+    global _slow_threshold, _slow_hook
+    _slow_threshold = threshold_seconds
+    _slow_hook = hook
+
+
+def _check_slow(query: Query, connection) -> None:
+    if _slow_hook is None or query.slow_reported or query.error or query.seconds < _slow_threshold:
+        return
+    query.slow_reported = True
+    # Диагностика — в фоне: запрос пользователя её не ждёт
+    task = asyncio.get_running_loop().create_task(_run_slow_hook(_slow_hook, query, connection))
+    _slow_tasks.add(task)
+    task.add_done_callback(_slow_tasks.discard)
+
+
+async def _run_slow_hook(hook: SlowQueryHook, query: Query, connection) -> None:
+    try:
+        await hook(query, connection)
+    except Exception:
+        logger.exception("Slow query hook failed")
+
+
+async def drain_slow_hooks() -> None:
+    """Дождаться запущенных обработчиков медленных запросов (остановка процесса, тесты)."""
+    if _slow_tasks:
+        await asyncio.gather(*list(_slow_tasks), return_exceptions=True)
+
+
+async def explain(connection, sql: str, params: Any = None) -> List[str]:
+    """
+    EXPLAIN QUERY PLAN на отдельном соединении к той же базе (в потоке, минуя
+    обёртки замера): строки плана с отступом по вложенности, как в sqlite3 CLI.
+    Очередь исходного соединения не занимаем — оно обслуживает запрос пользователя.
+    """
+
+    def _plan():
+        conn = connection._connector()
+        try:
+            return conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall()
+        finally:
+            conn.close()
+
+    rows = await asyncio.to_thread(_plan)
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _notused, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+
+def _notify(query: Query, elapsed: float, phase: str) -> None:
+    for listener in _listeners:
+        try:
+            listener(query, elapsed, phase)
+        except Exception:
+            logger.exception("SQL listener failed")
+
+
+def _record_metrics(query: Query, elapsed: float, phase: str) -> None:
+    if phase == "execute":
+        DB_QUERIES.labels(query.op).inc()
+        if query.error:
+            DB_ERRORS.labels(query.op).inc()
+    DB_DURATION.labels(query.op, phase).observe(elapsed)
+
+
+async def _observed(awaitable, connection, sql: str, params: Any, many: bool):
+    query = Query(sql=sql, params=params, many=many, op=statement_op(sql))
+    started = time.perf_counter()
+    try:
+        result = await awaitable
+    except BaseException:
+        query.error = True
+        elapsed = time.perf_counter() - started
+        query.seconds += elapsed
+        _notify(query, elapsed, "execute")
+        raise
+    elapsed = time.perf_counter() - started
+    query.seconds += elapsed
+    if isinstance(result, list):  # execute_fetchall
+        query.rows = len(result)
+    elif result is not None:
+        result._telemetry_query = query
+    _notify(query, elapsed, "execute")
+    # Время SELECT складывается в основном при чтении строк — проверка после fetch*
+    if result is None or isinstance(result, list) or query.op not in ("select", "with", "pragma"):
+        _check_slow(query, connection)
+    return result
+
+
+def _params(args: tuple, kwargs: dict) -> Optional[Any]:
+    if args:
+        return args[0]
+    return kwargs.get("parameters")
+
+
+def _wrap_execute(cls: type, name: str, *, many: bool, as_result: bool) -> None:
+    from aiosqlite.context import Result
+
+    original = getattr(cls, name)
+
+    @functools.wraps(original)
+    def execute(self, sql, *args, **kwargs):
+        connection = self if as_result else self._conn  # у Cursor — его Connection
+        coro = _observed(original(self, sql, *args, **kwargs), connection, sql, _params(args, kwargs), many)
+        return Result(coro) if as_result else coro
+
+    setattr(cls, name, execute)
+
+
+def _wrap_fetch(cls: type, name: str) -> None:
+    original = getattr(cls, name)
+
+    @functools.wraps(original)
+    async def fetch(self, *args, **kwargs):
+        query: Optional[Query] = getattr(self, "_telemetry_query", None)
+        if query is None:
+            return await original(self, *args, **kwargs)
+        started = time.perf_counter()
+        result = await original(self, *args, **kwargs)
+        elapsed = time.perf_counter() - started
+        query.seconds += elapsed
+        if name == "fetchone":
+            query.rows += result is not None
+        else:
+            query.rows += len(result)
+        _notify(query, elapsed, "fetch")
+        _check_slow(query, self._conn)
+        return result
+
+    setattr(cls, name, fetch)
+
+
+def install() -> None:
+    """Включить замер всех запросов aiosqlite в процессе (повторный вызов ничего не делает)."""
+    global _installed
+    if _installed:
+        return
+    from aiosqlite.core import Connection
+    from aiosqlite.cursor import Cursor
+
+    _wrap_execute(Connection, "execute", many=False, as_result=True)
+    _wrap_execute(Connection, "executemany", many=True, as_result=True)
+    _wrap_execute(Connection, "execute_fetchall", many=False, as_result=True)
+    _wrap_execute(Cursor, "execute", many=False, as_result=False)
+    _wrap_execute(Cursor, "executemany", many=True, as_result=False)
+    for name in ("fetchone", "fetchmany", "fetchall"):
+        _wrap_fetch(Cursor, name)
+    add_listener(_record_metrics)
+    _installed = True
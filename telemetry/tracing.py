@@ -0,0 +1,155 @@
+"""
+Трассировка запроса API: SQL-запросы и этапы обработки одного HTTP-запроса.
+
+RequestTraceMiddleware кладёт RequestTrace в contextvar, слушатель
+telemetry.sql (record_query) дописывает в него каждый запрос, выполненный
+в этом HTTP-запросе, — из эндпоинтов main.py, репозиториев, AgentCore.
+
+- SQL_TRACE=1 — строка-сводка в лог на каждый запрос: число SQL-запросов,
+  время в БД и формы запросов, повторённые SQL_TRACE_REPEAT и больше раз
+  (N+1: запрос в цикле по строкам предыдущего);
+- API_DEBUG=1 — заголовок Server-Timing: db, этапы из add_timing(), total.
+  Этапы сейчас присылает конвейер чата (ChatTimings в api/main.py: parse,
+  extract, context, llm, ...); этап с тем же именем суммируется.
+
+Фоновые задачи, запущенные из обработчика, наследуют трассу, но после
+ответа она закрыта и их запросы не учитываются.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from telemetry.sql import Query
+
+logger = logging.getLogger(__name__)
+
+SQL_TRACE_ENABLED = os.getenv("SQL_TRACE", "0") == "1"
+SQL_TRACE_REPEAT = int(os.getenv("SQL_TRACE_REPEAT", "5"))
+API_DEBUG = os.getenv("API_DEBUG", "0") == "1"
+
+
+@dataclass
+class QueryShape:
+    """Запросы одной формы (normalize_sql) внутри трассы."""
+
+    sql: str
+    count: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class RequestTrace:
+    started: float = field(default_factory=time.perf_counter)
+    queries: int = 0
+    db_seconds: float = 0.0
+    shapes: Dict[str, QueryShape] = field(default_factory=dict)
+    # (имя, секунды, описание) для Server-Timing
+    timings: List[Tuple[str, float, str]] = field(default_factory=list)
+    closed: bool = False
+
+    def add_query(self, query: Query, elapsed: float, phase: str) -> None:
+        if self.closed:
+            return
+        shape = self.shapes.get(query.fingerprint)
+        if shape is None:
+            shape = self.shapes[query.fingerprint] = QueryShape(query.normalized)
+        self.db_seconds += elapsed
+        shape.seconds += elapsed
+        if phase == "execute":
+            self.queries += 1
+            shape.count += 1
+
+    def repeated(self, threshold: int = SQL_TRACE_REPEAT) -> List[QueryShape]:
+        """Формы запросов, выполненные threshold и больше раз (по убыванию числа)."""
+        shapes = [s for s in self.shapes.values() if s.count >= threshold]
+        return sorted(shapes, key=lambda s: s.count, reverse=True)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        parts = [f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} SQL"']
+        for name, seconds, desc in self.timings:
+            part = f"{name};dur={seconds * 1000:.1f}"
+            parts.append(f'{part};desc="{desc}"' if desc else part)
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+def add_timing(name: str, seconds: float, desc: str = "") -> None:
+    """Этап обработки для Server-Timing текущего запроса (вне трассы — ничего)."""
+    trace = _current.get()
+    if trace is None or trace.closed:
+        return
+    for i, (existing, total, existing_desc) in enumerate(trace.timings):
+        if existing == name:
+            trace.timings[i] = (name, total + seconds, desc or existing_desc)
+            return
+    trace.timings.append((name, seconds, desc))
+
+
+def record_query(query: Query, elapsed: float, phase: str) -> None:
+    """Слушатель telemetry.sql: запрос — в трассу текущего HTTP-запроса."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add_query(query, elapsed, phase)
+
+
+def _log_summary(scope, status: int, trace: RequestTrace) -> None:
+    args = (
+        scope["method"], scope["path"], status, trace.queries,
+        trace.db_seconds * 1000, trace.elapsed() * 1000,
+    )
+    repeated = trace.repeated()
+    if repeated:
+        details = "; ".join(f"{s.count}× {s.seconds * 1000:.1f} ms {s.sql[:160]}" for s in repeated)
+        logger.warning("SQL trace %s %s %s: %d queries, db %.1f ms of %.1f ms; repeated: %s", *args, details)
+    else:
+        logger.info("SQL trace %s %s %s: %d queries, db %.1f ms of %.1f ms", *args)
+
+
+class RequestTraceMiddleware:
+    """ASGI-middleware: трасса на каждый HTTP-запрос, сводка в лог и/или Server-Timing."""
+
+    def __init__(self, app, *, log_summary: bool = SQL_TRACE_ENABLED, server_timing: bool = API_DEBUG) -> None:
+        self.app = app
+        self.log_summary = log_summary
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = RequestTrace()
+        token = _current.set(trace)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            trace.closed = True
+            if self.log_summary:
+                _log_summary(scope, status, trace)
@@ -0,0 +1,140 @@
+"""Circuit breaker провайдеров LLM: half-open проба занимается только при отправке."""
+import asyncio
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from api.services import ai_client  # noqa: E402
+
+
+def _provider(name: str, reply: str) -> ai_client.Provider:
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        message = SimpleNamespace(content=reply)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    provider = ai_client.Provider(
+        name=name, kind="openai", base_url="http://fake", api_key="x", models={"chat": "m"}
+    )
+    provider.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    provider.calls = calls
+    return provider
+
+
+def _open_then_cool_down(health: ai_client.ProviderHealth) -> None:
+    for _ in range(ai_client.CIRCUIT_FAILURES):
+        health.record_failure()
+    health.open_until = time.monotonic() - 1
+
+
+def test_available_is_read_only():
+    health = ai_client.ProviderHealth()
+    _open_then_cool_down(health)
+    assert health.available()
+    assert health.available()
+    assert not health.half_open_probe
+
+
+def test_recovered_provider_stays_eligible_when_primary_answers(monkeypatch):
+    primary = _provider("primary", "ok")
+    recovered = _provider("recovered", "probe")
+    _open_then_cool_down(recovered.health)
+    registry = ai_client.ProviderRegistry([primary, recovered])
+    registry._started = True
+    monkeypatch.setattr(ai_client, "_registry", registry)
+
+    assert registry.failover_chain() == [primary, recovered]
+    assert asyncio.run(ai_client.chat([{"role": "user", "content": "hi"}])) == "ok"
+
+    assert recovered.calls == []
+    assert not recovered.health.half_open_probe
+    assert recovered in registry.failover_chain()
+
+
+def test_cancelled_probe_releases_claim(monkeypatch):
+    provider = _provider("recovered", "probe")
+    _open_then_cool_down(provider.health)
+
+    async def hang(**kwargs):
+        await asyncio.sleep(10)
+
+    provider.client.chat.completions.create = hang
+
+    async def run():
+        task = asyncio.ensure_future(
+            ai_client._call_provider(provider, [{"role": "user", "content": "hi"}], "chat", 10, 0.0, 0)
+        )
+        await asyncio.sleep(0.01)
+        assert provider.health.half_open_probe
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert not provider.health.half_open_probe
+    assert provider.health.available()
+
+
+def test_half_open_provider_gets_single_probe(monkeypatch):
+    recovered = _provider("recovered", "probe")
+    backup = _provider("backup", "backup")
+    _open_then_cool_down(recovered.health)
+    # Ставим восстановленного провайдера первым в цепочке
+    recovered.health.error_rate = 0.0
+    registry = ai_client.ProviderRegistry([recovered, backup])
+    registry._started = True
+    monkeypatch.setattr(ai_client, "_registry", registry)
+    assert registry.failover_chain() == [recovered, backup]
+
+    release = asyncio.Event()
+    create = recovered.client.chat.completions.create
+
+    async def slow(**kwargs):
+        await release.wait()
+        return await create(**kwargs)
+
+    recovered.client.chat.completions.create = slow
+
+    async def run():
+        first = asyncio.ensure_future(ai_client.chat([{"role": "user", "content": "a"}]))
+        second = asyncio.ensure_future(ai_client.chat([{"role": "user", "content": "b"}]))
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(first, second)
+
+    assert sorted(asyncio.run(run())) == ["backup", "probe"]
+    assert len(recovered.calls) == 1
+    assert len(backup.calls) == 1
+    assert not recovered.health.half_open_probe
+    assert recovered.health.consecutive_failures == 0
+
+
+def test_cancelled_hedge_cancels_first_call():
+    first = _provider("first", "slow")
+    second = _provider("second", "fast")
+    started = asyncio.Event()
+    cancelled = []
+
+    async def call(provider):
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(provider.name)
+            raise
+        return provider.name
+
+    async def run():
+        task = asyncio.ensure_future(ai_client._hedged(first, second, call))
+        await started.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+        # Проверяем до выхода из asyncio.run — он сам отменил бы висящие задачи
+        assert cancelled == ["first"]
+
+    asyncio.run(run())
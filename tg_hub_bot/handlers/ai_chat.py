@@ -2,17 +2,82 @@
 Хендлер текстовых сообщений → ИИ. ARCH: только вызов ai_service и ответ пользователю.
 
 Проверка оплаты — без неё ответ «Оплатите через /start».
+Ответ приходит потоком: заглушка «Думаю...» редактируется по мере генерации.
 """
 from __future__ import annotations
 
+import logging
+import time
+from typing import AsyncIterator
+
 from aiogram import F, Dispatcher
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.types import Message
+from aiogram.utils.chat_action import ChatActionSender
 
 from config import PAYMENT_STARS
 from storage.bootstrap import get_paid_repo
 from tg_hub_bot.services.ai import AiService
 
+logger = logging.getLogger(__name__)
+
+# Telegram ограничивает частоту правок (~1 в секунду на чат), длину — 4096 символов
+EDIT_INTERVAL_SECONDS = 1.5
+EDIT_MIN_NEW_CHARS = 40
+TELEGRAM_TEXT_LIMIT = 4096
+
+
+async def _edit_plain(placeholder: Message, text: str) -> bool:
+    """Промежуточная правка без HTML: незакрытый тег в середине генерации ломает parse_mode."""
+    try:
+        await placeholder.edit_text(text, parse_mode=None)
+        return True
+    except TelegramRetryAfter as e:
+        logger.info("Telegram edit throttled, retry after %ss", e.retry_after)
+    except TelegramBadRequest as e:
+        # «message is not modified» и т.п. — просто пропускаем правку
+        logger.debug("Telegram edit skipped: %s", e)
+    return False
+
+
+async def _deliver_final(message: Message, placeholder: Message, text: str) -> None:
+    """Окончательный ответ: HTML-разметка, длинный текст — несколькими сообщениями."""
+    chunks = [
+        text[i:i + TELEGRAM_TEXT_LIMIT] for i in range(0, len(text), TELEGRAM_TEXT_LIMIT)
+    ] or [text]
+    try:
+        await placeholder.edit_text(chunks[0], parse_mode=ParseMode.HTML)
+    except TelegramBadRequest:
+        await _edit_plain(placeholder, chunks[0])
+    for chunk in chunks[1:]:
+        try:
+            await message.answer(chunk, parse_mode=ParseMode.HTML)
+        except TelegramBadRequest:
+            await message.answer(chunk, parse_mode=None)
+
+
+async def _stream_into_message(
+    message: Message,
+    placeholder: Message,
+    snapshots: AsyncIterator[str],
+) -> None:
+    """Редактирует заглушку по мере прихода текста, не чаще EDIT_INTERVAL_SECONDS."""
+    text = ""
+    shown = ""
+    last_edit = 0.0
+    async for text in snapshots:
+        now = time.monotonic()
+        if now - last_edit < EDIT_INTERVAL_SECONDS:
+            continue
+        if len(text) - len(shown) < EDIT_MIN_NEW_CHARS and shown:
+            continue
+        preview = text if len(text) <= TELEGRAM_TEXT_LIMIT else text[:TELEGRAM_TEXT_LIMIT - 1] + "…"
+        if await _edit_plain(placeholder, preview + " ▍"):
+            shown = text
+        last_edit = now
+    await _deliver_final(message, placeholder, text or "😕 ИИ не прислал ответа.")
+
 
 async def _handle_chat_with_ai(message: Message, ai_service: AiService) -> None:
     """
@@ -37,9 +102,13 @@ async def _handle_chat_with_ai(message: Message, ai_service: AiService) -> None:
             )
             return
 
-    await message.answer("🧠 Думаю...")
-    answer = await ai_service.generate_response(user_id, text)
-    await message.answer(answer, parse_mode=ParseMode.HTML)
+    placeholder = await message.answer("🧠 Думаю...")
+    async with ChatActionSender.typing(bot=message.bot, chat_id=message.chat.id):
+        await _stream_into_message(
+            message,
+            placeholder,
+            ai_service.stream_response(user_id, text),
+        )
 
 
 def register_ai_chat_handler(dp: Dispatcher, ai_service: AiService) -> None:
@@ -49,4 +118,3 @@ def register_ai_chat_handler(dp: Dispatcher, ai_service: AiService) -> None:
     async def chat_with_ai(message: Message) -> None:  # noqa: D401
         """Любой текст — при командах (/) просто выходим, остальное в ИИ."""
         await _handle_chat_with_ai(message, ai_service)
-
@@ -19,6 +19,8 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.base import BaseTrigger
 from apscheduler.triggers.cron import CronTrigger
 
+from telemetry.bot import timed_job
+
 
 logger = logging.getLogger(__name__)
 
@@ -60,27 +62,27 @@ class SchedulerService:
         self._register_default_jobs()
 
     def _register_default_jobs(self) -> None:
-        """Регистрирует стандартные напоминания (9:00, 12:00, 20:00, каждую минуту)."""
+        """Регистрирует стандартные напоминания (9:00, 12:00, 20:00, каждую минуту); время рассылок — в метриках."""
         self._scheduler.add_job(
-            self._reminders.send_morning_reminder,
+            timed_job("morning_reminder", self._reminders.send_morning_reminder),
             CronTrigger(hour=9, minute=0),
             id="morning_reminder",
             replace_existing=True,
         )
         self._scheduler.add_job(
-            self._reminders.send_evening_reminder,
+            timed_job("evening_reminder", self._reminders.send_evening_reminder),
             CronTrigger(hour=20, minute=0),
             id="evening_reminder",
             replace_existing=True,
         )
         self._scheduler.add_job(
-            self._reminders.send_overdue_reminder,
+            timed_job("overdue_reminder", self._reminders.send_overdue_reminder),
             CronTrigger(hour=12, minute=0),
             id="overdue_reminder",
             replace_existing=True,
         )
         self._scheduler.add_job(
-            self._reminders.send_reminders_by_time,
+            timed_job("time_based_reminder", self._reminders.send_reminders_by_time),
             CronTrigger(minute="*"),
             id="time_based_reminder",
             replace_existing=True,
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
+import json
 import logging
-from typing import Protocol, runtime_checkable
+from typing import AsyncIterator, Protocol, runtime_checkable
 
 import aiohttp
 
 from config import API_BASE_URL
+from telemetry import correlation
 
 
 logger = logging.getLogger(__name__)
@@ -19,11 +21,31 @@ class AiService(Protocol):
         """Сгенерировать ответ по сообщению пользователя (контекст и данные — внутри сервиса)."""
         ...
 
+    def stream_response(self, user_id: str | int, message: str) -> AsyncIterator[str]:
+        """
+        Ответ по мере генерации: отдаёт накопленный текст после каждого куска.
+
+        Последнее значение — окончательный ответ.
+        """
+        ...
+
     async def ask(self, user_id: str | int, text: str) -> str:
         """Устаревший алиас; использовать generate_response."""
         ...
 
 
+def _headers(user_id: str | int) -> dict[str, str]:
+    """Заголовки запроса к API; X-Request-Id — id текущего апдейта, чтобы склеить логи бота и API."""
+    headers = {
+        "Content-Type": "application/json",
+        "X-User-Id": str(user_id),
+    }
+    request_id = correlation.current()
+    if request_id:
+        headers[correlation.HEADER] = request_id
+    return headers
+
+
 class ApiAiService:
     """
     Реализация AiService через API TG Hub (/api/chat).
@@ -44,14 +66,53 @@ class ApiAiService:
         """Алиас для generate_response (обратная совместимость)."""
         return await self.generate_response(user_id, text)
 
+    async def stream_response(self, user_id: str | int, message: str) -> AsyncIterator[str]:
+        """
+        Потоковый ответ через /api/chat/stream (NDJSON).
+
+        Таймаут — на паузу между кусками, а не на весь ответ: длинная генерация
+        не обрывается, пока API присылает текст.
+        """
+        url = f"{self._base_url}/api/chat/stream"
+        payload = {"message": message}
+        headers = _headers(user_id)
+
+        text = ""
+        try:
+            async with aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=None, sock_read=self._timeout),
+            ) as session:
+                async with session.post(
+                    url,
+                    json=payload,
+                    headers=headers,
+                ) as resp:
+                    if resp.status >= 400:
+                        body = await resp.text()
+                        raise RuntimeError(f"HTTP {resp.status}: {body}")
+                    async for raw_line in resp.content:
+                        line = raw_line.strip()
+                        if not line:
+                            continue
+                        event = json.loads(line)
+                        if event.get("type") == "delta":
+                            text += event.get("text") or ""
+                            yield text
+                        elif event.get("type") == "done":
+                            text = event.get("response") or ""
+                            break
+        except Exception:  # noqa: BLE001
+            logger.exception("AI stream request failed")
+            yield "❌ Не получилось обратиться к ИИ. Попробуй ещё раз чуть позже."
+            return
+
+        yield text or "😕 ИИ не прислал ответа."
+
     async def _call_api(self, user_id: str | int, message: str) -> str:
         """Отправляет запрос в /api/chat, возвращает текст ответа или сообщение об ошибке."""
         url = f"{self._base_url}/api/chat"
         payload = {"message": message}
-        headers = {
-            "Content-Type": "application/json",
-            "X-User-Id": str(user_id),
-        }
+        headers = _headers(user_id)
 
         try:
             async with aiohttp.ClientSession(